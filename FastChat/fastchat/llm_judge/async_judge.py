@@ -0,0 +1,323 @@
+"""
+Async judge client with a rate-limit-aware scheduler.
+
+Requests to an OpenAI-compatible endpoint (OpenAI, DashScope compatible mode, ...)
+are paced by two token buckets, one for requests per minute and one for tokens
+per minute, so a run goes as fast as the provider's limits allow instead of
+depending on a hand-tuned `--parallel`.
+
+Usage (see gen_judgment.py):
+python gen_judgment.py --mode single --judge-model qwen-max --async-judge --rpm 600 --tpm 1000000
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+from tqdm import tqdm
+
+from fastchat.llm_judge.common import (
+    API_ERROR_OUTPUT,
+    API_MAX_RETRY,
+    MatchPair,
+    MatchSingle,
+    make_judge_pair_conv,
+    make_judge_single_conv,
+    make_pair_result,
+    make_pair_single_result,
+    make_single_result,
+    parse_judge_pair_winner,
+    parse_judge_single_rating,
+    write_judgment,
+)
+
+# Status codes worth retrying: rate limited or a transient server error.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def estimate_tokens(messages):
+    """Rough prompt token count (about 4 characters per token, plus overhead)."""
+    return sum(len(m["content"] or "") for m in messages) // 4 + 4 * len(messages)
+
+
+class TokenBucket:
+    """A bucket refilled continuously at `per_minute` units per minute.
+
+    The level may go negative when actual usage exceeds what was reserved; the
+    debt is paid back by refilling before the next acquisition.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (capped at the capacity)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """Request-rate and token-rate limits, plus a shared cooldown after a 429.
+
+    Acquisitions are served in FIFO order: a waiter holds the lock while it
+    sleeps, so a large request is not starved by smaller ones.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.cooldown_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, num_tokens: int):
+        """Wait until one request and `num_tokens` tokens fit in the limits."""
+        async with self._lock:
+            while True:
+                wait = self.cooldown_until - time.monotonic()
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(num_tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(num_tokens)
+
+    def settle(self, reserved: int, used: int):
+        """Reconcile a reservation with the usage reported by the server."""
+        if self.tokens is not None:
+            self.tokens.consume(used - reserved)
+
+    def pause(self, seconds: float):
+        """Hold all requests for `seconds` (e.g. after a 429 with Retry-After)."""
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Return the Retry-After delay in seconds, if the header is numeric."""
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class AsyncJudgeClient:
+    """Rate-limited async client for an OpenAI-compatible chat completions API."""
+
+    def __init__(
+        self,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: int = 64,
+        max_retries: int = API_MAX_RETRY,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        timeout: float = 600.0,
+    ):
+        self.api_base = (
+            api_base or os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+        ).rstrip("/")
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.limiter = RateLimiter(rpm, tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    async def chat_completion(self, model, conv, temperature, max_tokens):
+        """Return the completion of `conv`, or API_ERROR_OUTPUT after all retries."""
+        messages = conv.to_openai_api_messages()
+        payload = {
+            "model": model,
+            "messages": messages,
+            "n": 1,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        headers = {}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        # Providers count max_tokens against the TPM limit until the
+        # request completes; the unused part is returned by settle().
+        reserved = estimate_tokens(messages) + max_tokens
+
+        for attempt in range(self.max_retries):
+            await self.limiter.acquire(reserved)
+            try:
+                async with self._semaphore:
+                    response = await self._client.post(
+                        f"{self.api_base}/chat/completions",
+                        json=payload,
+                        headers=headers,
+                    )
+            except httpx.TransportError as e:
+                self.limiter.settle(reserved, 0)
+                print(type(e), e)
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code == 200:
+                data = response.json()
+                usage = data.get("usage") or {}
+                self.limiter.settle(reserved, usage.get("total_tokens", reserved))
+                return data["choices"][0]["message"]["content"]
+
+            self.limiter.settle(reserved, 0)
+            print(f"judge API error {response.status_code}: {response.text[:200]}")
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+            delay = parse_retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            if response.status_code == 429:
+                # The limit is shared: hold every request, not only this one.
+                self.limiter.pause(delay)
+            await asyncio.sleep(delay)
+
+        return API_ERROR_OUTPUT
+
+
+async def arun_judge_single(
+    client: AsyncJudgeClient, question, answer, judge, ref_answer, multi_turn=False
+):
+    conv, user_prompt = make_judge_single_conv(
+        question, answer, judge, ref_answer, multi_turn=multi_turn
+    )
+    judgment = await client.chat_completion(
+        judge.model_name, conv, temperature=0, max_tokens=2048
+    )
+    rating = parse_judge_single_rating(judge, judgment)
+    return rating, user_prompt, judgment
+
+
+async def arun_judge_pair(
+    client: AsyncJudgeClient,
+    question,
+    answer_a,
+    answer_b,
+    judge,
+    ref_answer,
+    multi_turn=False,
+):
+    conv, user_prompt = make_judge_pair_conv(
+        question, answer_a, answer_b, judge, ref_answer, multi_turn=multi_turn
+    )
+    judgment = await client.chat_completion(
+        judge.model_name, conv, temperature=0, max_tokens=2048
+    )
+    winner = parse_judge_pair_winner(judge, judgment)
+    return winner, user_prompt, judgment
+
+
+async def aplay_a_match_single(
+    match: MatchSingle, client: AsyncJudgeClient, output_file: str
+):
+    """Async counterpart of `play_a_match_single`."""
+    judge = match.judge
+    if judge.prompt_template["type"] != "single":
+        raise ValueError(f"invalid judge type: {judge.prompt_template['type']}")
+
+    score, user_prompt, judgment = await arun_judge_single(
+        client,
+        match.question,
+        match.answer,
+        judge,
+        match.ref_answer,
+        multi_turn=match.multi_turn,
+    )
+    result = make_single_result(match, score, user_prompt, judgment)
+    write_judgment(output_file, result)
+    return result
+
+
+async def aplay_a_match_pair(
+    match: MatchPair, client: AsyncJudgeClient, output_file: str
+):
+    """Async counterpart of `play_a_match_pair`; both orders are judged concurrently."""
+    question, answer_1, answer_2, judge, ref_answer, multi_turn = (
+        match.question,
+        match.answer_1,
+        match.answer_2,
+        match.judge,
+        match.ref_answer,
+        match.multi_turn,
+    )
+
+    if judge.prompt_template["type"] == "pairwise":
+        g1, g2 = await asyncio.gather(
+            arun_judge_pair(
+                client, question, answer_1, answer_2, judge, ref_answer, multi_turn
+            ),
+            arun_judge_pair(
+                client, question, answer_2, answer_1, judge, ref_answer, multi_turn
+            ),
+        )
+        result = make_pair_result(match, *g1, *g2)
+    elif judge.prompt_template["type"] == "single":
+        m1, m2 = await asyncio.gather(
+            arun_judge_single(
+                client, question, answer_1, judge, ref_answer, multi_turn
+            ),
+            arun_judge_single(
+                client, question, answer_2, judge, ref_answer, multi_turn
+            ),
+        )
+        result = make_pair_single_result(match, *m1, *m2)
+    else:
+        raise ValueError(f"invalid judge type: {judge.prompt_template['type']}")
+
+    write_judgment(output_file, result)
+    return result
+
+
+async def play_matches_async(matches, aplay_a_match_func, output_file, **client_kwargs):
+    """Play all matches concurrently through one rate-limited client."""
+    client = AsyncJudgeClient(**client_kwargs)
+    try:
+        tasks = [
+            asyncio.create_task(aplay_a_match_func(match, client, output_file))
+            for match in matches
+        ]
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            await task
+    finally:
+        await client.aclose()
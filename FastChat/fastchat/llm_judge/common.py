@@ -17,6 +17,12 @@ import anthropic
 openai.api_key = os.getenv("OPENAI_API_KEY", openai.api_key)
 openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
 
+from fastchat.llm_judge.judgment_io import (
+    JudgmentWriter,
+    close_judgment_writers,
+    get_judgment_writer,
+    load_judgments,
+)
 from fastchat.model.model_adapter import (
     get_conversation_template,
     ANTHROPIC_MODEL_LIST,
@@ -135,7 +141,11 @@ def load_judge_prompts(prompt_file: str):
     return prompts
 
 
-def run_judge_single(question, answer, judge, ref_answer, multi_turn=False):
+def make_judge_single_conv(question, answer, judge, ref_answer, multi_turn=False):
+    """Build the judge conversation of a single answer grading.
+
+    Returns the conversation and the user prompt.
+    """
     kwargs = {}
     model = judge.model_name
     if ref_answer is not None:
@@ -158,23 +168,16 @@ def run_judge_single(question, answer, judge, ref_answer, multi_turn=False):
             **kwargs,
         )
 
-    rating = -1
-
     system_prompt = judge.prompt_template["system_prompt"]
     conv = get_conversation_template(model)
     conv.set_system_message(system_prompt)
     conv.append_message(conv.roles[0], user_prompt)
     conv.append_message(conv.roles[1], None)
+    return conv, user_prompt
 
-    if model in OPENAI_MODEL_LIST:
-        judgment = chat_completion_openai(model, conv, temperature=0, max_tokens=2048)
-    elif model in ANTHROPIC_MODEL_LIST:
-        judgment = chat_completion_anthropic(
-            model, conv, temperature=0, max_tokens=1024
-        )
-    else:
-        raise ValueError(f"Invalid judge model name: {model}")
 
+def parse_judge_single_rating(judge, judgment):
+    """Extract the rating from a single answer grading judgment (-1 if absent)."""
     if judge.prompt_template["output_format"] == "[[rating]]":
         match = re.search(one_score_pattern, judgment)
         if not match:
@@ -188,10 +191,57 @@ def run_judge_single(question, answer, judge, ref_answer, multi_turn=False):
         raise ValueError(
             f"invalid output format: {judge.prompt_template['output_format']}"
         )
+    return rating
+
+
+def run_judge_single(question, answer, judge, ref_answer, multi_turn=False):
+    model = judge.model_name
+    conv, user_prompt = make_judge_single_conv(
+        question, answer, judge, ref_answer, multi_turn=multi_turn
+    )
+
+    if model in OPENAI_MODEL_LIST:
+        judgment = chat_completion_openai(model, conv, temperature=0, max_tokens=2048)
+    elif model in ANTHROPIC_MODEL_LIST:
+        judgment = chat_completion_anthropic(
+            model, conv, temperature=0, max_tokens=1024
+        )
+    else:
+        raise ValueError(f"Invalid judge model name: {model}")
 
+    rating = parse_judge_single_rating(judge, judgment)
     return rating, user_prompt, judgment
 
 
+def make_single_result(match: MatchSingle, score, user_prompt, judgment):
+    """Build (and print) the judgment record of a single answer grading match."""
+    judge = match.judge
+    question_id = match.question["question_id"]
+    turn = 1 if not match.multi_turn else 2
+    result = {
+        "question_id": question_id,
+        "model": match.model,
+        "judge": (judge.model_name, judge.prompt_template["name"]),
+        "user_prompt": user_prompt,
+        "judgment": judgment,
+        "score": score,
+        "turn": turn,
+        "tstamp": time.time(),
+    }
+    print(
+        f"question: {question_id}, turn: {turn}, model: {match.model}, "
+        f"score: {score}, "
+        f"judge: {(judge.model_name, judge.prompt_template['name'])}"
+    )
+    return result
+
+
+def write_judgment(output_file: str, result: dict):
+    """Queue a judgment record to be appended to the output file."""
+    if output_file:
+        get_judgment_writer(output_file).write(result)
+
+
 def play_a_match_single(match: MatchSingle, output_file: str):
     question, model, answer, judge, ref_answer, multi_turn = (
         match.question,
@@ -206,36 +256,21 @@ def play_a_match_single(match: MatchSingle, output_file: str):
         score, user_prompt, judgment = run_judge_single(
             question, answer, judge, ref_answer, multi_turn=multi_turn
         )
-
-        question_id = question["question_id"]
-        turn = 1 if not multi_turn else 2
-        result = {
-            "question_id": question_id,
-            "model": model,
-            "judge": (judge.model_name, judge.prompt_template["name"]),
-            "user_prompt": user_prompt,
-            "judgment": judgment,
-            "score": score,
-            "turn": turn,
-            "tstamp": time.time(),
-        }
-        print(
-            f"question: {question_id}, turn: {turn}, model: {model}, "
-            f"score: {score}, "
-            f"judge: {(judge.model_name, judge.prompt_template['name'])}"
-        )
+        result = make_single_result(match, score, user_prompt, judgment)
     else:
-        raise ValueError(f"invalid judge type: {judge['type']}")
-
-    if output_file:
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, "a", encoding="utf-8") as fout:
-            fout.write(json.dumps(result) + "\n", ensure_ascii=False)
+        raise ValueError(f"invalid judge type: {judge.prompt_template['type']}")
 
+    write_judgment(output_file, result)
     return result
 
 
-def run_judge_pair(question, answer_a, answer_b, judge, ref_answer, multi_turn=False):
+def make_judge_pair_conv(
+    question, answer_a, answer_b, judge, ref_answer, multi_turn=False
+):
+    """Build the judge conversation of a pairwise comparison.
+
+    Returns the conversation and the user prompt.
+    """
     kwargs = {}
     model = judge.model_name
     if ref_answer is not None:
@@ -263,25 +298,21 @@ def run_judge_pair(question, answer_a, answer_b, judge, ref_answer, multi_turn=F
             **kwargs,
         )
 
-    winner = "error"
-
     conv = get_conversation_template(model)
     conv.append_message(conv.roles[0], user_prompt)
     conv.append_message(conv.roles[1], None)
 
-    if model in OPENAI_MODEL_LIST:
-        conv.set_system_message(system_prompt)
-        judgment = chat_completion_openai(model, conv, temperature=0, max_tokens=2048)
-    elif model in ANTHROPIC_MODEL_LIST:
+    if model in ANTHROPIC_MODEL_LIST:
         if system_prompt != "You are a helpful assistant.":
             user_prompt = "[Instruction]\n" + system_prompt + "\n\n" + user_prompt
             conv.messages[0][1] = user_prompt
-        judgment = chat_completion_anthropic(
-            model, conv, temperature=0, max_tokens=1024
-        )
     else:
-        raise ValueError(f"Invalid judge model name: {model}")
+        conv.set_system_message(system_prompt)
+    return conv, user_prompt
 
+
+def parse_judge_pair_winner(judge, judgment):
+    """Extract the winner ("A", "B", "tie" or "error") from a pairwise judgment."""
     if judge.prompt_template["output_format"] == "[[A]]":
         if "[[A]]" in judgment:
             winner = "A"
@@ -309,10 +340,111 @@ def run_judge_pair(question, answer_a, answer_b, judge, ref_answer, multi_turn=F
         raise ValueError(
             f"invalid output format: {judge.prompt_template['output_format']}"
         )
+    return winner
+
+
+def run_judge_pair(question, answer_a, answer_b, judge, ref_answer, multi_turn=False):
+    model = judge.model_name
+    conv, user_prompt = make_judge_pair_conv(
+        question, answer_a, answer_b, judge, ref_answer, multi_turn=multi_turn
+    )
+
+    if model in OPENAI_MODEL_LIST:
+        judgment = chat_completion_openai(model, conv, temperature=0, max_tokens=2048)
+    elif model in ANTHROPIC_MODEL_LIST:
+        judgment = chat_completion_anthropic(
+            model, conv, temperature=0, max_tokens=1024
+        )
+    else:
+        raise ValueError(f"Invalid judge model name: {model}")
 
+    winner = parse_judge_pair_winner(judge, judgment)
     return winner, user_prompt, judgment
 
 
+def make_pair_result(
+    match: MatchPair,
+    g1_winner,
+    g1_user_prompt,
+    g1_judgment,
+    g2_winner,
+    g2_user_prompt,
+    g2_judgment,
+):
+    """Build (and print) the judgment record of a pairwise match (both orders)."""
+    judge = match.judge
+    g1_map = {"A": "model_1", "B": "model_2"}
+    g2_map = {"A": "model_2", "B": "model_1"}
+    g1_winner = g1_map.get(g1_winner, g1_winner)
+    g2_winner = g2_map.get(g2_winner, g2_winner)
+    question_id = match.question["question_id"]
+    turn = 1 if not match.multi_turn else 2
+
+    result = {
+        "question_id": question_id,
+        "model_1": match.model_1,
+        "model_2": match.model_2,
+        "g1_winner": g1_winner,
+        "g2_winner": g2_winner,
+        "judge": (judge.model_name, judge.prompt_template["name"]),
+        "g1_user_prompt": g1_user_prompt,
+        "g1_judgment": g1_judgment,
+        "g2_user_prompt": g2_user_prompt,
+        "g2_judgment": g2_judgment,
+        "turn": turn,
+        "tstamp": time.time(),
+    }
+
+    print(
+        f"question: {question_id}, turn: {turn}, model_1: {match.model_1}, model_2: {match.model_2}, "
+        f"g1_winner: {g1_winner}, g2_winner: {g2_winner}, "
+        f"judge: {(judge.model_name, judge.prompt_template['name'])}"
+    )
+    return result
+
+
+def make_pair_single_result(
+    match: MatchPair,
+    m1_score,
+    m1_user_prompt,
+    m1_judgment,
+    m2_score,
+    m2_user_prompt,
+    m2_judgment,
+):
+    """Build (and print) the record of a pairwise match decided by single grading."""
+    judge = match.judge
+    if abs(m1_score - m2_score) <= TIE_DELTA:
+        winner = "tie"
+    elif m1_score > m2_score:
+        winner = "model_1"
+    else:
+        winner = "model_2"
+
+    question_id = match.question["question_id"]
+    result = {
+        "question_id": question_id,
+        "model_1": match.model_1,
+        "model_2": match.model_2,
+        "g1_winner": winner,
+        "g2_winner": winner,
+        "judge": (judge.model_name, judge.prompt_template["name"]),
+        "g1_user_prompt": m1_user_prompt,
+        "g1_judgment": m1_judgment,
+        "g2_user_prompt": m2_user_prompt,
+        "g2_judgment": m2_judgment,
+        "m1_score": m1_score,
+        "m2_score": m2_score,
+        "tstamp": time.time(),
+    }
+    print(
+        f"question: {question_id}, model_1: {match.model_1}, model_2: {match.model_2}, "
+        f"winner: {winner}, m1_score: {m1_score}, m2_score: {m2_score}, "
+        f"judge: {(judge.model_name, judge.prompt_template['name'])}"
+    )
+    return result
+
+
 def play_a_match_pair(match: MatchPair, output_file: str):
     question, model_1, model_2, answer_1, answer_2, judge, ref_answer, multi_turn = (
         match.question,
@@ -332,78 +464,35 @@ def play_a_match_pair(match: MatchPair, output_file: str):
         g2_winner, g2_user_prompt, g2_judgment = run_judge_pair(
             question, answer_2, answer_1, judge, ref_answer, multi_turn=multi_turn
         )
-
-        g1_map = {"A": "model_1", "B": "model_2"}
-        g2_map = {"A": "model_2", "B": "model_1"}
-        g1_winner = g1_map.get(g1_winner, g1_winner)
-        g2_winner = g2_map.get(g2_winner, g2_winner)
-        question_id = question["question_id"]
-        turn = 1 if not multi_turn else 2
-
-        result = {
-            "question_id": question_id,
-            "model_1": model_1,
-            "model_2": model_2,
-            "g1_winner": g1_winner,
-            "g2_winner": g2_winner,
-            "judge": (judge.model_name, judge.prompt_template["name"]),
-            "g1_user_prompt": g1_user_prompt,
-            "g1_judgment": g1_judgment,
-            "g2_user_prompt": g2_user_prompt,
-            "g2_judgment": g2_judgment,
-            "turn": turn,
-            "tstamp": time.time(),
-        }
-
-        print(
-            f"question: {question_id}, turn: {turn}, model_1: {model_1}, model_2: {model_2}, "
-            f"g1_winner: {g1_winner}, g2_winner: {g2_winner}, "
-            f"judge: {(judge.model_name, judge.prompt_template['name'])}"
+        result = make_pair_result(
+            match,
+            g1_winner,
+            g1_user_prompt,
+            g1_judgment,
+            g2_winner,
+            g2_user_prompt,
+            g2_judgment,
         )
     elif judge.prompt_template["type"] == "single":
         m1_score, m1_user_prompt, m1_judgment = run_judge_single(
-            question, answer_1, judge
+            question, answer_1, judge, ref_answer, multi_turn=multi_turn
         )
         m2_score, m2_user_prompt, m2_judgment = run_judge_single(
-            question, answer_2, judge
+            question, answer_2, judge, ref_answer, multi_turn=multi_turn
         )
-
-        if abs(m1_score - m2_score) <= TIE_DELTA:
-            winner = "tie"
-        elif m1_score > m2_score:
-            winner = "model_1"
-        else:
-            winner = "model_2"
-
-        question_id = question["question_id"]
-        result = {
-            "question_id": question_id,
-            "model_1": model_1,
-            "model_2": model_2,
-            "g1_winner": winner,
-            "g2_winner": winner,
-            "judge": (judge.model_name, judge.prompt_template["name"]),
-            "g1_user_prompt": m1_user_prompt,
-            "g1_judgment": m1_judgment,
-            "g2_user_prompt": m2_user_prompt,
-            "g2_judgment": m2_judgment,
-            "m1_score": m1_score,
-            "m2_score": m2_score,
-            "tstamp": time.time(),
-        }
-        print(
-            f"question: {question_id}, model_1: {model_1}, model_2: {model_2}, "
-            f"winner: {winner}, m1_score: {m1_score}, m2_score: {m2_score}, "
-            f"judge: {(judge.model_name, judge.prompt_template['name'])}"
+        result = make_pair_single_result(
+            match,
+            m1_score,
+            m1_user_prompt,
+            m1_judgment,
+            m2_score,
+            m2_user_prompt,
+            m2_judgment,
         )
     else:
-        raise ValueError(f"invalid judge type: {judge['type']}")
-
-    if output_file:
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, "a", encoding="utf-8") as fout:
-            fout.write(json.dumps(result) + "\n", ensure_ascii=False)
+        raise ValueError(f"invalid judge type: {judge.prompt_template['type']}")
 
+    write_judgment(output_file, result)
     return result
 
 
@@ -554,8 +643,7 @@ def load_pairwise_model_judgments(filename: str):
     """
     judge_dict = {}
 
-    for line in open(filename):
-        obj = json.loads(line)
+    for obj in load_judgments(filename):
         judge = tuple(obj["judge"])
         qid, model_1, model_2 = obj["question_id"], obj["model_1"], obj["model_2"]
 
@@ -597,8 +685,7 @@ def load_single_model_judgments(filename: str):
     """
     judge_dict = {}
 
-    for line in open(filename):
-        obj = json.loads(line)
+    for obj in load_judgments(filename):
         judge = tuple(obj["judge"])
         qid, model = obj["question_id"], obj["model"]
 
@@ -614,6 +701,51 @@ def load_single_model_judgments(filename: str):
     return judge_dict
 
 
+def get_match_key(match):
+    """Return the key identifying a match in the judgment file.
+
+    Single: (question_id, model, judge model, judge prompt, turn).
+    Pair: (question_id, sorted model pair, judge model, judge prompt, turn).
+    Both orders of a pair are judged in one match, so the models are sorted.
+    """
+    judge = (match.judge.model_name, match.judge.prompt_template["name"])
+    turn = 2 if match.multi_turn else 1
+    if isinstance(match, MatchPair):
+        models = tuple(sorted((match.model_1, match.model_2)))
+        return (match.question["question_id"], models) + judge + (turn,)
+    return (match.question["question_id"], match.model) + judge + (turn,)
+
+
+def get_judgment_key(obj):
+    """Return the match key of a judgment record (see `get_match_key`)."""
+    judge = tuple(obj["judge"])
+    turn = obj.get("turn", 1)
+    if "model" in obj:
+        return (obj["question_id"], obj["model"]) + judge + (turn,)
+    models = tuple(sorted((obj["model_1"], obj["model_2"])))
+    return (obj["question_id"], models) + judge + (turn,)
+
+
+def load_judged_match_keys(filename: str):
+    """Load the keys of the matches that already have a judgment.
+
+    Judgments whose API call failed (API_ERROR_OUTPUT) do not count, so they
+    are played again; the newer line then takes precedence when loading.
+    """
+    judged = set()
+    if not os.path.exists(filename):
+        return judged
+
+    for obj in load_judgments(filename):
+        judgments = [obj.get(k) for k in ("judgment", "g1_judgment", "g2_judgment")]
+        key = get_judgment_key(obj)
+        if API_ERROR_OUTPUT in judgments:
+            judged.discard(key)
+        else:
+            judged.add(key)
+    return judged
+
+
 def resolve_pairwise_judgment_dict(
     question, model_judgments_normal, model_judgments_math, multi_turn=False
 ):
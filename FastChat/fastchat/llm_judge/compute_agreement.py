@@ -4,6 +4,9 @@ Compute agreement among judges.
 Usage:
 python compute_agreement.py --judges gpt4-pair human --votefiles human_judgments.json gpt4_pair_judgments.json
 python compute_agreement.py --judges human human --votefiles human_judgments.json
+
+Judgment files of gen_judgment.py (.jsonl or .jsonl.gz) can be used as vote files, also while they are being written:
+python compute_agreement.py --judges qwen-max-pair human --votefiles human_judgments.json data/mt_bench/model_judgment/qwen-max_pair.jsonl
 """
 import argparse
 import json
@@ -11,10 +14,14 @@ import os
 
 import numpy as np
 
+from fastchat.llm_judge.judgment_io import load_judgments
+
 
 def get_judge_name(judge):
-    if isinstance(judge, list) and judge[0] == "gpt-4" and judge[1].startswith("pair"):
-        return "gpt4-pair"
+    if isinstance(judge, list) and judge[1].startswith("pair"):
+        if judge[0] == "gpt-4":
+            return "gpt4-pair"
+        return f"{judge[0]}-pair"
     if judge.startswith("expert"):
         return "human"
     if judge.startswith("author"):
@@ -29,6 +36,38 @@ def revert(vote):
     return vote
 
 
+def judgment_to_vote(obj):
+    """Convert a pairwise judgment record of gen_judgment.py to a vote.
+
+    The two orders of a pair are one vote; inconsistent verdicts count as a tie.
+    """
+    g1_winner, g2_winner = obj["g1_winner"], obj["g2_winner"]
+    if g1_winner == g2_winner and g1_winner in ("model_1", "model_2"):
+        winner = "model_a" if g1_winner == "model_1" else "model_b"
+    else:
+        winner = "tie"
+    return {
+        "question_id": obj["question_id"],
+        "model_a": obj["model_1"],
+        "model_b": obj["model_2"],
+        "winner": winner,
+        "judge": obj["judge"],
+        "turn": obj["turn"],
+    }
+
+
+def load_votes(filename):
+    if filename.endswith((".jsonl", ".jsonl.gz")):
+        return [
+            judgment_to_vote(obj)
+            for obj in load_judgments(filename)
+            if "g1_winner" in obj
+            and "error" not in (obj["g1_winner"], obj["g2_winner"])
+        ]
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
 def get_mt_bench_votes_data(raw_votes):
     data = [{}, {}]
 
@@ -65,7 +104,7 @@ def equalvote(vote1, vote2):
 
 # data: Dict[qid -> List[vote]]
 def get_mt_bench_agreement(data, judge1, judge2, ban):
-    if judge1.startswith("gpt4") and judge2 == "human":
+    if judge1.endswith("-pair") and judge2 == "human":
         stats = [0, 0]
         for votes in data.values():
             if judge1 not in votes or judge2 not in votes:
@@ -102,9 +141,7 @@ def run_mt_bench_agreement(judges, votefiles):
     # votes[i]: List of votes
     votes = []
     for filename in votefiles:
-        with open(filename, "r") as f:
-            data = json.load(f)
-        votes.append(data)
+        votes.append(load_votes(filename))
 
     data = get_mt_bench_votes_data(votes)
 
@@ -1,8 +1,15 @@
 """
 Usage:
 python gen_judgment.py --model-list [LIST-OF-MODEL-ID] --parallel [num-concurrent-api-call] --mode [single|pairwise-baseline|pairwise-all]
+
+Incremental judging (only play the matches missing from the output file, e.g. after a new model answer file lands):
+python gen_judgment.py --mode single --judge-model gpt-4 --incremental --yes
+
+Async judging, paced by the judge API's rate limits instead of a fixed --parallel (OpenAI-compatible judges only):
+python gen_judgment.py --mode single --judge-model qwen-max --async-judge --rpm 600 --tpm 1000000
 """
 import argparse
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import json
 
@@ -17,11 +24,20 @@ from fastchat.llm_judge.common import (
     play_a_match_pair,
     play_a_match_single,
     get_model_list,
+    get_match_key,
+    load_judged_match_keys,
+    close_judgment_writers,
     Judge,
     MatchPair,
     MatchSingle,
     NEED_REF_CATS,
 )
+from fastchat.model.model_adapter import ANTHROPIC_MODEL_LIST
+from fastchat.llm_judge.async_judge import (
+    aplay_a_match_pair,
+    aplay_a_match_single,
+    play_matches_async,
+)
 
 
 def make_match(
@@ -207,7 +223,59 @@ if __name__ == "__main__":
     parser.add_argument(
         "--first-n", type=int, help="A debug option. Only run the first `n` judgments."
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Load the existing judgments and only play the missing (question, model, judge, turn) matches. "
+        "Judgments that failed with an API error are played again.",
+    )
+    parser.add_argument(
+        "--yes",
+        "-y",
+        action="store_true",
+        help="Do not prompt for confirmation before playing the matches.",
+    )
+    parser.add_argument(
+        "--async-judge",
+        action="store_true",
+        help="Play the matches with the async judge client, paced by --rpm and --tpm. "
+        "The judge must be served by an OpenAI-compatible API.",
+    )
+    parser.add_argument(
+        "--rpm", type=float, default=None, help="Judge API requests per minute."
+    )
+    parser.add_argument(
+        "--tpm", type=float, default=None, help="Judge API tokens per minute."
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=64,
+        help="The maximum number of in-flight requests of the async judge client.",
+    )
+    parser.add_argument(
+        "--api-base",
+        type=str,
+        default=None,
+        help="The judge API base URL. Defaults to $OPENAI_API_BASE.",
+    )
+    parser.add_argument(
+        "--api-key",
+        type=str,
+        default=None,
+        help="The judge API key. Defaults to $OPENAI_API_KEY.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Write the judgments gzip-compressed (to a .jsonl.gz file).",
+    )
     args = parser.parse_args()
+    if args.async_judge and args.judge_model in ANTHROPIC_MODEL_LIST:
+        parser.error(
+            "--async-judge needs a judge served by an OpenAI-compatible API, "
+            f"but {args.judge_model} is an Anthropic model."
+        )
 
     question_file = f"data/{args.bench_name}/question.jsonl"
     answer_dir = f"data/{args.bench_name}/model_answer"
@@ -234,6 +302,7 @@ if __name__ == "__main__":
     if args.mode == "single":
         judges = make_judge_single(args.judge_model, judge_prompts)
         play_a_match_func = play_a_match_single
+        aplay_a_match_func = aplay_a_match_single
         output_file = (
             f"data/{args.bench_name}/model_judgment/{args.judge_model}_single.jsonl"
         )
@@ -242,6 +311,7 @@ if __name__ == "__main__":
     else:
         judges = make_judge_pairwise(args.judge_model, judge_prompts)
         play_a_match_func = play_a_match_pair
+        aplay_a_match_func = aplay_a_match_pair
         output_file = (
             f"data/{args.bench_name}/model_judgment/{args.judge_model}_pair.jsonl"
         )
@@ -288,6 +358,14 @@ if __name__ == "__main__":
         multi_turn=True,
     )
 
+    if args.compress:
+        output_file += ".gz"
+
+    total_num_matches = len(matches)
+    if args.incremental:
+        judged = load_judged_match_keys(output_file)
+        matches = [m for m in matches if get_match_key(m) not in judged]
+
     match_stat = {}
     match_stat["bench_name"] = args.bench_name
     match_stat["mode"] = args.mode
@@ -295,16 +373,33 @@ if __name__ == "__main__":
     match_stat["baseline"] = baseline_model
     match_stat["model_list"] = models
     match_stat["total_num_questions"] = len(questions)
-    match_stat["total_num_matches"] = len(matches)
+    match_stat["total_num_matches"] = total_num_matches
+    if args.incremental:
+        match_stat["num_judged_matches"] = total_num_matches - len(matches)
+        match_stat["num_matches_to_play"] = len(matches)
     match_stat["output_path"] = output_file
 
     # Show match stats and prompt enter to continue
     print("Stats:")
     print(json.dumps(match_stat, indent=4))
-    input("Press Enter to confirm...")
+    if not args.yes:
+        input("Press Enter to confirm...")
 
     # Play matches
-    if args.parallel == 1:
+    if args.async_judge:
+        asyncio.run(
+            play_matches_async(
+                matches,
+                aplay_a_match_func,
+                output_file,
+                api_base=args.api_base,
+                api_key=args.api_key,
+                rpm=args.rpm,
+                tpm=args.tpm,
+                max_concurrency=args.max_concurrency,
+            )
+        )
+    elif args.parallel == 1:
         for match in tqdm(matches):
             play_a_match_func(match, output_file=output_file)
     else:
@@ -320,3 +415,5 @@ if __name__ == "__main__":
                 executor.map(play_a_match_wrapper, matches), total=len(matches)
             ):
                 pass
+
+    close_judgment_writers()
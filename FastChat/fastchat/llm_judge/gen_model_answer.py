@@ -32,6 +32,7 @@ def run_eval(
     max_gpu_memory,
     dtype,
     revision,
+    batch_size=1,
 ):
     questions = load_questions(question_file, question_begin, question_end)
     # random shuffle the questions to balance the loading
@@ -63,6 +64,7 @@ def run_eval(
                 max_gpu_memory,
                 dtype=dtype,
                 revision=revision,
+                batch_size=batch_size,
             )
         )
 
@@ -82,6 +84,7 @@ def get_model_answers(
     max_gpu_memory,
     dtype,
     revision,
+    batch_size=1,
 ):
     model, tokenizer = load_model(
         model_path,
@@ -95,11 +98,21 @@ def get_model_answers(
         debug=False,
     )
 
+    if batch_size > 1 and not model.config.is_encoder_decoder:
+        get_model_answers_batched(
+            model,
+            tokenizer,
+            model_id,
+            questions,
+            answer_file,
+            max_new_token,
+            num_choices,
+            batch_size,
+        )
+        return
+
     for question in tqdm(questions):
-        if question["category"] in temperature_config:
-            temperature = temperature_config[question["category"]]
-        else:
-            temperature = 0.7
+        temperature = get_question_temperature(question)
 
         choices = []
         for i in range(num_choices):
@@ -132,44 +145,7 @@ def get_model_answers(
                         output_ids = output_ids[0]
                     else:
                         output_ids = output_ids[0][len(input_ids[0]) :]
-
-                    # be consistent with the template's stop_token_ids
-                    if conv.stop_token_ids:
-                        stop_token_ids_index = [
-                            i
-                            for i, id in enumerate(output_ids)
-                            if id in conv.stop_token_ids
-                        ]
-                        if len(stop_token_ids_index) > 0:
-                            output_ids = output_ids[: stop_token_ids_index[0]]
-
-                    output = tokenizer.decode(
-                        output_ids,
-                        spaces_between_special_tokens=False,
-                    )
-                    if conv.stop_str and isinstance(conv.stop_str, list):
-                        stop_str_indices = sorted(
-                            [
-                                output.find(stop_str)
-                                for stop_str in conv.stop_str
-                                if output.find(stop_str) > 0
-                            ]
-                        )
-                        if len(stop_str_indices) > 0:
-                            output = output[: stop_str_indices[0]]
-                    elif conv.stop_str and output.find(conv.stop_str) > 0:
-                        output = output[: output.find(conv.stop_str)]
-
-                    for special_token in tokenizer.special_tokens_map.values():
-                        if isinstance(special_token, list):
-                            for special_tok in special_token:
-                                output = output.replace(special_tok, "")
-                        else:
-                            output = output.replace(special_token, "")
-                    output = output.strip()
-
-                    if conv.name == "xgen" and output.startswith("Assistant:"):
-                        output = output.replace("Assistant:", "", 1).strip()
+                    output = postprocess_output(output_ids, conv, tokenizer)
                 except RuntimeError as e:
                     print("ERROR question ID: ", question["question_id"])
                     output = "ERROR"
@@ -179,17 +155,353 @@ def get_model_answers(
 
             choices.append({"index": i, "turns": turns})
 
-        # Dump answers
-        os.makedirs(os.path.dirname(answer_file), exist_ok=True)
-        with open(os.path.expanduser(answer_file), "a", encoding="utf-8", newline="\n") as fout:
-            ans_json = {
-                "question_id": question["question_id"],
-                "answer_id": shortuuid.uuid(),
-                "model_id": model_id,
-                "choices": choices,
-                "tstamp": time.time(),
-            }
-            fout.write(json.dumps(ans_json, ensure_ascii=False) + "\n")
+        dump_answer(answer_file, question, model_id, choices)
+
+
+def postprocess_output(output_ids, conv, tokenizer):
+    """Decode the generated ids of one turn and strip stop tokens and strings."""
+    # be consistent with the template's stop_token_ids
+    if conv.stop_token_ids:
+        stop_token_ids_index = [
+            i for i, id in enumerate(output_ids) if id in conv.stop_token_ids
+        ]
+        if len(stop_token_ids_index) > 0:
+            output_ids = output_ids[: stop_token_ids_index[0]]
+
+    output = tokenizer.decode(
+        output_ids,
+        spaces_between_special_tokens=False,
+    )
+    if conv.stop_str and isinstance(conv.stop_str, list):
+        stop_str_indices = sorted(
+            [
+                output.find(stop_str)
+                for stop_str in conv.stop_str
+                if output.find(stop_str) > 0
+            ]
+        )
+        if len(stop_str_indices) > 0:
+            output = output[: stop_str_indices[0]]
+    elif conv.stop_str and output.find(conv.stop_str) > 0:
+        output = output[: output.find(conv.stop_str)]
+
+    for special_token in tokenizer.special_tokens_map.values():
+        if isinstance(special_token, list):
+            for special_tok in special_token:
+                output = output.replace(special_tok, "")
+        else:
+            output = output.replace(special_token, "")
+    output = output.strip()
+
+    if conv.name == "xgen" and output.startswith("Assistant:"):
+        output = output.replace("Assistant:", "", 1).strip()
+    return output
+
+
+def dump_answer(answer_file, question, model_id, choices):
+    os.makedirs(os.path.dirname(answer_file), exist_ok=True)
+    with open(
+        os.path.expanduser(answer_file), "a", encoding="utf-8", newline="\n"
+    ) as fout:
+        ans_json = {
+            "question_id": question["question_id"],
+            "answer_id": shortuuid.uuid(),
+            "model_id": model_id,
+            "choices": choices,
+            "tstamp": time.time(),
+        }
+        fout.write(json.dumps(ans_json, ensure_ascii=False) + "\n")
+
+
+def get_question_temperature(question):
+    return temperature_config.get(question["category"], 0.7)
+
+
+def make_batches(questions, tokenizer, model_id, batch_size):
+    """Group questions with the same number of turns and similar first-turn length."""
+
+    def sort_key(question):
+        conv = get_conversation_template(model_id)
+        conv.append_message(conv.roles[0], question["turns"][0])
+        conv.append_message(conv.roles[1], None)
+        return len(question["turns"]), len(tokenizer(conv.get_prompt()).input_ids)
+
+    questions = sorted(questions, key=sort_key)
+    batches = []
+    for question in questions:
+        if (
+            batches
+            and len(batches[-1]) < batch_size
+            and len(batches[-1][0]["turns"]) == len(question["turns"])
+        ):
+            batches[-1].append(question)
+        else:
+            batches.append([question])
+    return batches
+
+
+def repeat_past_key_values(past_key_values, repeats):
+    """Repeat each row of the KV cache `repeats` times (one row per choice)."""
+    if hasattr(past_key_values, "batch_repeat_interleave"):
+        past_key_values.batch_repeat_interleave(repeats)
+        return past_key_values
+    return tuple(
+        tuple(t.repeat_interleave(repeats, dim=0) for t in layer)
+        for layer in past_key_values
+    )
+
+
+def common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+class BatchedConversations:
+    """The KV cache of a batch of conversations, one row per (question, choice).
+
+    Rows are left-padded to a common length. When a new turn is appended,
+    each row keeps the cached positions that are a prefix of its new prompt
+    and masks out the rest, so turn 2 only encodes the tokens that follow
+    the reusable part of turn 1 (its answer, after post-processing, and the
+    next user message). Position ids are passed explicitly, so masked
+    positions do not shift the positions of the following tokens.
+    """
+
+    def __init__(self, model, pad_token_id):
+        self.model = model
+        self.pad_token_id = pad_token_id
+        self.past_key_values = None
+        self.attention_mask = None  # (rows, cache length)
+        self.token_ids = []  # the unmasked tokens of each row, in order
+        self.columns = []  # the cache column of each of these tokens
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def forward(self, new_token_ids):
+        """Append `new_token_ids[r]` to row r; return the logits of the last tokens."""
+        num_rows = len(new_token_ids)
+        width = max(len(ids) for ids in new_token_ids)
+        input_ids = torch.full((num_rows, width), self.pad_token_id, dtype=torch.long)
+        block_mask = torch.zeros((num_rows, width), dtype=torch.long)
+        position_ids = torch.zeros((num_rows, width), dtype=torch.long)
+        offset = 0 if self.attention_mask is None else self.attention_mask.shape[1]
+        for r, ids in enumerate(new_token_ids):
+            start = width - len(ids)
+            if ids:
+                input_ids[r, start:] = torch.as_tensor(ids)
+                block_mask[r, start:] = 1
+            num_cached = len(self.token_ids[r])
+            position_ids[r, start:] = torch.arange(num_cached, num_cached + len(ids))
+            self.token_ids[r].extend(ids)
+            self.columns[r].extend(range(offset + start, offset + width))
+
+        input_ids = input_ids.to(self.device)
+        block_mask = block_mask.to(self.device)
+        if self.attention_mask is None:
+            self.attention_mask = block_mask
+        else:
+            self.attention_mask = torch.cat([self.attention_mask, block_mask], dim=1)
+
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=self.attention_mask,
+            position_ids=position_ids.to(self.device),
+            past_key_values=self.past_key_values,
+            use_cache=True,
+        )
+        self.past_key_values = out.past_key_values
+        return out.logits[:, -1, :].float()
+
+    def prefill(self, prompt_ids, repeats):
+        """Encode one prompt per question, then repeat every row `repeats` times."""
+        self.token_ids = [[] for _ in prompt_ids]
+        self.columns = [[] for _ in prompt_ids]
+        logits = self.forward(prompt_ids)
+
+        self.past_key_values = repeat_past_key_values(self.past_key_values, repeats)
+        self.attention_mask = self.attention_mask.repeat_interleave(repeats, dim=0)
+        self.token_ids = [list(ids) for ids in self.token_ids for _ in range(repeats)]
+        self.columns = [list(cols) for cols in self.columns for _ in range(repeats)]
+        return logits.repeat_interleave(repeats, dim=0)
+
+    def extend(self, prompt_ids):
+        """Continue each row with its full prompt, reusing the cached prefix."""
+        new_token_ids = []
+        for r, ids in enumerate(prompt_ids):
+            # At least one token is encoded to get the logits of the next one.
+            keep = min(common_prefix_length(self.token_ids[r], ids), len(ids) - 1)
+            stale = self.columns[r][keep:]
+            if stale:
+                self.attention_mask[r, stale] = 0
+            del self.token_ids[r][keep:]
+            del self.columns[r][keep:]
+            new_token_ids.append(ids[keep:])
+        return self.forward(new_token_ids)
+
+    def get_input_ids(self):
+        """The unmasked tokens of each row, as the `input_ids` of logits processors.
+
+        Rows are left-padded by repeating their first token rather than with
+        the padding token, so processors that only depend on the set of
+        previous tokens (e.g. the repetition penalty) see exactly the tokens
+        of the row, as `model.generate` would.
+        """
+        width = max(len(ids) for ids in self.token_ids)
+        input_ids = [[ids[0]] * (width - len(ids)) + ids for ids in self.token_ids]
+        return torch.as_tensor(input_ids, device=self.device)
+
+
+def sample_next_tokens(
+    logits, input_ids, temperatures, logits_warpers, repetition_penalty
+):
+    """Pick the next token of each row; greedy for rows with temperature 0."""
+    if repetition_penalty is not None:
+        logits = repetition_penalty(input_ids, logits)
+    greedy = temperatures < 1e-4
+    next_tokens = logits.argmax(dim=-1)
+    if not greedy.all():
+        scores = logits / temperatures.clamp(min=1e-4).unsqueeze(1)
+        for warper in logits_warpers:
+            scores = warper(input_ids, scores)
+        sampled = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+        next_tokens = torch.where(greedy, next_tokens, sampled.squeeze(1))
+    return next_tokens
+
+
+def get_batch_answers(
+    model, tokenizer, model_id, questions, max_new_token, num_choices
+):
+    """Generate `num_choices` answers to every turn of a batch of questions."""
+    from transformers import (
+        RepetitionPenaltyLogitsProcessor,
+        TopKLogitsWarper,
+        TopPLogitsWarper,
+    )
+
+    gen_config = model.generation_config
+    repetition_penalty = None
+    if gen_config.repetition_penalty and gen_config.repetition_penalty != 1.0:
+        repetition_penalty = RepetitionPenaltyLogitsProcessor(
+            gen_config.repetition_penalty
+        )
+    logits_warpers = []
+    if gen_config.top_k:
+        logits_warpers.append(TopKLogitsWarper(gen_config.top_k))
+    if gen_config.top_p is not None and gen_config.top_p < 1.0:
+        logits_warpers.append(TopPLogitsWarper(gen_config.top_p))
+
+    convs = [
+        get_conversation_template(model_id)
+        for _ in questions
+        for _ in range(num_choices)
+    ]
+    row_questions = [q for q in questions for _ in range(num_choices)]
+    temperatures = torch.tensor(
+        [get_question_temperature(q) for q in row_questions], device=model.device
+    )
+
+    eos_token_id = gen_config.eos_token_id
+    if eos_token_id is None:
+        eos_token_id = tokenizer.eos_token_id
+    stop_token_ids = set(
+        eos_token_id if isinstance(eos_token_id, list) else [eos_token_id]
+    )
+    stop_token_ids.update(convs[0].stop_token_ids or [])
+    stop_token_ids.discard(None)
+    pad_token_id = tokenizer.pad_token_id
+    if pad_token_id is None:
+        pad_token_id = next(iter(stop_token_ids), 0)
+
+    batch = BatchedConversations(model, pad_token_id)
+    turns = [[] for _ in convs]
+    for j in range(len(questions[0]["turns"])):
+        for conv, question in zip(convs, row_questions):
+            conv.append_message(conv.roles[0], question["turns"][j])
+            conv.append_message(conv.roles[1], None)
+        prompt_ids = [tokenizer([conv.get_prompt()]).input_ids[0] for conv in convs]
+
+        if j == 0:
+            # One prefill per question; the choices are sampled from copies of it.
+            logits = batch.prefill(prompt_ids[::num_choices], num_choices)
+        else:
+            logits = batch.extend(prompt_ids)
+
+        output_ids = [[] for _ in convs]
+        finished = torch.zeros(len(convs), dtype=torch.bool, device=model.device)
+        for step in range(max_new_token):
+            # Only the repetition penalty looks at the previous tokens.
+            input_ids = batch.get_input_ids() if repetition_penalty else None
+            next_tokens = sample_next_tokens(
+                logits, input_ids, temperatures, logits_warpers, repetition_penalty
+            )
+            next_tokens = next_tokens.tolist()
+            new_token_ids = []
+            for r, token in enumerate(next_tokens):
+                if finished[r]:
+                    new_token_ids.append([])
+                    continue
+                output_ids[r].append(token)
+                new_token_ids.append([token])
+                if token in stop_token_ids:
+                    finished[r] = True
+            if finished.all() or step == max_new_token - 1:
+                break
+            logits = batch.forward(new_token_ids)
+
+        for r, conv in enumerate(convs):
+            output = postprocess_output(output_ids[r], conv, tokenizer)
+            conv.update_last_message(output)
+            turns[r].append(output)
+
+    return [
+        [{"index": i, "turns": turns[q * num_choices + i]} for i in range(num_choices)]
+        for q in range(len(questions))
+    ]
+
+
+def get_model_answers_batched(
+    model,
+    tokenizer,
+    model_id,
+    questions,
+    answer_file,
+    max_new_token,
+    num_choices,
+    batch_size,
+):
+    """Batched version of the loop in `get_model_answers` (decoder-only models)."""
+    batches = make_batches(questions, tokenizer, model_id, batch_size)
+    with tqdm(total=len(questions)) as pbar:
+        while batches:
+            batch = batches.pop(0)
+            torch.manual_seed(0)
+            try:
+                all_choices = get_batch_answers(
+                    model, tokenizer, model_id, batch, max_new_token, num_choices
+                )
+            except RuntimeError as e:
+                # e.g. out of memory: retry the two halves of the batch
+                torch.cuda.empty_cache()
+                if len(batch) > 1:
+                    half = len(batch) // 2
+                    batches[:0] = [batch[:half], batch[half:]]
+                    continue
+                print("ERROR question ID: ", batch[0]["question_id"])
+                all_choices = [
+                    [
+                        {"index": i, "turns": ["ERROR"] * len(batch[0]["turns"])}
+                        for i in range(num_choices)
+                    ]
+                ]
+
+            for question, choices in zip(batch, all_choices):
+                dump_answer(answer_file, question, model_id, choices)
+            pbar.update(len(batch))
 
 
 def reorg_answer_file(answer_file):
@@ -274,6 +586,14 @@ if __name__ == "__main__":
         default="main",
         help="The model revision to load.",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="The number of questions generated together. With a batch size above 1, "
+        "questions are grouped by prompt length, the KV cache of turn 1 is reused for turn 2 "
+        "and the choices are sampled from one prefill (decoder-only models).",
+    )
 
     args = parser.parse_args()
 
@@ -304,6 +624,7 @@ if __name__ == "__main__":
         max_gpu_memory=args.max_gpu_memory,
         dtype=str_to_torch_dtype(args.dtype),
         revision=args.revision,
+        batch_size=args.batch_size,
     )
 
-    reorg_answer_file(answer_file)
\ No newline at end of file
+    reorg_answer_file(answer_file)
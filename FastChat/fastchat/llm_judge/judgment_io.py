@@ -0,0 +1,157 @@
+"""
+Reading and writing judgment files (.jsonl, or .jsonl.gz written as one gzip
+member per batch).
+
+This module only uses the standard library, so scripts that read judgments
+(e.g. show_result.py) do not need the judge API clients.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+
+
+class JudgmentWriter:
+    """Append judgment records to a file from one background thread.
+
+    `write` only puts the record on a queue, so it is safe to call from any
+    number of threads (or from an event loop). The writer thread drains the
+    queue and appends each batch of complete lines with a single write, so a
+    reader tailing the file never sees interleaved lines. The file is fsynced
+    at most every `fsync_interval` seconds, and on `close`.
+
+    If the file name ends with ".gz", each batch is written as a separate gzip
+    member; the concatenation is a valid gzip file that can be read while
+    the run is going.
+    """
+
+    _CLOSE = object()
+
+    def __init__(
+        self, output_file: str, max_batch_size: int = 256, fsync_interval: float = 1.0
+    ):
+        self.output_file = output_file
+        self.max_batch_size = max_batch_size
+        self.fsync_interval = fsync_interval
+        self.compress = output_file.endswith(".gz")
+        self._queue = queue.Queue()
+        self._error = None
+
+        dirname = os.path.dirname(output_file)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._fout = open(output_file, "ab")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, result: dict):
+        if self._error is not None:
+            raise RuntimeError(f"judgment writer failed: {self._error}")
+        self._queue.put(result)
+
+    def close(self):
+        """Write the queued records, fsync and close the file."""
+        if self._thread.is_alive():
+            self._queue.put(self._CLOSE)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"judgment writer failed: {self._error}")
+
+    def _write_batch(self, batch):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+        data = data.encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data)
+        self._fout.write(data)
+        self._fout.flush()
+
+    def _run(self):
+        last_fsync = time.monotonic()
+        closing = False
+        try:
+            while not closing:
+                batch = [self._queue.get()]
+                while len(batch) < self.max_batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if self._CLOSE in batch:
+                    closing = True
+                    batch = [r for r in batch if r is not self._CLOSE]
+                if batch:
+                    self._write_batch(batch)
+                if closing or time.monotonic() - last_fsync >= self.fsync_interval:
+                    os.fsync(self._fout.fileno())
+                    last_fsync = time.monotonic()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._fout.close()
+
+
+_judgment_writers = {}
+_judgment_writers_lock = threading.Lock()
+
+
+def get_judgment_writer(output_file: str):
+    """Return the shared writer of an output file, starting it if needed."""
+    with _judgment_writers_lock:
+        writer = _judgment_writers.get(output_file)
+        if writer is None:
+            writer = JudgmentWriter(output_file)
+            _judgment_writers[output_file] = writer
+        return writer
+
+
+def close_judgment_writers():
+    """Flush and close all judgment writers."""
+    with _judgment_writers_lock:
+        writers = list(_judgment_writers.values())
+        _judgment_writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_judgment_writers)
+
+
+def decompress_gzip_members(data: bytes) -> bytes:
+    """Decompress the concatenated gzip members of `data`.
+
+    Each member is decompressed on its own, so an unfinished last member (the
+    file is still being written) is dropped without losing the members before
+    it.
+    """
+    chunks = []
+    while data:
+        decompressor = zlib.decompressobj(wbits=31)
+        chunk = decompressor.decompress(data)
+        if not decompressor.eof:
+            break
+        chunks.append(chunk)
+        data = decompressor.unused_data
+    return b"".join(chunks)
+
+
+def load_judgments(filename: str):
+    """Load the judgment records of a .jsonl or .jsonl.gz file.
+
+    The file may still be written by a running gen_judgment.py: a trailing
+    partial line or an unfinished gzip member is ignored.
+    """
+    with open(filename, "rb") as fin:
+        data = fin.read()
+    if filename.endswith(".gz"):
+        data = decompress_gzip_members(data)
+
+    records = []
+    for line in data.split(b"\n")[:-1]:
+        if line.strip():
+            records.append(json.loads(line))
+    return records
@@ -1,10 +1,17 @@
 """
 Usage:
 python3 show_result.py --mode [single|pairwise-baseline|pairwise-all]
+
+Follow a judgment file while gen_judgment.py is still writing it:
+python3 show_result.py --mode single --watch 30
 """
 import argparse
+import time
+
 import pandas as pd
 
+from fastchat.llm_judge.judgment_io import load_judgments
+
 
 def display_result_single(args):
     if args.input_file is None:
@@ -15,7 +22,7 @@ def display_result_single(args):
         input_file = args.input_file
 
     print(f"Input file: {input_file}")
-    df_all = pd.read_json(input_file, lines=True)
+    df_all = pd.DataFrame(load_judgments(input_file))
     df = df_all[["model", "score", "turn"]]
     df = df[df["score"] != -1]
 
@@ -45,7 +52,7 @@ def display_result_pairwise(args):
         input_file = args.input_file
 
     print(f"Input file: {input_file}")
-    df_all = pd.read_json(input_file, lines=True)
+    df_all = pd.DataFrame(load_judgments(input_file))
     df_all = df_all[(df_all["g1_winner"] != "error") & (df_all["g2_winner"] != "error")]
 
     model_list = (
@@ -117,6 +124,12 @@ if __name__ == "__main__":
             "`single` runs single answer grading."
         ),
     )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=None,
+        help="Show the results again every `watch` seconds, e.g. while the judgments are being generated.",
+    )
     args = parser.parse_args()
 
     if args.mode == "single":
@@ -128,3 +141,7 @@ if __name__ == "__main__":
 
     print(f"Mode: {args.mode}")
     display_result_func(args)
+    while args.watch:
+        time.sleep(args.watch)
+        print(f"\n{time.strftime('%Y-%m-%d %H:%M:%S')}")
+        display_result_func(args)
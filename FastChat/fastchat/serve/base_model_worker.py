@@ -43,6 +43,7 @@ class BaseModelWorker:
         self.worker_id = worker_id
         if model_path.endswith("/"):
             model_path = model_path[:-1]
+        self.model_path = model_path
         self.model_names = model_names or [model_path.split("/")[-1]]
         self.limit_worker_concurrency = limit_worker_concurrency
         self.conv = self.make_conv_template(conv_template, model_path)
@@ -238,4 +239,4 @@ async def api_get_conv(request: Request):
 
 @app.post("/model_details")
 async def api_model_details(request: Request):
-    return {"context_length": worker.context_len}
+    return {"context_length": worker.context_len, "model_path": worker.model_path}
@@ -0,0 +1,368 @@
+"""
+Continuous batching for the Hugging Face model worker.
+
+One background thread runs the model for all running requests at once, one
+token step at a time. New requests are prefilled and join the batch between two
+steps, and finished requests leave it, so concurrent requests share the
+forward passes instead of taking turns on the GPU.
+
+Usage:
+python3 -m fastchat.serve.model_worker --model-path lmsys/vicuna-7b-v1.5 --continuous-batching --limit-worker-concurrency 16
+"""
+import gc
+import queue
+import threading
+from typing import Dict, List, Optional
+
+import torch
+import torch.nn.functional as F
+
+from fastchat.serve.inference import (
+    find_stop_str,
+    get_kv_tensors,
+    get_stream_logprobs,
+    make_kv_cache,
+    prepare_logits_processor,
+)
+from fastchat.serve.prefix_cache import PrefixCache, is_prefix_cacheable
+
+
+class Sequence:
+    """A generation request; mirrors the loop of `inference.generate_stream`."""
+
+    def __init__(self, params: Dict, tokenizer, context_len: int, stream_interval: int):
+        self.tokenizer = tokenizer
+        self.stream_interval = stream_interval
+
+        # Read parameters
+        self.prompt = params["prompt"]
+        self.temperature = float(params.get("temperature", 1.0))
+        self.repetition_penalty = float(params.get("repetition_penalty", 1.0))
+        self.top_p = float(params.get("top_p", 1.0))
+        top_k = int(params.get("top_k", -1))  # -1 means disable
+        self.max_new_tokens = int(params.get("max_new_tokens", 256))
+        self.logprobs = params.get("logprobs", None)
+        self.echo = bool(params.get("echo", True))
+        self.stop_str = params.get("stop", None)
+        self.stop_token_ids = params.get("stop_token_ids", None) or []
+        if tokenizer.eos_token_id not in self.stop_token_ids:
+            self.stop_token_ids.append(tokenizer.eos_token_id)
+
+        self.logits_processor = prepare_logits_processor(
+            self.temperature, self.repetition_penalty, self.top_p, top_k
+        )
+        input_ids = tokenizer(self.prompt).input_ids
+        max_src_len = context_len - self.max_new_tokens - 1
+        self.input_ids = input_ids[-max_src_len:]
+        self.output_ids = list(self.input_ids)
+        self.token_logprobs = [None]  # The first token has no logprobs.
+        self.output = ""
+        self.ret_logprobs = None
+
+        # Stream chunks (dicts) for the request handler; an exception on failure.
+        self.outputs = queue.Queue()
+        self.cancelled = False
+
+    @property
+    def input_echo_len(self) -> int:
+        return len(self.input_ids)
+
+    def add_prompt_logprobs(self, logits: torch.Tensor):
+        """Record the logprobs of the prompt tokens, from the prefill logits."""
+        shift_logits = torch.log_softmax(logits[:-1].float(), dim=-1)
+        labels = torch.as_tensor(self.input_ids[1:], device=logits.device)
+        self.token_logprobs.extend(
+            shift_logits.gather(1, labels.unsqueeze(1)).squeeze(1).tolist()
+        )
+
+    def process_logits(self, logits: torch.Tensor) -> bool:
+        """Sample the next token from its logits; return whether the sequence is done."""
+        i = len(self.output_ids) - self.input_echo_len
+        if self.logits_processor:
+            if self.repetition_penalty > 1.0:
+                tmp_output_ids = torch.as_tensor(
+                    [self.output_ids], device=logits.device
+                )
+            else:
+                tmp_output_ids = None
+            last_token_logits = self.logits_processor(tmp_output_ids, logits[None])[0]
+        else:
+            last_token_logits = logits
+
+        if self.temperature < 1e-5 or self.top_p < 1e-8:  # greedy
+            token = int(torch.argmax(last_token_logits))
+        else:
+            probs = torch.softmax(last_token_logits.float(), dim=-1)
+            token = int(torch.multinomial(probs, num_samples=1))
+        self.output_ids.append(token)
+        if self.logprobs is not None:
+            # Cannot use last_token_logits because logprobs is based on raw logits.
+            self.token_logprobs.append(
+                torch.log_softmax(logits.float(), dim=-1)[token].tolist()
+            )
+
+        stopped = token in self.stop_token_ids
+        if i % self.stream_interval == 0 or i == self.max_new_tokens - 1 or stopped:
+            if self.echo:
+                tmp_output_ids = self.output_ids
+                rfind_start = len(self.prompt)
+            else:
+                tmp_output_ids = self.output_ids[self.input_echo_len :]
+                rfind_start = 0
+
+            output = self.tokenizer.decode(
+                tmp_output_ids,
+                skip_special_tokens=True,
+                spaces_between_special_tokens=False,
+                clean_up_tokenization_spaces=True,
+            )
+            if self.logprobs is not None:
+                self.ret_logprobs = get_stream_logprobs(
+                    self.tokenizer,
+                    self.output_ids,
+                    self.token_logprobs,
+                    self.echo,
+                    self.input_echo_len,
+                )
+            output, found_stop, partially_stopped = find_stop_str(
+                output, self.stop_str, rfind_start
+            )
+            self.output = output
+            stopped = stopped or found_stop
+
+            # Prevent yielding partial stop sequence
+            if not partially_stopped:
+                self.put_output(i, None)
+
+        if stopped:
+            self.put_output(i, "stop")
+        elif i == self.max_new_tokens - 1:
+            self.put_output(i, "length")
+        else:
+            return False
+        return True
+
+    def put_output(self, i: int, finish_reason: Optional[str]):
+        self.outputs.put(
+            {
+                "text": self.output,
+                "logprobs": self.ret_logprobs,
+                "usage": {
+                    "prompt_tokens": self.input_echo_len,
+                    "completion_tokens": i,
+                    "total_tokens": self.input_echo_len + i,
+                },
+                "finish_reason": finish_reason,
+            }
+        )
+
+
+class ContinuousBatchingEngine:
+    """Iteration-level scheduler for a decoder-only Hugging Face model.
+
+    The running sequences share one KV cache, left-padded to a common length.
+    Each step feeds the last token of every sequence, with explicit position
+    ids so the padding does not shift positions. A new request is prefilled
+    on its own and its KV cache is concatenated to the batch; the rows of
+    finished (or cancelled) requests are removed, and so are the padding
+    columns no remaining row needs.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        context_len: int,
+        stream_interval: int = 2,
+        max_batch_size: int = 8,
+        seed: Optional[int] = None,
+        prefix_cache: Optional[PrefixCache] = None,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.context_len = context_len
+        self.stream_interval = stream_interval
+        self.max_batch_size = max_batch_size
+        self.seed = seed
+        self.prefix_cache = prefix_cache
+
+        self.waiting = queue.Queue()
+        self.running: List[Sequence] = []
+        self.past_key_values = None
+        self.attention_mask = None  # (rows, cache length)
+
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def generate_stream(self, params: Dict):
+        """Submit a request and yield its stream chunks, like `generate_stream`."""
+        seq = Sequence(params, self.tokenizer, self.context_len, self.stream_interval)
+        self.waiting.put(seq)
+        try:
+            while True:
+                output = seq.outputs.get()
+                if isinstance(output, Exception):
+                    raise output
+                yield output
+                if output["finish_reason"] is not None:
+                    return
+        finally:
+            # Also reached when the client disconnects and the stream is closed.
+            seq.cancelled = True
+
+    @torch.inference_mode()
+    def loop(self):
+        if self.seed is not None:
+            torch.manual_seed(self.seed)
+        while True:
+            self.admit()
+            if not self.running:
+                continue
+            try:
+                self.step()
+            except Exception as e:
+                for seq in self.running:
+                    seq.outputs.put(e)
+                self.reset()
+
+    def admit(self):
+        """Prefill waiting requests and add them to the batch, while there is room."""
+        block = not self.running
+        while len(self.running) < self.max_batch_size:
+            try:
+                seq = self.waiting.get(block=block)
+            except queue.Empty:
+                break
+            block = False
+            if seq.cancelled:
+                continue
+            try:
+                self.prefill(seq)
+            except Exception as e:
+                seq.outputs.put(e)
+                if not self.running:
+                    self.reset()
+
+    def prefill(self, seq: Sequence):
+        num_cached, past_key_values = 0, None
+        # The logprobs of the prompt need the logits of all its tokens.
+        if self.prefix_cache is not None and seq.logprobs is None:
+            num_cached, past_key_values = self.prefix_cache.get(seq.input_ids)
+        out = self.model(
+            input_ids=torch.as_tensor([seq.input_ids[num_cached:]], device=self.device),
+            past_key_values=past_key_values,
+            use_cache=True,
+        )
+        logits = out.logits[0]
+        if seq.logprobs is not None:
+            seq.add_prompt_logprobs(logits)
+        if seq.process_logits(logits[-1]):
+            if self.prefix_cache is not None:
+                self.prefix_cache.put(seq.input_ids, out.past_key_values)
+            return
+        self.join(seq, out.past_key_values)
+
+    def join(self, seq: Sequence, past_key_values):
+        """Append the KV cache of a prefilled sequence to the batch."""
+        mask = torch.ones((1, len(seq.input_ids)), dtype=torch.long, device=self.device)
+        if self.past_key_values is None:
+            self.past_key_values = past_key_values
+            self.attention_mask = mask
+        else:
+            width = max(self.attention_mask.shape[1], mask.shape[1])
+
+            def left_pad(t, dim):
+                pad = [0, 0] * (t.dim() - dim - 1) + [width - t.shape[dim], 0]
+                return F.pad(t, pad)
+
+            kv_tensors = [
+                (
+                    torch.cat([left_pad(k, 2), left_pad(new_k, 2)]),
+                    torch.cat([left_pad(v, 2), left_pad(new_v, 2)]),
+                )
+                for (k, v), (new_k, new_v) in zip(
+                    get_kv_tensors(self.past_key_values),
+                    get_kv_tensors(past_key_values),
+                )
+            ]
+            self.past_key_values = make_kv_cache(kv_tensors, type(self.past_key_values))
+            self.attention_mask = torch.cat(
+                [left_pad(self.attention_mask, 1), left_pad(mask, 1)]
+            )
+        self.running.append(seq)
+
+    def step(self):
+        """Decode one token of every running sequence."""
+        input_ids = [[seq.output_ids[-1]] for seq in self.running]
+        position_ids = [[len(seq.output_ids) - 1] for seq in self.running]
+        self.attention_mask = F.pad(self.attention_mask, (0, 1), value=1)
+        out = self.model(
+            input_ids=torch.as_tensor(input_ids, device=self.device),
+            attention_mask=self.attention_mask,
+            position_ids=torch.as_tensor(position_ids, device=self.device),
+            past_key_values=self.past_key_values,
+            use_cache=True,
+        )
+        self.past_key_values = out.past_key_values
+        logits = out.logits[:, -1, :]
+
+        keep = [
+            r
+            for r, seq in enumerate(self.running)
+            if not seq.cancelled and not seq.process_logits(logits[r])
+        ]
+        if len(keep) < len(self.running):
+            self.leave(keep)
+
+    def leave(self, keep: List[int]):
+        """Keep only the rows `keep` of the batch."""
+        if self.prefix_cache is not None and is_prefix_cacheable(self.past_key_values):
+            self.cache_finished_rows(keep)
+        if not keep:
+            self.reset()
+            return
+        index = torch.as_tensor(keep, device=self.device)
+        attention_mask = self.attention_mask[index]
+        # Drop the left padding columns no remaining row needs.
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        kv_tensors = [
+            (k[index, :, start:], v[index, :, start:])
+            for k, v in get_kv_tensors(self.past_key_values)
+        ]
+        self.past_key_values = make_kv_cache(kv_tensors, type(self.past_key_values))
+        self.attention_mask = attention_mask[:, start:]
+        self.running = [self.running[r] for r in keep]
+
+    def cache_finished_rows(self, keep: List[int]):
+        """Add the KV cache of each leaving row to the prefix cache."""
+        kv_tensors = get_kv_tensors(self.past_key_values)
+        cache_type = type(self.past_key_values)
+        for r, seq in enumerate(self.running):
+            if r in keep:
+                continue
+            # The row's tokens are its last columns, after its left padding.
+            row_len = int(self.attention_mask[r].sum())
+            self.prefix_cache.add(
+                seq.output_ids[:row_len],
+                [
+                    (
+                        k[r : r + 1, :, -row_len:].clone(),
+                        v[r : r + 1, :, -row_len:].clone(),
+                    )
+                    for k, v in kv_tensors
+                ],
+                cache_type,
+            )
+
+    def reset(self):
+        """Empty the batch and free its KV cache."""
+        self.running = []
+        self.past_key_values = None
+        self.attention_mask = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -9,13 +9,13 @@ from enum import Enum, auto
 import json
 import logging
 import os
+import random
 import time
 from typing import List, Union
 import threading
 
 from fastapi import FastAPI, Request
 from fastapi.responses import StreamingResponse
-import numpy as np
 import requests
 import uvicorn
 
@@ -53,6 +53,7 @@ class WorkerInfo:
     check_heart_beat: bool
     last_heart_beat: str
     multimodal: bool
+    register_time: float
 
 
 def heart_beat_controller(controller):
@@ -65,6 +66,8 @@ class Controller:
     def __init__(self, dispatch_method: str):
         # Dict[str -> WorkerInfo]
         self.worker_info = {}
+        # Dict[model name -> List[worker name]], rebuilt when workers change
+        self.model_workers = {}
         self.dispatch_method = DispatchMethod.from_str(dispatch_method)
 
         self.heart_beat_thread = threading.Thread(
@@ -96,11 +99,21 @@ class Controller:
             check_heart_beat,
             time.time(),
             multimodal,
+            time.time(),
         )
 
+        self.update_model_index()
+
         logger.info(f"Register done: {worker_name}, {worker_status}")
         return True
 
+    def update_model_index(self):
+        model_workers = {}
+        for w_name, w_info in self.worker_info.items():
+            for model_name in w_info.model_names:
+                model_workers.setdefault(model_name, []).append(w_name)
+        self.model_workers = model_workers
+
     def get_worker_status(self, worker_name: str):
         try:
             r = requests.post(worker_name + "/worker_get_status", timeout=5)
@@ -116,10 +129,12 @@ class Controller:
 
     def remove_worker(self, worker_name: str):
         del self.worker_info[worker_name]
+        self.update_model_index()
 
     def refresh_all_workers(self):
         old_info = dict(self.worker_info)
         self.worker_info = {}
+        self.update_model_index()
 
         for w_name, w_info in old_info.items():
             if not self.register_worker(
@@ -128,12 +143,7 @@ class Controller:
                 logger.info(f"Remove stale worker: {w_name}")
 
     def list_models(self):
-        model_names = set()
-
-        for w_name, w_info in self.worker_info.items():
-            model_names.update(w_info.model_names)
-
-        return list(model_names)
+        return list(self.model_workers)
 
     def list_multimodal_models(self):
         model_names = set()
@@ -153,50 +163,38 @@ class Controller:
 
         return list(model_names)
 
+    def list_workers(self):
+        """Return the workers and their models, e.g. for the API server's cache.
+
+        `register_time` changes when a worker registers again (e.g. after a
+        restart), so cached metadata of the worker can be invalidated.
+        """
+        return {
+            w_name: {
+                "model_names": w_info.model_names,
+                "speed": w_info.speed,
+                "queue_length": w_info.queue_length,
+                "multimodal": w_info.multimodal,
+                "register_time": w_info.register_time,
+            }
+            for w_name, w_info in self.worker_info.items()
+        }
+
     def get_worker_address(self, model_name: str):
+        worker_names = self.model_workers.get(model_name, [])
         if self.dispatch_method == DispatchMethod.LOTTERY:
-            worker_names = []
-            worker_speeds = []
-            for w_name, w_info in self.worker_info.items():
-                if model_name in w_info.model_names:
-                    worker_names.append(w_name)
-                    worker_speeds.append(w_info.speed)
-            worker_speeds = np.array(worker_speeds, dtype=np.float32)
-            norm = np.sum(worker_speeds)
-            if norm < 1e-4:
+            worker_speeds = [self.worker_info[w].speed for w in worker_names]
+            if sum(worker_speeds) < 1e-4:
                 return ""
-            worker_speeds = worker_speeds / norm
-            if True:  # Directly return address
-                pt = np.random.choice(np.arange(len(worker_names)), p=worker_speeds)
-                worker_name = worker_names[pt]
-                return worker_name
-
-            # Check status before returning
-            while True:
-                pt = np.random.choice(np.arange(len(worker_names)), p=worker_speeds)
-                worker_name = worker_names[pt]
-
-                if self.get_worker_status(worker_name):
-                    break
-                else:
-                    self.remove_worker(worker_name)
-                    worker_speeds[pt] = 0
-                    norm = np.sum(worker_speeds)
-                    if norm < 1e-4:
-                        return ""
-                    worker_speeds = worker_speeds / norm
-                    continue
-            return worker_name
+            return random.choices(worker_names, weights=worker_speeds)[0]
         elif self.dispatch_method == DispatchMethod.SHORTEST_QUEUE:
-            worker_names = []
-            worker_qlen = []
-            for w_name, w_info in self.worker_info.items():
-                if model_name in w_info.model_names:
-                    worker_names.append(w_name)
-                    worker_qlen.append(w_info.queue_length / w_info.speed)
             if len(worker_names) == 0:
                 return ""
-            min_index = np.argmin(worker_qlen)
+            worker_qlen = [
+                self.worker_info[w].queue_length / self.worker_info[w].speed
+                for w in worker_names
+            ]
+            min_index = min(range(len(worker_names)), key=worker_qlen.__getitem__)
             w_name = worker_names[min_index]
             self.worker_info[w_name].queue_length += 1
             logger.info(
@@ -319,6 +317,11 @@ async def list_language_models():
     return {"models": models}
 
 
+@app.post("/list_workers")
+async def list_workers():
+    return {"workers": controller.list_workers()}
+
+
 @app.post("/get_worker_address")
 async def get_worker_address(request: Request):
     data = await request.json()
@@ -58,6 +58,80 @@ def prepare_logits_processor(
     return processor_list
 
 
+def get_stream_logprobs(tokenizer, output_ids, token_logprobs, echo, input_echo_len):
+    """Format the logprobs of the streamed tokens like the OpenAI API."""
+    if not echo:
+        output_ids = output_ids[input_echo_len:]
+        token_logprobs = token_logprobs[input_echo_len:]
+    ret_logprobs = {
+        "text_offset": [],
+        "tokens": [tokenizer.decode(token) for token in output_ids],
+        "token_logprobs": token_logprobs,
+        "top_logprobs": [{}] * len(token_logprobs),
+    }
+    # Compute text_offset
+    curr_pos = 0
+    for text in ret_logprobs["tokens"]:
+        ret_logprobs["text_offset"].append(curr_pos)
+        curr_pos += len(text)
+    return ret_logprobs
+
+
+def find_stop_str(output: str, stop_str, rfind_start: int):
+    """Cut `output` at the first stop string found after `rfind_start`.
+
+    Returns the output, whether a stop string was found, and whether the output
+    ends with the beginning of a stop string (which should not be streamed yet).
+    """
+    stopped = partially_stopped = False
+    if stop_str:
+        if isinstance(stop_str, str):
+            pos = output.rfind(stop_str, rfind_start)
+            if pos != -1:
+                output = output[:pos]
+                stopped = True
+            else:
+                partially_stopped = is_partial_stop(output, stop_str)
+        elif isinstance(stop_str, Iterable):
+            for each_stop in stop_str:
+                pos = output.rfind(each_stop, rfind_start)
+                if pos != -1:
+                    output = output[:pos]
+                    stopped = True
+                    break
+                else:
+                    partially_stopped = is_partial_stop(output, each_stop)
+                    if partially_stopped:
+                        break
+        else:
+            raise ValueError("Invalid stop field type.")
+    return output, stopped, partially_stopped
+
+
+def get_kv_tensors(past_key_values):
+    """Return the (key, value) tensors of each layer of a KV cache.
+
+    The tensors have the shape (batch, heads, sequence, head dim).
+    """
+    if isinstance(past_key_values, (tuple, list)):
+        return [(layer[0], layer[1]) for layer in past_key_values]
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+
+
+def make_kv_cache(kv_tensors, cache_type):
+    """Build a KV cache from (key, value) tensors.
+
+    `cache_type` is the type of the caches of the model (e.g. tuple or DynamicCache).
+    """
+    if issubclass(cache_type, (tuple, list)):
+        return tuple(kv_tensors)
+    if hasattr(cache_type, "from_legacy_cache"):
+        return cache_type.from_legacy_cache(tuple(kv_tensors))
+    return cache_type(kv_tensors)
+
+
 @torch.inference_mode()
 def generate_stream(
     model,
@@ -67,6 +141,7 @@ def generate_stream(
     context_len: int,
     stream_interval: int = 2,
     judge_sent_end: bool = False,
+    prefix_cache=None,
 ):
     if hasattr(model, "device"):
         device = model.device
@@ -115,6 +190,16 @@ def generate_stream(
         start_ids = torch.as_tensor([input_ids], device=device)
 
     past_key_values = out = None
+    num_cached = 0
+    # The logprobs of the prompt need the logits of all its tokens.
+    use_prefix_cache = (
+        prefix_cache is not None
+        and not model.config.is_encoder_decoder
+        and logprobs is None
+    )
+    if use_prefix_cache:
+        # Only prefill the tokens after the longest cached prefix.
+        num_cached, past_key_values = prefix_cache.get(input_ids)
     token_logprobs = [None]  # The first token has no logprobs.
     sent_interrupt = False
     finish_reason = None
@@ -129,7 +214,11 @@ def generate_stream(
                 )
                 logits = model.lm_head(out[0])
             else:
-                out = model(input_ids=start_ids, use_cache=True)
+                out = model(
+                    input_ids=start_ids[:, num_cached:],
+                    use_cache=True,
+                    past_key_values=past_key_values,
+                )
                 logits = out.logits
             past_key_values = out.past_key_values
 
@@ -219,25 +308,9 @@ def generate_stream(
             )
             ret_logprobs = None
             if logprobs is not None:
-                ret_logprobs = {
-                    "text_offset": [],
-                    "tokens": [
-                        tokenizer.decode(token)
-                        for token in (
-                            output_ids if echo else output_ids[input_echo_len:]
-                        )
-                    ],
-                    "token_logprobs": token_logprobs
-                    if echo
-                    else token_logprobs[input_echo_len:],
-                    "top_logprobs": [{}]
-                    * len(token_logprobs if echo else token_logprobs[input_echo_len:]),
-                }
-                # Compute text_offset
-                curr_pos = 0
-                for text in ret_logprobs["tokens"]:
-                    ret_logprobs["text_offset"].append(curr_pos)
-                    curr_pos += len(text)
+                ret_logprobs = get_stream_logprobs(
+                    tokenizer, output_ids, token_logprobs, echo, input_echo_len
+                )
 
             # TODO: For the issue of incomplete sentences interrupting output, apply a patch and others can also modify it to a more elegant way
             if judge_sent_end and stopped and not is_sentence_complete(output):
@@ -249,28 +322,10 @@ def generate_stream(
                 stopped = False
                 sent_interrupt = True
 
-            partially_stopped = False
-            if stop_str:
-                if isinstance(stop_str, str):
-                    pos = output.rfind(stop_str, rfind_start)
-                    if pos != -1:
-                        output = output[:pos]
-                        stopped = True
-                    else:
-                        partially_stopped = is_partial_stop(output, stop_str)
-                elif isinstance(stop_str, Iterable):
-                    for each_stop in stop_str:
-                        pos = output.rfind(each_stop, rfind_start)
-                        if pos != -1:
-                            output = output[:pos]
-                            stopped = True
-                            break
-                        else:
-                            partially_stopped = is_partial_stop(output, each_stop)
-                            if partially_stopped:
-                                break
-                else:
-                    raise ValueError("Invalid stop field type.")
+            output, found_stop, partially_stopped = find_stop_str(
+                output, stop_str, rfind_start
+            )
+            stopped = stopped or found_stop
 
             # Prevent yielding partial stop sequence
             if not partially_stopped:
@@ -306,6 +361,9 @@ def generate_stream(
         "finish_reason": finish_reason,
     }
 
+    if use_prefix_cache:
+        prefix_cache.put(output_ids, past_key_values)
+
     # Clean
     del past_key_values, out
     gc.collect()
@@ -3,6 +3,7 @@ A model worker that executes the model.
 """
 import argparse
 import base64
+import functools
 import gc
 import json
 import os
@@ -25,6 +26,9 @@ from fastchat.modules.exllama import ExllamaConfig
 from fastchat.modules.xfastertransformer import XftConfig
 from fastchat.modules.gptq import GptqConfig
 from fastchat.serve.base_model_worker import BaseModelWorker, app
+from fastchat.serve.continuous_batching import ContinuousBatchingEngine
+from fastchat.serve.inference import generate_stream
+from fastchat.serve.prefix_cache import PrefixCache
 from fastchat.utils import (
     build_logger,
     get_context_length,
@@ -61,6 +65,9 @@ class ModelWorker(BaseModelWorker):
         embed_in_truncate: bool = False,
         seed: Optional[int] = None,
         debug: bool = False,
+        continuous_batching: bool = False,
+        prefix_cache_gb: float = 0,
+        prefix_cache_cpu_gb: float = 0,
         **kwargs,
     ):
         super().__init__(
@@ -98,9 +105,52 @@ class ModelWorker(BaseModelWorker):
         self.embed_in_truncate = embed_in_truncate
         self.seed = seed
 
+        # Only the default generate_stream of decoder-only models supports
+        # the prefix cache and continuous batching.
+        supports_kv_reuse = (
+            self.generate_stream_func is generate_stream
+            and not self.model.config.is_encoder_decoder
+        )
+        self.prefix_cache = None
+        if prefix_cache_gb > 0:
+            if supports_kv_reuse:
+                self.prefix_cache = PrefixCache(
+                    int(prefix_cache_gb * 2**30), int(prefix_cache_cpu_gb * 2**30)
+                )
+                self.generate_stream_func = functools.partial(
+                    generate_stream, prefix_cache=self.prefix_cache
+                )
+            else:
+                logger.warning(
+                    "The prefix cache only supports decoder-only models that use "
+                    "the default generate_stream. It is disabled."
+                )
+        self.engine = None
+        if continuous_batching:
+            if supports_kv_reuse:
+                self.engine = ContinuousBatchingEngine(
+                    self.model,
+                    self.tokenizer,
+                    self.context_len,
+                    stream_interval=stream_interval,
+                    max_batch_size=limit_worker_concurrency,
+                    seed=seed,
+                    prefix_cache=self.prefix_cache,
+                )
+            else:
+                logger.warning(
+                    "Continuous batching only supports decoder-only models that use "
+                    "the default generate_stream. Requests will run one at a time."
+                )
+
         if not no_register:
             self.init_heart_beat()
 
+    def send_heart_beat(self):
+        if self.prefix_cache is not None:
+            logger.info(f"Prefix cache: {self.prefix_cache.get_stats()}")
+        super().send_heart_beat()
+
     def generate_stream_gate(self, params):
         if self.device == "npu":
             import torch_npu
@@ -109,16 +159,20 @@ class ModelWorker(BaseModelWorker):
         self.call_ct += 1
 
         try:
-            if self.seed is not None:
-                set_seed(self.seed)
-            for output in self.generate_stream_func(
-                self.model,
-                self.tokenizer,
-                params,
-                self.device,
-                self.context_len,
-                self.stream_interval,
-            ):
+            if self.engine is not None:
+                generator = self.engine.generate_stream(params)
+            else:
+                if self.seed is not None:
+                    set_seed(self.seed)
+                generator = self.generate_stream_func(
+                    self.model,
+                    self.tokenizer,
+                    params,
+                    self.device,
+                    self.context_len,
+                    self.stream_interval,
+                )
+            for output in generator:
                 ret = {
                     "text": output["text"],
                     "error_code": 0,
@@ -325,6 +379,25 @@ def create_model_worker():
         help="Limit the model concurrency to prevent OOM.",
     )
     parser.add_argument("--stream-interval", type=int, default=2)
+    parser.add_argument(
+        "--continuous-batching",
+        action="store_true",
+        help="Run concurrent requests in one batch, which requests join and leave at each token. "
+        "The batch size is --limit-worker-concurrency.",
+    )
+    parser.add_argument(
+        "--prefix-cache-gb",
+        type=float,
+        default=0,
+        help="GiB of device memory for the KV caches of past requests, reused by "
+        "the requests sharing their prefix (e.g. the next turn of a chat). 0 disables it.",
+    )
+    parser.add_argument(
+        "--prefix-cache-cpu-gb",
+        type=float,
+        default=0,
+        help="GiB of CPU memory for the prefix cache entries evicted from the device.",
+    )
     parser.add_argument("--no-register", action="store_true")
     parser.add_argument(
         "--seed",
@@ -406,6 +479,9 @@ def create_model_worker():
         embed_in_truncate=args.embed_in_truncate,
         seed=args.seed,
         debug=args.debug,
+        continuous_batching=args.continuous_batching,
+        prefix_cache_gb=args.prefix_cache_gb,
+        prefix_cache_cpu_gb=args.prefix_cache_cpu_gb,
     )
     return args, worker
 
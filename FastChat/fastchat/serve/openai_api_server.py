@@ -9,18 +9,23 @@ python3 -m fastchat.serve.openai_api_server
 """
 import asyncio
 import argparse
+import contextvars
+import hashlib
 import json
+import math
 import os
+import random
+import time
 from typing import Generator, Optional, Union, Dict, List, Any
+from urllib.parse import urlsplit
 
 import aiohttp
 import fastapi
 from fastapi import Depends, HTTPException
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.security.http import HTTPAuthorizationCredentials, HTTPBearer
-import httpx
 
 from pydantic_settings import BaseSettings
 import shortuuid
@@ -65,15 +70,106 @@ from fastchat.utils import build_logger
 
 logger = build_logger("openai_api_server", "openai_api_server.log")
 
-conv_template_map = {}
-
 fetch_timeout = aiohttp.ClientTimeout(total=3 * 3600)
+# Characters of a completion prompt used as its prefix affinity key
+AFFINITY_PREFIX_CHARS = 1024
+stream_timeout = aiohttp.ClientTimeout(
+    total=None, sock_connect=WORKER_API_TIMEOUT, sock_read=WORKER_API_TIMEOUT
+)
+
+
+class UpstreamClients:
+    """Long-lived HTTP sessions, one per upstream (the controller and each worker).
+
+    Each session keeps a pool of keep-alive connections, so the calls made for
+    one request (get_worker_address, model_details, count_token, generate, ...)
+    reuse open connections instead of connecting again.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.max_connections = 100
+        self.keepalive_timeout = 60.0
+
+    def get(self, url: str) -> aiohttp.ClientSession:
+        parts = urlsplit(url)
+        upstream = f"{parts.scheme}://{parts.netloc}"
+        session = self.sessions.get(upstream)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector, timeout=fetch_timeout, headers=headers
+            )
+            self.sessions[upstream] = session
+        return session
+
+    async def close(self):
+        sessions = list(self.sessions.values())
+        self.sessions.clear()
+        for session in sessions:
+            await session.close()
+
+
+class LatencyStats:
+    """Latency histograms of the upstream calls, in the Prometheus text format."""
+
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        # phase -> [count per bucket..., count, sum]
+        self.stats: Dict[str, List[float]] = {}
+
+    def observe(self, phase: str, seconds: float):
+        stat = self.stats.get(phase)
+        if stat is None:
+            stat = self.stats[phase] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                stat[i] += 1
+        stat[-2] += 1
+        stat[-1] += seconds
+
+    def render(self) -> str:
+        name = "fastchat_api_latency_seconds"
+        lines = [
+            f"# HELP {name} Latency of the API server's requests and upstream calls.",
+            f"# TYPE {name} histogram",
+        ]
+        for phase, stat in sorted(self.stats.items()):
+            for bound, count in zip(self.buckets, stat):
+                lines.append(f'{name}_bucket{{phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{phase="{phase}",le="+Inf"}} {stat[-2]}')
+            lines.append(f'{name}_count{{phase="{phase}"}} {stat[-2]}')
+            lines.append(f'{name}_sum{{phase="{phase}"}} {stat[-1]:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+upstream_clients = UpstreamClients()
+latency_stats = LatencyStats()
+# Per-request latency breakdown: phase -> seconds (summed over repeated calls)
+request_timings: contextvars.ContextVar[
+    Optional[Dict[str, float]]
+] = contextvars.ContextVar("request_timings", default=None)
+# Workers acquired by the current request, released when its response is sent
+request_workers: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "request_workers", default=None
+)
+
+
+def record_latency(phase: str, seconds: float):
+    latency_stats.observe(phase, seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
 
 
 async def fetch_remote(url, pload=None, name=None):
-    async with aiohttp.ClientSession(timeout=fetch_timeout) as session:
-        async with session.post(url, json=pload) as response:
-            chunks = []
+    start = time.perf_counter()
+    try:
+        async with upstream_clients.get(url).post(url, json=pload) as response:
             if response.status != 200:
                 ret = {
                     "text": f"{response.reason}",
@@ -81,9 +177,9 @@ async def fetch_remote(url, pload=None, name=None):
                 }
                 return json.dumps(ret)
 
-            async for chunk, _ in response.content.iter_chunks():
-                chunks.append(chunk)
-        output = b"".join(chunks)
+            output = await response.read()
+    finally:
+        record_latency(url.rsplit("/", 1)[-1], time.perf_counter() - start)
 
     if name is not None:
         res = json.loads(output)
@@ -98,6 +194,24 @@ class AppSettings(BaseSettings):
     # The address of the model controller.
     controller_address: str = "http://localhost:21001"
     api_keys: Optional[List[str]] = None
+    # Connection pool of each upstream (the controller and each worker).
+    upstream_max_connections: int = 100
+    upstream_keepalive_timeout: float = 60.0
+    # Seconds the worker list of the controller is cached.
+    worker_cache_ttl: float = 10.0
+    # How the API server picks a worker: least_outstanding, power_of_two or lottery.
+    dispatch_method: str = "least_outstanding"
+    # Send the requests of a conversation to the same worker (for KV cache reuse).
+    prefix_affinity: bool = False
+    # With prefix affinity, the most requests in flight on a worker, relative
+    # to its share of all requests in flight, before it is skipped.
+    affinity_load_factor: float = 1.25
+    # Count prompt tokens with the model's tokenizer loaded in the API server.
+    # Off by default: the model path comes from the workers, which the
+    # controller does not authenticate.
+    local_token_count: bool = False
+    # Run the custom tokenizer code of a model when loading its tokenizer.
+    trust_remote_code: bool = False
 
 
 app_settings = AppSettings()
@@ -106,6 +220,262 @@ headers = {"User-Agent": "FastChat API Server"}
 get_bearer_token = HTTPBearer(auto_error=False)
 
 
+@app.on_event("startup")
+async def app_startup():
+    upstream_clients.max_connections = app_settings.upstream_max_connections
+    upstream_clients.keepalive_timeout = app_settings.upstream_keepalive_timeout
+    upstream_clients.get(app_settings.controller_address)
+
+
+@app.on_event("shutdown")
+async def app_shutdown():
+    await upstream_clients.close()
+
+
+@app.middleware("http")
+async def track_request(request: fastapi.Request, call_next):
+    """Release the workers acquired by a request and log its latency breakdown,
+    once its body has been sent (or the client disconnected)."""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    timings = {}
+    acquired = []
+    request_timings.set(timings)
+    request_workers.set(acquired)
+    start = time.perf_counter()
+
+    def finish():
+        for worker_addr in acquired:
+            worker_cache.release(worker_addr)
+        acquired.clear()
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish()
+        raise
+    body_iterator = response.body_iterator
+
+    async def log_after_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish()
+        total = time.perf_counter() - start
+        latency_stats.observe("total", total)
+        breakdown = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in timings.items())
+        logger.info(
+            f"latency {request.method} {request.url.path}: "
+            f"total={total * 1000:.1f}ms, {breakdown}"
+        )
+
+    response.body_iterator = log_after_body()
+    return response
+
+
+class WorkerCache:
+    """Control-plane data of the workers, cached in the API server.
+
+    - The worker list (model name -> worker addresses) is fetched from the
+      controller's /list_workers and refreshed every `worker_cache_ttl`
+      seconds, so workers are picked locally (see `pick_worker`).
+    - The context length, conv template and model path of each worker are
+      fetched once. They are dropped when the worker leaves the controller's
+      list (its heart beats expired) or registers again, and when a call to
+      the worker fails to connect.
+    - With `local_token_count`, prompt tokens are counted with the model's
+      tokenizer, loaded lazily in the background. Until it is loaded, or if
+      it cannot be, the worker counts them.
+
+    With a warm cache, a completion makes a single upstream call: generate.
+    """
+
+    def __init__(self):
+        self.workers: Dict[str, dict] = {}  # worker address -> worker info
+        # worker address -> requests of this API server in flight on the worker
+        self.outstanding: Dict[str, int] = {}
+        self.models: Dict[str, List[str]] = {}  # model name -> worker addresses
+        self.expire_time = 0.0
+        self.details: Dict[tuple, dict] = {}  # (worker address, model name) -> details
+        self.tokenizers: Dict[str, Any] = {}  # model path -> tokenizer (None: failed)
+        self._refresh_lock = None
+        # One details fetch per worker when concurrent requests miss the cache
+        self._locks: Dict[tuple, asyncio.Lock] = {}
+        self._loading: List[asyncio.Task] = []
+
+    def _set_workers(self, workers: Dict[str, dict]):
+        for w_name, model_name in list(self.details):
+            old, new = self.workers.get(w_name), workers.get(w_name)
+            if (
+                new is None
+                or old is None
+                or new["register_time"] != old["register_time"]
+            ):
+                del self.details[(w_name, model_name)]
+        self.workers = workers
+        self.models = {}
+        for w_name, w_info in workers.items():
+            for model_name in w_info["model_names"]:
+                self.models.setdefault(model_name, []).append(w_name)
+
+    async def refresh(self, force: bool = False):
+        if not force and time.monotonic() < self.expire_time:
+            return
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # Another request may have refreshed the list while we waited.
+            if not force and time.monotonic() < self.expire_time:
+                return
+            workers = await fetch_remote(
+                app_settings.controller_address + "/list_workers", None, "workers"
+            )
+            self._set_workers(workers)
+            self.expire_time = time.monotonic() + app_settings.worker_cache_ttl
+
+    def invalidate(self, worker_addr: Optional[str] = None):
+        """Drop a worker (e.g. after a connection error) until the next refresh."""
+        if worker_addr is not None and worker_addr in self.workers:
+            workers = dict(self.workers)
+            del workers[worker_addr]
+            self._set_workers(workers)
+        self.expire_time = 0.0
+
+    async def list_models(self, force: bool = False) -> List[str]:
+        await self.refresh(force)
+        return list(self.models)
+
+    def _load(self, worker_addr: str) -> float:
+        return self.outstanding.get(worker_addr, 0) / self.workers[worker_addr]["speed"]
+
+    def _pick_by_affinity(self, worker_names: List[str], affinity_key: str) -> str:
+        """Rendezvous hashing with bounded loads.
+
+        Requests with the same key (e.g. the same conversation) go to the same
+        worker, whose KV cache may hold their prefix, unless that worker has
+        more than `affinity_load_factor` times its share of the requests in
+        flight (rounded up); then the next worker in the key's order is tried.
+        """
+
+        def score(worker_addr):
+            digest = hashlib.md5(f"{affinity_key}|{worker_addr}".encode()).digest()
+            return int.from_bytes(digest[:8], "big")
+
+        total = sum(self.outstanding.get(w, 0) for w in worker_names) + 1
+        bound = math.ceil(app_settings.affinity_load_factor * total / len(worker_names))
+        ordered = sorted(worker_names, key=score, reverse=True)
+        for worker_addr in ordered:
+            if self.outstanding.get(worker_addr, 0) + 1 <= bound:
+                return worker_addr
+        return ordered[0]
+
+    async def pick_worker(self, model_name: str, affinity_key: Optional[str] = None):
+        """Pick a worker of the model with the configured dispatch method.
+
+        - least_outstanding: the fewest requests in flight (relative to speed).
+        - power_of_two: the less loaded of two random workers.
+        - lottery: random, weighted by speed.
+        With an affinity key, requests sharing the key prefer the same worker.
+        """
+        await self.refresh()
+        worker_names = self.models.get(model_name)
+        if not worker_names:
+            # A new worker may have registered since the last refresh.
+            await self.refresh(force=True)
+            worker_names = self.models.get(model_name)
+        worker_names = [w for w in worker_names or [] if self.workers[w]["speed"] > 0]
+        if not worker_names:
+            return ""
+        if len(worker_names) == 1:
+            return worker_names[0]
+
+        if affinity_key is not None:
+            return self._pick_by_affinity(worker_names, affinity_key)
+        dispatch_method = app_settings.dispatch_method
+        if dispatch_method == "lottery":
+            speeds = [self.workers[w]["speed"] for w in worker_names]
+            return random.choices(worker_names, weights=speeds)[0]
+        if dispatch_method == "power_of_two":
+            worker_names = random.sample(worker_names, 2)
+        return min(worker_names, key=lambda w: (self._load(w), random.random()))
+
+    def acquire(self, worker_addr: str):
+        self.outstanding[worker_addr] = self.outstanding.get(worker_addr, 0) + 1
+
+    def release(self, worker_addr: str):
+        count = self.outstanding.get(worker_addr, 0) - 1
+        if count > 0:
+            self.outstanding[worker_addr] = count
+        else:
+            self.outstanding.pop(worker_addr, None)
+
+    async def get_details(self, worker_addr: str, model_name: str) -> dict:
+        key = (worker_addr, model_name)
+        details = self.details.get(key)
+        if details is not None:
+            return details
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            details = self.details.get(key)
+            if details is None:
+                details = await fetch_remote(
+                    worker_addr + "/model_details", {"model": model_name}, ""
+                )
+                details["conv"] = await fetch_remote(
+                    worker_addr + "/worker_get_conv_template",
+                    {"model": model_name},
+                    "conv",
+                )
+                if worker_addr in self.workers:
+                    self.details[key] = details
+        return details
+
+    async def _load_tokenizer(self, model_path: str):
+        def load():
+            from transformers import AutoTokenizer
+
+            return AutoTokenizer.from_pretrained(
+                model_path, trust_remote_code=app_settings.trust_remote_code
+            )
+
+        try:
+            self.tokenizers[model_path] = await asyncio.to_thread(load)
+            logger.info(f"Loaded the tokenizer of {model_path}")
+        except Exception as e:
+            logger.warning(
+                f"Cannot load the tokenizer of {model_path}, "
+                f"tokens are counted by the workers: {e}"
+            )
+
+    def get_tokenizer(self, model_path: Optional[str]):
+        """Return the tokenizer of a model, or None while it is loading (or failed)."""
+        if not app_settings.local_token_count or not model_path:
+            return None
+        if model_path not in self.tokenizers:
+            # Load in the background; the workers count tokens meanwhile.
+            self.tokenizers[model_path] = None
+            self._loading.append(asyncio.create_task(self._load_tokenizer(model_path)))
+        return self.tokenizers[model_path]
+
+    async def count_token(self, worker_addr: str, model_name: str, prompt) -> int:
+        details = await self.get_details(worker_addr, model_name)
+        tokenizer = self.get_tokenizer(details.get("model_path"))
+        if tokenizer is not None and isinstance(prompt, str):
+            start = time.perf_counter()
+            count = len(tokenizer(prompt).input_ids)
+            record_latency("local_count_token", time.perf_counter() - start)
+            return count
+        return await fetch_remote(
+            worker_addr + "/count_token",
+            {"model": model_name, "prompt": prompt},
+            "count",
+        )
+
+
+worker_cache = WorkerCache()
+
+
 async def check_api_key(
     auth: Optional[HTTPAuthorizationCredentials] = Depends(get_bearer_token),
 ) -> str:
@@ -140,10 +510,12 @@ async def validation_exception_handler(request, exc):
 
 
 async def check_model(request) -> Optional[JSONResponse]:
-    controller_address = app_settings.controller_address
     ret = None
 
-    models = await fetch_remote(controller_address + "/list_models", None, "models")
+    models = await worker_cache.list_models()
+    if request.model not in models:
+        # A new worker may have registered since the last refresh.
+        models = await worker_cache.list_models(force=True)
     if request.model not in models:
         ret = create_error_response(
             ErrorCode.INVALID_MODEL,
@@ -158,14 +530,9 @@ async def check_length(request, prompt, max_tokens, worker_addr):
     ):  # model worker not support max_tokens=None
         max_tokens = 1024 * 1024
 
-    context_len = await fetch_remote(
-        worker_addr + "/model_details", {"model": request.model}, "context_length"
-    )
-    token_num = await fetch_remote(
-        worker_addr + "/count_token",
-        {"model": request.model, "prompt": prompt},
-        "count",
-    )
+    details = await worker_cache.get_details(worker_addr, request.model)
+    context_len = details["context_length"]
+    token_num = await worker_cache.count_token(worker_addr, request.model, prompt)
     length = min(max_tokens, context_len - token_num)
 
     if length <= 0:
@@ -364,18 +731,44 @@ async def get_gen_params(
     return gen_params
 
 
-async def get_worker_address(model_name: str) -> str:
+def get_affinity_key(prompt) -> Optional[str]:
+    """Return the key routing the requests of a conversation to one worker.
+
+    For chat messages, this is the system prompt and the first user message,
+    which stay the same across the turns of a conversation.
+    """
+    if not app_settings.prefix_affinity:
+        return None
+    if isinstance(prompt, list) and prompt and isinstance(prompt[0], dict):
+        head = []
+        for message in prompt:
+            head.append(message)
+            if message["role"] == "user":
+                break
+        return json.dumps(head, sort_keys=True)
+    if isinstance(prompt, list):
+        prompt = prompt[0] if prompt else ""
+    return str(prompt)[:AFFINITY_PREFIX_CHARS]
+
+
+async def get_worker_address(
+    model_name: str, affinity_key: Optional[str] = None
+) -> str:
     """
     Get worker address based on the requested model
 
+    The worker counts as busy with the request until its response is sent.
+
     :param model_name: The worker's model name
-    :return: Worker address from the controller
+    :param affinity_key: Requests with the same key prefer the same worker
+    :return: Worker address from the cached worker list
     :raises: :class:`ValueError`: No available worker for requested model
     """
-    controller_address = app_settings.controller_address
-    worker_addr = await fetch_remote(
-        controller_address + "/get_worker_address", {"model": model_name}, "address"
-    )
+    worker_addr = await worker_cache.pick_worker(model_name, affinity_key)
+    acquired = request_workers.get()
+    if worker_addr and acquired is not None:
+        worker_cache.acquire(worker_addr)
+        acquired.append(worker_addr)
 
     # No available worker
     if worker_addr == "":
@@ -385,20 +778,15 @@ async def get_worker_address(model_name: str) -> str:
 
 
 async def get_conv(model_name: str, worker_addr: str):
-    conv_template = conv_template_map.get((worker_addr, model_name))
-    if conv_template is None:
-        conv_template = await fetch_remote(
-            worker_addr + "/worker_get_conv_template", {"model": model_name}, "conv"
-        )
-        conv_template_map[(worker_addr, model_name)] = conv_template
-    return conv_template
+    details = await worker_cache.get_details(worker_addr, model_name)
+    return details["conv"]
 
 
 @app.get("/v1/models", dependencies=[Depends(check_api_key)])
 async def show_available_models():
     controller_address = app_settings.controller_address
     ret = await fetch_remote(controller_address + "/refresh_all_workers")
-    models = await fetch_remote(controller_address + "/list_models", None, "models")
+    models = await worker_cache.list_models(force=True)
 
     models.sort()
     # TODO: return real model permission details
@@ -418,7 +806,9 @@ async def create_chat_completion(request: ChatCompletionRequest):
     if error_check_ret is not None:
         return error_check_ret
 
-    worker_addr = await get_worker_address(request.model)
+    worker_addr = await get_worker_address(
+        request.model, get_affinity_key(request.messages)
+    )
 
     gen_params = await get_gen_params(
         request.model,
@@ -550,7 +940,9 @@ async def create_completion(request: CompletionRequest):
 
     request.prompt = process_input(request.model, request.prompt)
 
-    worker_addr = await get_worker_address(request.model)
+    worker_addr = await get_worker_address(
+        request.model, get_affinity_key(request.prompt)
+    )
     for text in request.prompt:
         max_tokens, error_check_ret = await check_length(
             request, text, request.max_tokens, worker_addr
@@ -678,29 +1070,43 @@ async def generate_completion_stream_generator(
 
 
 async def generate_completion_stream(payload: Dict[str, Any], worker_addr: str):
-    controller_address = app_settings.controller_address
-    async with httpx.AsyncClient() as client:
-        delimiter = b"\0"
-        async with client.stream(
-            "POST",
-            worker_addr + "/worker_generate_stream",
-            headers=headers,
+    url = worker_addr + "/worker_generate_stream"
+    start = time.perf_counter()
+    first_chunk = True
+    try:
+        async with upstream_clients.get(url).post(
+            url,
             json=payload,
-            timeout=WORKER_API_TIMEOUT,
+            timeout=stream_timeout,
         ) as response:
-            # content = await response.aread()
+            delimiter = b"\0"
             buffer = b""
-            async for raw_chunk in response.aiter_raw():
+            async for raw_chunk in response.content.iter_any():
+                if first_chunk:
+                    record_latency(
+                        "worker_generate_stream_first_chunk",
+                        time.perf_counter() - start,
+                    )
+                    first_chunk = False
                 buffer += raw_chunk
                 while (chunk_end := buffer.find(delimiter)) >= 0:
                     chunk, buffer = buffer[:chunk_end], buffer[chunk_end + 1 :]
                     if not chunk:
                         continue
                     yield json.loads(chunk.decode())
+    except aiohttp.ClientConnectionError:
+        worker_cache.invalidate(worker_addr)
+        raise
+    finally:
+        record_latency("worker_generate_stream", time.perf_counter() - start)
 
 
 async def generate_completion(payload: Dict[str, Any], worker_addr: str):
-    return await fetch_remote(worker_addr + "/worker_generate", payload, "")
+    try:
+        return await fetch_remote(worker_addr + "/worker_generate", payload, "")
+    except aiohttp.ClientConnectionError:
+        worker_cache.invalidate(worker_addr)
+        raise
 
 
 @app.post("/v1/embeddings", dependencies=[Depends(check_api_key)])
@@ -773,17 +1179,9 @@ async def count_tokens(request: APITokenCheckRequest):
     for item in request.prompts:
         worker_addr = await get_worker_address(item.model)
 
-        context_len = await fetch_remote(
-            worker_addr + "/model_details",
-            {"prompt": item.prompt, "model": item.model},
-            "context_length",
-        )
-
-        token_num = await fetch_remote(
-            worker_addr + "/count_token",
-            {"prompt": item.prompt, "model": item.model},
-            "count",
-        )
+        details = await worker_cache.get_details(worker_addr, item.model)
+        context_len = details["context_length"]
+        token_num = await worker_cache.count_token(worker_addr, item.model, item.prompt)
 
         can_fit = True
         if token_num + item.max_tokens > context_len:
@@ -808,7 +1206,9 @@ async def create_chat_completion(request: APIChatCompletionRequest):
     if error_check_ret is not None:
         return error_check_ret
 
-    worker_addr = await get_worker_address(request.model)
+    worker_addr = await get_worker_address(
+        request.model, get_affinity_key(request.messages)
+    )
 
     gen_params = await get_gen_params(
         request.model,
@@ -872,6 +1272,12 @@ async def create_chat_completion(request: APIChatCompletionRequest):
     return ChatCompletionResponse(model=request.model, choices=choices, usage=usage)
 
 
+@app.get("/metrics")
+async def metrics():
+    """Latency histograms in the Prometheus text format."""
+    return PlainTextResponse(latency_stats.render())
+
+
 ### END GENERAL API - NOT OPENAI COMPATIBLE ###
 
 
@@ -901,6 +1307,46 @@ def create_openai_api_server():
         type=lambda s: s.split(","),
         help="Optional list of comma separated API keys",
     )
+    parser.add_argument(
+        "--upstream-max-connections",
+        type=int,
+        default=100,
+        help="The maximum number of pooled connections to each upstream (the controller and each worker).",
+    )
+    parser.add_argument(
+        "--upstream-keepalive-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds an idle upstream connection is kept alive.",
+    )
+    parser.add_argument(
+        "--worker-cache-ttl",
+        type=float,
+        default=10.0,
+        help="Seconds the worker list of the controller is cached.",
+    )
+    parser.add_argument(
+        "--local-token-count",
+        action="store_true",
+        help="Count prompt tokens with the tokenizers of the models, loaded in the API server from the model paths reported by the workers, instead of asking the workers.",
+    )
+    parser.add_argument(
+        "--trust-remote-code",
+        action="store_true",
+        help="With --local-token-count, allow the tokenizers to run custom code from their model paths.",
+    )
+    parser.add_argument(
+        "--dispatch-method",
+        type=str,
+        choices=["least_outstanding", "power_of_two", "lottery"],
+        default="least_outstanding",
+        help="How a worker is picked for a request, from the requests in flight or the worker speeds.",
+    )
+    parser.add_argument(
+        "--prefix-affinity",
+        action="store_true",
+        help="Send the requests sharing a prompt prefix (e.g. the turns of a conversation) to the same worker, unless it is overloaded.",
+    )
     parser.add_argument(
         "--ssl",
         action="store_true",
@@ -919,6 +1365,13 @@ def create_openai_api_server():
     )
     app_settings.controller_address = args.controller_address
     app_settings.api_keys = args.api_keys
+    app_settings.upstream_max_connections = args.upstream_max_connections
+    app_settings.upstream_keepalive_timeout = args.upstream_keepalive_timeout
+    app_settings.worker_cache_ttl = args.worker_cache_ttl
+    app_settings.local_token_count = args.local_token_count
+    app_settings.trust_remote_code = args.trust_remote_code
+    app_settings.dispatch_method = args.dispatch_method
+    app_settings.prefix_affinity = args.prefix_affinity
 
     logger.info(f"args: {args}")
     return args
@@ -0,0 +1,212 @@
+"""
+A worker-side cache of KV caches, reused across requests sharing a prompt prefix.
+
+In a multi-turn chat, the prompt of each turn starts with the previous turns.
+After a generation, the KV cache of its tokens is kept, so the next turn only
+prefills the tokens that follow the longest cached prefix.
+
+Usage:
+python3 -m fastchat.serve.model_worker --model-path lmsys/vicuna-7b-v1.5 --prefix-cache-gb 4 --prefix-cache-cpu-gb 16
+"""
+from collections import OrderedDict
+import itertools
+import threading
+from typing import List, Optional, Tuple
+
+from fastchat.serve.inference import get_kv_tensors, make_kv_cache
+
+
+def is_prefix_cacheable(past_key_values) -> bool:
+    """Whether the cache keeps the keys and values of every token of every layer.
+
+    Caches of other types (e.g. sliding window or quantized) are not reused.
+    """
+    if isinstance(past_key_values, tuple):
+        return True
+    if type(past_key_values).__name__ != "DynamicCache":
+        return False
+    layers = getattr(past_key_values, "layers", [])
+    return all(type(layer).__name__ == "DynamicLayer" for layer in layers)
+
+
+class CacheEntry:
+    def __init__(self, token_ids: List[int], kv_tensors, cache_type, hashes):
+        self.token_ids = token_ids
+        self.kv_tensors = kv_tensors
+        self.cache_type = cache_type
+        self.hashes = hashes
+        self.device = kv_tensors[0][0].device
+        self.offloaded = False
+        self.nbytes = sum(
+            k.numel() * k.element_size() + v.numel() * v.element_size()
+            for k, v in kv_tensors
+        )
+
+    def to(self, device):
+        self.kv_tensors = [(k.to(device), v.to(device)) for k, v in self.kv_tensors]
+
+
+class PrefixCache:
+    """LRU cache of KV caches, keyed by the hashes of their token prefixes.
+
+    An entry is indexed by the hash of each of its prefixes whose length is a
+    multiple of `block_size`, so a lookup finds the entry sharing the longest
+    block-aligned prefix, then extends the match token by token. Entries over
+    the GPU budget are moved to the CPU (up to the CPU budget) or dropped,
+    least recently used first. An entry that a new entry extends (e.g. the
+    previous turn of a chat) is dropped, since the new one serves its lookups.
+    """
+
+    def __init__(self, max_gpu_bytes: int, max_cpu_bytes: int = 0, block_size=16):
+        self.max_gpu_bytes = max_gpu_bytes
+        self.max_cpu_bytes = max_cpu_bytes
+        self.block_size = block_size
+
+        self.entries = OrderedDict()  # entry id -> CacheEntry, least recent first
+        self.index = {}  # prefix hash -> entry id
+        self.gpu_bytes = 0
+        self.cpu_bytes = 0
+        self.lock = threading.Lock()
+        self.entry_ids = itertools.count()
+
+        # Stats
+        self.num_lookups = 0
+        self.num_hits = 0
+        self.num_reused_tokens = 0
+
+    def prefix_hashes(self, token_ids: List[int]) -> List[int]:
+        """The hash of each prefix of `token_ids` ending on a block boundary."""
+        hashes = []
+        h = 0
+        for start in range(0, len(token_ids) - self.block_size + 1, self.block_size):
+            h = hash((h, tuple(token_ids[start : start + self.block_size])))
+            hashes.append(h)
+        return hashes
+
+    def _match(self, token_ids: List[int], hashes: List[int]):
+        """Return the entry sharing the longest prefix with `token_ids`, and the
+        length of this prefix."""
+        for j in reversed(range(len(hashes))):
+            entry_id = self.index.get(hashes[j])
+            if entry_id is None:
+                continue
+            entry = self.entries[entry_id]
+            start = (j + 1) * self.block_size
+            if entry.token_ids[:start] != token_ids[:start]:  # hash collision
+                continue
+            n = start
+            for a, b in zip(entry.token_ids[start:], token_ids[start:]):
+                if a != b:
+                    break
+                n += 1
+            return entry_id, n
+        return None, 0
+
+    def get(self, token_ids: List[int]) -> Tuple[int, Optional[object]]:
+        """Return the number of leading tokens of `token_ids` that are cached, and
+        a KV cache of these tokens (None if there is no match).
+
+        At least the last token is left out, to compute the logits of the next one.
+        """
+        token_ids = list(token_ids)
+        hashes = self.prefix_hashes(token_ids)
+        with self.lock:
+            self.num_lookups += 1
+            entry_id, n = self._match(token_ids, hashes)
+            n = min(n, len(token_ids) - 1)
+            if entry_id is None or n <= 0:
+                return 0, None
+            entry = self.entries[entry_id]
+            self.entries.move_to_end(entry_id)
+            if entry.offloaded:
+                entry.to(entry.device)
+                entry.offloaded = False
+                self.cpu_bytes -= entry.nbytes
+                self.gpu_bytes += entry.nbytes
+                self._evict()
+            kv_tensors = [(k[:, :, :n], v[:, :, :n]) for k, v in entry.kv_tensors]
+            self.num_hits += 1
+            self.num_reused_tokens += n
+        return n, make_kv_cache(kv_tensors, entry.cache_type)
+
+    def put(self, token_ids: List[int], past_key_values):
+        """Cache the KV cache of `token_ids` (one sequence)."""
+        if past_key_values is None or not is_prefix_cacheable(past_key_values):
+            return
+        kv_tensors = get_kv_tensors(past_key_values)
+        if kv_tensors[0][0].shape[0] == 1:
+            self.add(token_ids, kv_tensors, type(past_key_values))
+
+    def add(self, token_ids: List[int], kv_tensors, cache_type):
+        """Cache the (key, value) tensors of each layer for `token_ids`.
+
+        The tensors are kept as they are, so they must not be views of larger
+        tensors (e.g. of a batch), or these would stay in memory.
+        """
+        cache_len = kv_tensors[0][0].shape[2]
+        token_ids = list(token_ids[:cache_len])
+        hashes = self.prefix_hashes(token_ids)
+        if len(token_ids) < cache_len or not hashes:
+            return
+        entry = CacheEntry(token_ids, kv_tensors, cache_type, hashes)
+        if entry.nbytes > self.max_gpu_bytes:
+            return
+
+        with self.lock:
+            old_id, n = self._match(token_ids, hashes)
+            if old_id is not None:
+                old = self.entries[old_id]
+                if n == len(token_ids):  # Already cached
+                    self.entries.move_to_end(old_id)
+                    return
+                if n >= len(old.token_ids) - self.block_size:
+                    # Extended by the new entry (but for its end, which the
+                    # next turn may tokenize differently)
+                    self._remove(old_id)
+
+            entry_id = next(self.entry_ids)
+            self.entries[entry_id] = entry
+            for h in hashes:
+                self.index[h] = entry_id
+            self.gpu_bytes += entry.nbytes
+            self._evict()
+
+    def _remove(self, entry_id):
+        entry = self.entries.pop(entry_id)
+        for h in entry.hashes:
+            if self.index.get(h) == entry_id:
+                del self.index[h]
+        if entry.offloaded:
+            self.cpu_bytes -= entry.nbytes
+        else:
+            self.gpu_bytes -= entry.nbytes
+
+    def _evict(self):
+        """Offload or drop the least recently used entries over the budgets."""
+        for entry_id, entry in list(self.entries.items()):
+            if self.gpu_bytes <= self.max_gpu_bytes:
+                break
+            if entry.offloaded:
+                continue
+            if entry.nbytes <= self.max_cpu_bytes:
+                entry.to("cpu")
+                entry.offloaded = True
+                self.gpu_bytes -= entry.nbytes
+                self.cpu_bytes += entry.nbytes
+            else:
+                self._remove(entry_id)
+
+        for entry_id, entry in list(self.entries.items()):
+            if self.cpu_bytes <= self.max_cpu_bytes:
+                break
+            if entry.offloaded:
+                self._remove(entry_id)
+
+    def get_stats(self) -> str:
+        return (
+            f"entries: {len(self.entries)}, "
+            f"GPU: {self.gpu_bytes / 2**30:.2f} GiB, "
+            f"CPU: {self.cpu_bytes / 2**30:.2f} GiB, "
+            f"hits: {self.num_hits}/{self.num_lookups}, "
+            f"reused tokens: {self.num_reused_tokens}"
+        )
@@ -238,7 +238,7 @@ async def api_get_conv(request: Request):
 
 @app.post("/model_details")
 async def api_model_details(request: Request):
-    return {"context_length": worker.context_len}
+    return {"context_length": worker.context_len, "model_path": worker.model_path}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+"""
+Usage:
+python3 -m unittest tests.test_continuous_batching
+"""
+
+import threading
+import time
+import unittest
+
+from fastchat.serve.continuous_batching import ContinuousBatchingEngine
+from fastchat.serve.inference import generate_stream
+from tests.tiny_model import make_tiny_model
+
+
+CONTEXT_LEN = 2048
+STREAM_INTERVAL = 2
+REQUESTS = [
+    {"prompt": "Hi", "max_new_tokens": 40},
+    {
+        "prompt": "Write a short story about a robot who learns to paint.",
+        "max_new_tokens": 7,
+        "echo": False,
+    },
+    {
+        "prompt": "What are the main differences between Python and JavaScript?",
+        "max_new_tokens": 25,
+        "repetition_penalty": 1.3,
+    },
+    {"prompt": "Name three colors.", "max_new_tokens": 16, "stop": ["e", "a"]},
+    {
+        "prompt": "Explain how a bill becomes a law, step by step, "
+        "and give an example from recent history.",
+        "max_new_tokens": 32,
+        "echo": False,
+    },
+]
+
+
+class TestContinuousBatching(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model, cls.tokenizer = make_tiny_model([r["prompt"] for r in REQUESTS])
+
+    def test_greedy_matches_generate_stream(self):
+        requests = [dict(r, temperature=0.0) for r in REQUESTS]
+        expected = [
+            list(
+                generate_stream(
+                    self.model,
+                    self.tokenizer,
+                    dict(params),
+                    "cpu",
+                    CONTEXT_LEN,
+                    STREAM_INTERVAL,
+                )
+            )
+            for params in requests
+        ]
+
+        # Fewer slots than requests, so some requests join a running batch.
+        engine = ContinuousBatchingEngine(
+            self.model,
+            self.tokenizer,
+            CONTEXT_LEN,
+            STREAM_INTERVAL,
+            max_batch_size=3,
+        )
+        outputs = [None] * len(requests)
+
+        def run(i):
+            outputs[i] = list(engine.generate_stream(dict(requests[i])))
+
+        threads = [
+            threading.Thread(target=run, args=(i,)) for i in range(len(requests))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i, (expected_chunks, chunks) in enumerate(zip(expected, outputs)):
+            with self.subTest(request=i):
+                self.assertEqual(chunks, expected_chunks)
+        self.assertEqual(
+            [chunks[-1]["usage"]["completion_tokens"] for chunks in outputs],
+            [chunks[-1]["usage"]["completion_tokens"] for chunks in expected],
+        )
+
+        # Every row has left the batch and its KV cache is freed.
+        time.sleep(0.1)
+        self.assertEqual(engine.running, [])
+        self.assertIsNone(engine.past_key_values)
+
+
+if __name__ == "__main__":
+    unittest.main()
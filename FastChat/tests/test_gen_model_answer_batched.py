@@ -0,0 +1,97 @@
+"""
+Usage:
+python3 -m unittest tests.test_gen_model_answer_batched
+"""
+
+import unittest
+
+import torch
+
+from fastchat.llm_judge.gen_model_answer import get_batch_answers, postprocess_output
+from fastchat.model import get_conversation_template
+from tests.tiny_model import make_tiny_model
+
+
+MODEL_ID = "vicuna"
+MAX_NEW_TOKEN = 24
+QUESTIONS = [
+    {
+        "question_id": 1,
+        "category": "math",
+        "turns": ["What is 3 + 4?", "And times two?"],
+    },
+    {
+        "question_id": 2,
+        "category": "coding",
+        "turns": [
+            "Write a function that reverses a string, then explain how it works.",
+            "Now make it handle unicode.",
+        ],
+    },
+    {
+        "question_id": 3,
+        "category": "reasoning",
+        "turns": ["Why is the sky blue?", "Explain it to a child."],
+    },
+]
+
+
+def generate_answers(model, tokenizer, question):
+    """The unbatched loop of `get_model_answers`, on CPU and greedy."""
+    conv = get_conversation_template(MODEL_ID)
+    turns = []
+    for qs in question["turns"]:
+        conv.append_message(conv.roles[0], qs)
+        conv.append_message(conv.roles[1], None)
+        input_ids = tokenizer([conv.get_prompt()]).input_ids
+        output_ids = model.generate(
+            torch.as_tensor(input_ids),
+            do_sample=False,
+            max_new_tokens=MAX_NEW_TOKEN,
+        )
+        output_ids = output_ids[0][len(input_ids[0]) :]
+        output = postprocess_output(output_ids, conv, tokenizer)
+        conv.update_last_message(output)
+        turns.append(output)
+    return turns
+
+
+class TestBatchedAnswers(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        texts = [t for q in QUESTIONS for t in q["turns"]]
+        cls.model, cls.tokenizer = make_tiny_model(texts * 3)
+        # The tokenizer has no padding token, so the batch pads with the EOS id.
+        assert cls.tokenizer.pad_token_id is None
+        # Make EOS likely enough that some answers stop early, so that the
+        # repetition penalty must not see the padding as previous tokens.
+        with torch.no_grad():
+            cls.model.lm_head.weight[cls.tokenizer.eos_token_id] *= 1.7
+
+    def check_greedy_equivalence(self, repetition_penalty):
+        self.model.generation_config.repetition_penalty = repetition_penalty
+        with torch.inference_mode():
+            expected = [
+                generate_answers(self.model, self.tokenizer, q) for q in QUESTIONS
+            ]
+            choices = get_batch_answers(
+                self.model,
+                self.tokenizer,
+                MODEL_ID,
+                QUESTIONS,
+                MAX_NEW_TOKEN,
+                num_choices=2,
+            )
+        for turns, question_choices in zip(expected, choices):
+            for choice in question_choices:
+                self.assertEqual(choice["turns"], turns)
+
+    def test_greedy_matches_generate(self):
+        self.check_greedy_equivalence(repetition_penalty=1.0)
+
+    def test_repetition_penalty_matches_generate(self):
+        self.check_greedy_equivalence(repetition_penalty=1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
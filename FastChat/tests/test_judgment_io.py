@@ -0,0 +1,91 @@
+"""
+Usage:
+python3 -m unittest tests.test_judgment_io
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from fastchat.llm_judge.judgment_io import JudgmentWriter, load_judgments
+
+
+def make_record(i):
+    return {"question_id": i, "model": "m", "judgment": "Rating: [[5]] é" * 10}
+
+
+class TestJudgmentIO(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_concurrently(self, output_file, num_threads=8, per_thread=50):
+        writer = JudgmentWriter(output_file, max_batch_size=16)
+
+        def run(t):
+            for i in range(per_thread):
+                writer.write(make_record(t * per_thread + i))
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.close()
+        return num_threads * per_thread
+
+    def check_writer(self, filename):
+        output_file = os.path.join(self.tmp_dir.name, "judgment", filename)
+        num_records = self.write_concurrently(output_file)
+        # A second run appends to the same file.
+        writer = JudgmentWriter(output_file)
+        writer.write(make_record(num_records))
+        writer.close()
+
+        records = load_judgments(output_file)
+        self.assertEqual(
+            sorted(r["question_id"] for r in records), list(range(num_records + 1))
+        )
+        self.assertEqual(records[0], make_record(records[0]["question_id"]))
+        return output_file
+
+    def test_writer(self):
+        self.check_writer("judge_single.jsonl")
+
+    def test_compressed_writer(self):
+        output_file = self.check_writer("judge_single.jsonl.gz")
+        with gzip.open(output_file, "rt") as fin:
+            self.assertEqual(len(fin.readlines()), 401)
+
+    def test_partial_line_is_ignored(self):
+        output_file = os.path.join(self.tmp_dir.name, "judge_single.jsonl")
+        with open(output_file, "w") as fout:
+            for i in range(3):
+                fout.write(json.dumps(make_record(i)) + "\n")
+            fout.write(json.dumps(make_record(3))[:20])
+        self.assertEqual(
+            load_judgments(output_file), [make_record(i) for i in range(3)]
+        )
+
+    def test_unfinished_gzip_member_is_ignored(self):
+        output_file = os.path.join(self.tmp_dir.name, "judge_single.jsonl.gz")
+        members = [
+            gzip.compress((json.dumps(make_record(i)) + "\n").encode())
+            for i in range(51)
+        ]
+        expected = [make_record(i) for i in range(50)]
+        # Cut in the deflate data, in the trailer and in the header of the last member.
+        for cut in [len(members[-1]) // 2, len(members[-1]) - 4, 5]:
+            with self.subTest(cut=cut):
+                with open(output_file, "wb") as fout:
+                    fout.write(b"".join(members[:-1]) + members[-1][:cut])
+                self.assertEqual(load_judgments(output_file), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
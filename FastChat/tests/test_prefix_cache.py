@@ -0,0 +1,149 @@
+"""
+Usage:
+python3 -m unittest tests.test_prefix_cache
+"""
+
+import unittest
+
+import torch
+from transformers import DynamicCache
+
+from fastchat.model import get_conversation_template
+from fastchat.serve.continuous_batching import ContinuousBatchingEngine
+from fastchat.serve.inference import generate_stream
+from fastchat.serve.prefix_cache import PrefixCache
+from tests.tiny_model import make_tiny_model
+
+
+CONTEXT_LEN = 2048
+USER_TURNS = [
+    "Can you recommend a few books about the history of science?",
+    "Which one is the easiest to read?",
+    "Summarize it in two sentences.",
+]
+
+
+def chat(generate):
+    """Run a greedy multi-turn conversation; return the answer to each turn."""
+    conv = get_conversation_template("vicuna")
+    answers = []
+    for turn in USER_TURNS:
+        conv.append_message(conv.roles[0], turn)
+        conv.append_message(conv.roles[1], None)
+        params = {
+            "prompt": conv.get_prompt(),
+            "temperature": 0.0,
+            "max_new_tokens": 24,
+            "echo": False,
+            "stop": conv.stop_str,
+        }
+        answer = list(generate(params))[-1]["text"].strip()
+        conv.update_last_message(answer)
+        answers.append(answer)
+    return answers
+
+
+def make_kv_tensors(num_tokens, num_layers=2):
+    return [
+        (torch.randn(1, 2, num_tokens, 4), torch.randn(1, 2, num_tokens, 4))
+        for _ in range(num_layers)
+    ]
+
+
+class TestPrefixCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model, cls.tokenizer = make_tiny_model(USER_TURNS * 3)
+
+    def generate(self, params, prefix_cache=None):
+        return generate_stream(
+            self.model,
+            self.tokenizer,
+            params,
+            "cpu",
+            CONTEXT_LEN,
+            prefix_cache=prefix_cache,
+        )
+
+    def test_generate_stream_reuses_previous_turns(self):
+        expected = chat(self.generate)
+        prefix_cache = PrefixCache(max_gpu_bytes=2**30)
+        answers = chat(lambda params: self.generate(params, prefix_cache))
+
+        self.assertEqual(answers, expected)
+        self.assertEqual(prefix_cache.num_lookups, len(USER_TURNS))
+        self.assertEqual(prefix_cache.num_hits, len(USER_TURNS) - 1)
+        self.assertGreater(prefix_cache.num_reused_tokens, 0)
+
+    def test_engine_reuses_previous_turns(self):
+        expected = chat(self.generate)
+        prefix_cache = PrefixCache(max_gpu_bytes=2**30)
+        engine = ContinuousBatchingEngine(
+            self.model, self.tokenizer, CONTEXT_LEN, prefix_cache=prefix_cache
+        )
+        answers = chat(engine.generate_stream)
+
+        self.assertEqual(answers, expected)
+        self.assertEqual(prefix_cache.num_hits, len(USER_TURNS) - 1)
+        self.assertGreater(prefix_cache.num_reused_tokens, 0)
+
+    def test_lookup(self):
+        prefix_cache = PrefixCache(max_gpu_bytes=2**30, block_size=4)
+        token_ids = list(range(40))
+        kv_tensors = make_kv_tensors(40)
+        prefix_cache.add(token_ids, kv_tensors, DynamicCache)
+
+        # A longer prompt reuses all the cached tokens.
+        num_cached, past_key_values = prefix_cache.get(token_ids + [99, 98])
+        self.assertEqual(num_cached, 40)
+        self.assertEqual(past_key_values.get_seq_length(), 40)
+        self.assertTrue(torch.equal(past_key_values.layers[0].keys, kv_tensors[0][0]))
+        # The same prompt leaves its last token out, to compute its logits.
+        self.assertEqual(prefix_cache.get(token_ids)[0], 39)
+        # A diverging prompt reuses the common prefix, token by token.
+        self.assertEqual(prefix_cache.get(token_ids[:10] + [99] * 5)[0], 10)
+        # A prompt shorter than a block is not looked up.
+        self.assertEqual(prefix_cache.get(token_ids[:3]), (0, None))
+
+        # The next turn of the conversation supersedes the entry.
+        prefix_cache.add(token_ids + [99] * 20, make_kv_tensors(60), DynamicCache)
+        self.assertEqual(len(prefix_cache.entries), 1)
+        self.assertEqual(prefix_cache.get(token_ids + [99] * 30)[0], 60)
+
+    def test_offload_and_evict(self):
+        bytes_per_token = 2 * 2 * 2 * 4 * 4  # layers * (k, v) * heads * dim * float32
+        prefix_cache = PrefixCache(
+            max_gpu_bytes=100 * bytes_per_token,
+            max_cpu_bytes=100 * bytes_per_token,
+            block_size=4,
+        )
+        first = list(range(60))
+        prefix_cache.add(first, make_kv_tensors(60), DynamicCache)
+        prefix_cache.add(list(range(100, 160)), make_kv_tensors(60), DynamicCache)
+
+        # Over the GPU budget: the least recently used entry is offloaded.
+        self.assertEqual(
+            [e.offloaded for e in prefix_cache.entries.values()], [True, False]
+        )
+        self.assertEqual(prefix_cache.gpu_bytes, 60 * bytes_per_token)
+        self.assertEqual(prefix_cache.cpu_bytes, 60 * bytes_per_token)
+
+        # A hit moves the offloaded entry back, and offloads the other one.
+        self.assertEqual(prefix_cache.get(first + [1])[0], 60)
+        self.assertEqual(
+            [e.token_ids[0] for e in prefix_cache.entries.values() if e.offloaded],
+            [100],
+        )
+
+        # Over the CPU budget too: the least recently used entry is dropped.
+        prefix_cache.add(list(range(200, 260)), make_kv_tensors(60), DynamicCache)
+        self.assertEqual(
+            [e.token_ids[0] for e in prefix_cache.entries.values()], [0, 200]
+        )
+        self.assertEqual(prefix_cache.get(list(range(100, 160)))[0], 0)
+        self.assertLessEqual(prefix_cache.gpu_bytes, prefix_cache.max_gpu_bytes)
+        self.assertLessEqual(prefix_cache.cpu_bytes, prefix_cache.max_cpu_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
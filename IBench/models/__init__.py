@@ -4,6 +4,7 @@ IBench models package
 
 from .local_model import LocalModel
 from .api_model import APIModel
+from .generation_backends import VLLMModel, OpenAICompatibleModel, create_generation_model
 from .model_configs import (
     get_model_config,
     list_available_models,
@@ -14,6 +15,9 @@ from .model_configs import (
 __all__ = [
     'LocalModel',
     'APIModel',
+    'VLLMModel',
+    'OpenAICompatibleModel',
+    'create_generation_model',
     'get_model_config',
     'list_available_models',
     'register_model',
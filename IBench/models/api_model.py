@@ -3,24 +3,62 @@ API Model Wrapper
 Handles API-based models (Qwen from Dashscope)
 """
 import os
-from typing import List, Optional
-from openai import OpenAI
+import re
+import json
+import asyncio
+import threading
+import weakref
+from typing import Callable, List, Optional, Tuple
+from openai import OpenAI, AsyncOpenAI
 from IBench.utils.common import Message
 from IBench.models.model_configs import ModelConfig
+from IBench.models.judge_cache import JudgeCache
+
+JUDGE_SYSTEM_PROMPT = "你是一个客观公正的评估者。请根据给定的规则评估模型的回复。\n\n请仔细阅读回复内容，并判断是否违反了规则。\n- 如果违反了规则，返回 \"VIOLATED\"\n- 如果没有违反规则，返回 \"NOT_VIOLATED\"\n- 只返回上述两个选项之一，不要返回其他内容。"
+
+BATCH_JUDGE_SYSTEM_PROMPT = """你是一个客观公正的评估者。请根据给定的多条规则逐条评估模型的回复。
+
+请仔细阅读回复内容，分别判断是否违反了每一条规则，各条规则之间相互独立。
+请只返回一个JSON数组，每条规则对应一个元素，格式如下：
+[{"id": 1, "verdict": "VIOLATED", "reason": "简要理由"}, {"id": 2, "verdict": "NOT_VIOLATED", "reason": "简要理由"}]
+- verdict 只能是 "VIOLATED" 或 "NOT_VIOLATED"
+- id 与规则编号一一对应，不要遗漏任何规则
+- 不要返回JSON数组以外的任何内容。"""
+
+# 批量 judge 每条规则预留的输出 token 数（verdict + 简要理由）
+BATCH_JUDGE_TOKENS_PER_RULE = 80
+
+PRECONDITION_SYSTEM_PROMPT = """你是一个客观公正的评估者。请根据对话上下文判断前置条件是否满足。
+
+请仔细阅读对话内容，判断是否符合给定的前置条件。
+- 如果满足前置条件，返回 "SATISFIED"
+- 如果不满足前置条件，返回 "NOT_SATISFIED"
+- 只返回上述两个选项之一，不要返回其他内容。"""
 
 class APIModel:
     """API-based model wrapper for Qwen (Dashscope)"""
     
-    def __init__(self, config: ModelConfig, model_name: str):
+    def __init__(
+        self,
+        config: ModelConfig,
+        model_name: str,
+        max_concurrency: Optional[int] = None,
+        judge_cache: Optional[JudgeCache] = None
+    ):
         """
         Initialize API model
         
         Args:
             config: Model configuration
             model_name: Specific model name to use (e.g., "qwen-plus", "qwen-max")
+            max_concurrency: Max in-flight async judge calls per event loop
+                (overrides config.judge_max_concurrency)
+            judge_cache: Optional persistent judge verdict cache
         """
         self.config = config
         self.model_name = model_name
+        self.max_concurrency = max_concurrency or config.judge_max_concurrency
+        self.judge_cache = judge_cache
         
         if not config.api_key:
             raise ValueError("API key is required for APIModel. Please set DASHSCOPE_API_KEY.")
@@ -31,8 +69,121 @@ class APIModel:
             base_url=config.api_base
         )
         
+        # AsyncOpenAI 客户端与 event loop 绑定，每个 loop 单独创建（线程池中每个线程各自 asyncio.run）
+        self._async_state = weakref.WeakKeyDictionary()
+        self._async_state_lock = threading.Lock()
+        
         print(f"API Model initialized: {model_name}")
     
+    def _get_async_client(self) -> Tuple[AsyncOpenAI, asyncio.Semaphore]:
+        """
+        Get the AsyncOpenAI client and concurrency semaphore for the running event loop
+        
+        Returns:
+            Tuple of (client, semaphore)
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_state_lock:
+            state = self._async_state.get(loop)
+            if state is None:
+                state = (
+                    AsyncOpenAI(
+                        api_key=self.config.api_key,
+                        base_url=self.config.api_base
+                    ),
+                    asyncio.Semaphore(self.max_concurrency)
+                )
+                self._async_state[loop] = state
+        return state
+    
+    def _judge_completion(
+        self,
+        messages: List[dict],
+        max_tokens: int,
+        is_valid: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        """
+        Run a deterministic (temperature=0) judge request, through the verdict cache if enabled
+        
+        Args:
+            messages: Judge chat messages
+            max_tokens: Max output tokens
+            is_valid: Optional check deciding whether the output may be cached
+            
+        Returns:
+            Raw judge output text
+        """
+        key, cached = self._cache_lookup(messages, max_tokens)
+        if cached is not None:
+            return cached
+        
+        completion = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            temperature=0.0,
+            max_tokens=max_tokens
+        )
+        content = completion.choices[0].message.content
+        self._cache_store(key, content, is_valid)
+        return content
+    
+    async def _ajudge_completion(
+        self,
+        messages: List[dict],
+        max_tokens: int,
+        is_valid: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        """Async version of _judge_completion (bounded by max_concurrency)"""
+        key, cached = self._cache_lookup(messages, max_tokens)
+        if cached is not None:
+            return cached
+        
+        client, semaphore = self._get_async_client()
+        async with semaphore:
+            completion = await client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.0,
+                max_tokens=max_tokens
+            )
+        content = completion.choices[0].message.content
+        self._cache_store(key, content, is_valid)
+        return content
+    
+    def _cache_lookup(self, messages: List[dict], max_tokens: int) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look up the verdict cache
+        
+        Returns:
+            Tuple of (cache key, cached output); key is None if cache disabled
+        """
+        if self.judge_cache is None:
+            return None, None
+        key = JudgeCache.make_key(self.model_name, messages, max_tokens)
+        return key, self.judge_cache.get(key)
+    
+    def _cache_store(
+        self,
+        key: Optional[str],
+        content: Optional[str],
+        is_valid: Optional[Callable[[str], bool]] = None
+    ):
+        """Store judge output in the verdict cache (errors and invalid outputs are not cached)"""
+        if key is None or content is None:
+            return
+        if is_valid is not None and not is_valid(content):
+            return
+        self.judge_cache.put(key, self.model_name, content)
+    
+    def cache_stats(self) -> Optional[dict]:
+        """
+        Get judge verdict cache statistics
+        
+        Returns:
+            Stats dict, or None if cache disabled
+        """
+        return self.judge_cache.stats() if self.judge_cache is not None else None
+    
     def _format_messages(self, messages: List[Message]) -> List[dict]:
         """
         Convert Message objects to OpenAI format
@@ -110,17 +261,246 @@ class APIModel:
         Returns:
             Tuple of (passed: bool, reason: str)
         """
-        system_prompt = "你是一个客观公正的评估者。请根据给定的规则评估模型的回复。\n\n请仔细阅读回复内容，并判断是否违反了规则。\n- 如果违反了规则，返回 \"VIOLATED\"\n- 如果没有违反规则，返回 \"NOT_VIOLATED\"\n- 只返回上述两个选项之一，不要返回其他内容。"
+        messages = self._build_judge_messages(response, rule_description, context, N)
+        
+        try:
+            result = self._judge_completion(messages, max_tokens=10).strip()
+            passed = "NOT_VIOLATED" in result
+            
+            return passed, result
+        
+        except Exception as e:
+            print(f"Error in judge evaluation: {e}")
+            return False, f"Evaluation error: {str(e)}"
+    
+    async def aevaluate_with_judge(
+        self,
+        response: str,
+        rule_description: str,
+        context: Optional[str] = None,
+        N: Optional[int] = None
+    ) -> tuple[bool, str]:
+        """
+        Async version of evaluate_with_judge (AsyncOpenAI, bounded by max_concurrency)
+        
+        Args:
+            response: The response to evaluate
+            rule_description: The rule to check against
+            context: Optional context (conversation history)
+            N: Optional N value for dynamic description replacement
+            
+        Returns:
+            Tuple of (passed: bool, reason: str)
+        """
+        messages = self._build_judge_messages(response, rule_description, context, N)
+        try:
+            result = (await self._ajudge_completion(messages, max_tokens=10)).strip()
+            passed = "NOT_VIOLATED" in result
+            
+            return passed, result
+        
+        except Exception as e:
+            print(f"Error in judge evaluation: {e}")
+            return False, f"Evaluation error: {str(e)}"
+    
+    def evaluate_with_judge_batch(
+        self,
+        response: str,
+        rule_descriptions: List[str],
+        context: Optional[str] = None
+    ) -> List[tuple[bool, str]]:
+        """
+        Judge several rules against the same response in one request
+        
+        The judge returns a JSON verdict per rule; if the reply cannot be parsed,
+        falls back to one evaluate_with_judge call per rule.
+        
+        Args:
+            response: The response to evaluate
+            rule_descriptions: Final rule descriptions (N already substituted)
+            context: Optional context (conversation history)
+            
+        Returns:
+            List of (passed: bool, reason: str), in rule_descriptions order
+        """
+        if not rule_descriptions:
+            return []
+        if len(rule_descriptions) == 1:
+            return [self.evaluate_with_judge(response, rule_descriptions[0], context)]
+        
+        messages = self._build_batch_judge_messages(response, rule_descriptions, context)
+        
+        num_rules = len(rule_descriptions)
+        
+        try:
+            content = self._judge_completion(
+                messages,
+                max_tokens=BATCH_JUDGE_TOKENS_PER_RULE * num_rules,
+                is_valid=lambda text: self._parse_batch_verdicts(text, num_rules) is not None
+            )
+            verdicts = self._parse_batch_verdicts(content, num_rules)
+        except Exception as e:
+            print(f"Error in batch judge evaluation: {e}")
+            verdicts = None
+        
+        if verdicts is not None:
+            return verdicts
+        
+        print(f"⚠ 批量 judge 结果解析失败，降级为逐条评估（{len(rule_descriptions)}条规则）")
+        return [
+            self.evaluate_with_judge(response, description, context)
+            for description in rule_descriptions
+        ]
+    
+    async def aevaluate_with_judge_batch(
+        self,
+        response: str,
+        rule_descriptions: List[str],
+        context: Optional[str] = None
+    ) -> List[tuple[bool, str]]:
+        """
+        Async version of evaluate_with_judge_batch
+        
+        Args:
+            response: The response to evaluate
+            rule_descriptions: Final rule descriptions (N already substituted)
+            context: Optional context (conversation history)
+            
+        Returns:
+            List of (passed: bool, reason: str), in rule_descriptions order
+        """
+        if not rule_descriptions:
+            return []
+        if len(rule_descriptions) == 1:
+            return [await self.aevaluate_with_judge(response, rule_descriptions[0], context)]
+        
+        messages = self._build_batch_judge_messages(response, rule_descriptions, context)
+        num_rules = len(rule_descriptions)
+        
+        try:
+            content = await self._ajudge_completion(
+                messages,
+                max_tokens=BATCH_JUDGE_TOKENS_PER_RULE * num_rules,
+                is_valid=lambda text: self._parse_batch_verdicts(text, num_rules) is not None
+            )
+            verdicts = self._parse_batch_verdicts(content, num_rules)
+        except Exception as e:
+            print(f"Error in batch judge evaluation: {e}")
+            verdicts = None
+        
+        if verdicts is not None:
+            return verdicts
+        
+        print(f"⚠ 批量 judge 结果解析失败，降级为逐条评估（{len(rule_descriptions)}条规则）")
+        return list(await asyncio.gather(*[
+            self.aevaluate_with_judge(response, description, context)
+            for description in rule_descriptions
+        ]))
+    
+    @staticmethod
+    def _build_batch_judge_messages(
+        response: str,
+        rule_descriptions: List[str],
+        context: Optional[str] = None
+    ) -> List[dict]:
+        """Build batched judge chat messages"""
+        rules_text = "\n".join(
+            f"{i}. {description}" for i, description in enumerate(rule_descriptions, 1)
+        )
+        
+        user_prompt = f"""规则列表:
+{rules_text}
+
+模型回复: {response}
+
+{f'上下文: {context}' if context else ''}
+
+判断（JSON数组）:"""
+        
+        return [
+            {"role": "system", "content": BATCH_JUDGE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    @staticmethod
+    def _parse_batch_verdicts(text: Optional[str], num_rules: int) -> Optional[List[tuple[bool, str]]]:
+        """
+        Parse the JSON verdict array returned by the batched judge
         
+        Args:
+            text: Raw judge output
+            num_rules: Number of rules sent in the request
+            
+        Returns:
+            List of (passed, reason) in rule order, or None if the output is malformed
+        """
+        if not text:
+            return None
+        
+        # 兼容 ```json ... ``` 包裹以及前后多余文字
+        match = re.search(r"\[.*\]", text, flags=re.DOTALL)
+        if not match:
+            return None
+        
+        try:
+            items = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+        
+        if not isinstance(items, list):
+            return None
+        
+        verdict_by_id = {}
+        for item in items:
+            if not isinstance(item, dict):
+                return None
+            try:
+                rule_idx = int(item.get("id"))
+            except (TypeError, ValueError):
+                return None
+            verdict = str(item.get("verdict", "")).strip().upper()
+            if verdict not in ("VIOLATED", "NOT_VIOLATED"):
+                return None
+            reason = str(item.get("reason", "")).strip()
+            verdict_by_id[rule_idx] = (
+                verdict == "NOT_VIOLATED",
+                f"{verdict}: {reason}" if reason else verdict
+            )
+        
+        if set(verdict_by_id) != set(range(1, num_rules + 1)):
+            return None
+        
+        return [verdict_by_id[i] for i in range(1, num_rules + 1)]
+    
+    @staticmethod
+    def _resolve_description(rule_description: str, N: Optional[int] = None) -> str:
+        """
+        Replace the N placeholder in a rule description
+        
+        Args:
+            rule_description: Rule description, may contain {N} or N
+            N: Optional N value
+            
+        Returns:
+            Final rule description
+        """
         # 如果包含 {N} 且提供了 N 值，进行替换
-        final_description = rule_description
         if N is not None and "{N}" in rule_description:
-            final_description = rule_description.replace("{N}", str(N))
+            return rule_description.replace("{N}", str(N))
         # 也支持直接替换 "N"（不带花括号）
         elif N is not None and "N" in rule_description:
-            final_description = rule_description.replace("N", str(N))
-        else:
-            final_description = rule_description
+            return rule_description.replace("N", str(N))
+        return rule_description
+    
+    def _build_judge_messages(
+        self,
+        response: str,
+        rule_description: str,
+        context: Optional[str] = None,
+        N: Optional[int] = None
+    ) -> List[dict]:
+        """Build judge chat messages (shared by sync and async paths)"""
+        final_description = self._resolve_description(rule_description, N)
         
         user_prompt = f"""规则描述: {final_description}
 
@@ -130,25 +510,10 @@ class APIModel:
 
 判断:"""
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.0,
-                max_tokens=10
-            )
-            
-            result = response.choices[0].message.content.strip()
-            passed = "NOT_VIOLATED" in result
-            
-            return passed, result
-        
-        except Exception as e:
-            print(f"Error in judge evaluation: {e}")
-            return False, f"Evaluation error: {str(e)}"
+        return [
+            {"role": "system", "content": JUDGE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
     
     def check_precondition(
         self,
@@ -165,34 +530,54 @@ class APIModel:
         Returns:
             bool: 是否满足前置条件
         """
-        system_prompt = """你是一个客观公正的评估者。请根据对话上下文判断前置条件是否满足。
-
-请仔细阅读对话内容，判断是否符合给定的前置条件。
-- 如果满足前置条件，返回 "SATISFIED"
-- 如果不满足前置条件，返回 "NOT_SATISFIED"
-- 只返回上述两个选项之一，不要返回其他内容。"""
-        
-        user_prompt = f"""前置条件: {precondition_description}
-
-对话上下文:
-{conversation_context}
-
-判断:"""
+        messages = self._build_precondition_messages(conversation_context, precondition_description)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.0,
-                max_tokens=10
-            )
+            result = self._judge_completion(messages, max_tokens=10).strip()
+            return "SATISFIED" in result
             
-            result = response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error in precondition check: {e}")
+            return False
+    
+    async def acheck_precondition(
+        self,
+        conversation_context: str,
+        precondition_description: str
+    ) -> bool:
+        """
+        check_precondition 的异步版本
+        
+        Args:
+            conversation_context: 对话上下文（格式化后的字符串）
+            precondition_description: 前置条件描述
+            
+        Returns:
+            bool: 是否满足前置条件
+        """
+        messages = self._build_precondition_messages(conversation_context, precondition_description)
+        try:
+            result = (await self._ajudge_completion(messages, max_tokens=10)).strip()
             return "SATISFIED" in result
             
         except Exception as e:
             print(f"Error in precondition check: {e}")
             return False
+    
+    @staticmethod
+    def _build_precondition_messages(
+        conversation_context: str,
+        precondition_description: str
+    ) -> List[dict]:
+        """Build precondition chat messages (shared by sync and async paths)"""
+        user_prompt = f"""前置条件: {precondition_description}
+
+对话上下文:
+{conversation_context}
+
+判断:"""
+        
+        return [
+            {"role": "system", "content": PRECONDITION_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
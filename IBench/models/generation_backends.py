@@ -0,0 +1,211 @@
+"""
+Generation Backends
+Pluggable generation backends for the evaluated model:
+HuggingFace Transformers (LocalModel), vLLM engine, or any OpenAI-compatible server
+(e.g. FastChat openai_api_server / vllm serve)
+
+所有后端都使用 format_chat_prompt 构造 prompt（与 LocalModel._format_messages 一致），
+保证不同后端的评估分数可比。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from openai import OpenAI
+from transformers import AutoTokenizer
+
+from IBench.models.local_model import LocalModel, format_chat_prompt
+from IBench.models.model_configs import ModelConfig
+from IBench.utils.common import Message
+
+GENERATION_BACKENDS = ("hf", "vllm", "openai")
+
+
+class VLLMModel:
+    """Generation backend using a local vLLM engine (continuous batching)"""
+
+    def __init__(self, config: ModelConfig):
+        """
+        Initialize vLLM engine
+
+        Args:
+            config: Model configuration
+        """
+        try:
+            from vllm import LLM, SamplingParams
+        except ImportError:
+            raise ImportError("vLLM backend requires vllm. Install with: pip install vllm")
+
+        self.config = config
+        self.system_prompt = config.system_prompt
+
+        print(f"Loading vLLM engine from {config.path}...")
+        self.llm = LLM(
+            model=config.path,
+            trust_remote_code=True,
+            tensor_parallel_size=config.vllm_tensor_parallel_size
+        )
+        self.tokenizer = self.llm.get_tokenizer()
+        self.sampling_params = SamplingParams(
+            temperature=config.temperature,
+            top_p=config.top_p if config.temperature > 0 else 1.0,
+            max_tokens=config.max_new_tokens,
+            repetition_penalty=1.0
+        )
+        # LLM 实例不是线程安全的，评估线程池中的单条 generate 调用需要串行
+        self._lock = threading.Lock()
+
+        print(f"vLLM engine initialized: {config.path}")
+
+    def _format_messages(self, messages: List[Message]) -> str:
+        """Format messages with the same chat template as LocalModel"""
+        return format_chat_prompt(self.tokenizer, messages, self.system_prompt)
+
+    def generate(self, messages: List[Message]) -> str:
+        """
+        Generate response for one conversation
+
+        Args:
+            messages: Conversation history
+
+        Returns:
+            Generated response text
+        """
+        return self.generate_batch([messages])[0]
+
+    def generate_batch(self, message_batches: List[List[Message]]) -> List[str]:
+        """
+        Generate responses for multiple conversations in one vLLM call
+
+        Args:
+            message_batches: List of conversation histories
+
+        Returns:
+            List of generated responses, in input order
+        """
+        if not message_batches:
+            return []
+
+        prompts = [self._format_messages(messages) for messages in message_batches]
+        with self._lock:
+            outputs = self.llm.generate(prompts, self.sampling_params, use_tqdm=False)
+        return [LocalModel._clean_response(output.outputs[0].text) for output in outputs]
+
+
+class OpenAICompatibleModel:
+    """Generation backend using an OpenAI-compatible completions server"""
+
+    def __init__(self, config: ModelConfig):
+        """
+        Initialize OpenAI-compatible client
+
+        Args:
+            config: Model configuration (generation_api_base is required)
+        """
+        if not config.generation_api_base:
+            raise ValueError("generation_api_base is required for the openai generation backend.")
+
+        self.config = config
+        self.system_prompt = config.system_prompt
+        self.model_name = config.generation_model_name or config.name
+        self.max_concurrency = config.generation_concurrency
+        self.client = OpenAI(
+            api_key=config.generation_api_key,
+            base_url=config.generation_api_base
+        )
+
+        # 只加载 tokenizer 用于 chat template，保证 prompt 与 LocalModel 完全一致
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                config.path,
+                trust_remote_code=True,
+                use_fast=False
+            )
+        except Exception as e:
+            print(f"⚠ 无法加载 tokenizer（{e}），改用服务端 chat template，分数可能与 LocalModel 不可比")
+            self.tokenizer = None
+
+        print(f"OpenAI-compatible generation backend initialized: {self.model_name} @ {config.generation_api_base}")
+
+    def _format_messages(self, messages: List[Message]) -> str:
+        """Format messages with the same chat template as LocalModel"""
+        return format_chat_prompt(self.tokenizer, messages, self.system_prompt)
+
+    def generate(self, messages: List[Message]) -> str:
+        """
+        Generate response for one conversation
+
+        Args:
+            messages: Conversation history
+
+        Returns:
+            Generated response text
+        """
+        sampling_kwargs = {
+            "model": self.model_name,
+            "max_tokens": self.config.max_new_tokens,
+            "temperature": self.config.temperature,
+            "top_p": self.config.top_p if self.config.temperature > 0 else 1.0
+        }
+
+        if self.tokenizer is not None:
+            # 使用 completions 接口发送本地渲染好的 prompt
+            completion = self.client.completions.create(
+                prompt=self._format_messages(messages),
+                **sampling_kwargs
+            )
+            text = completion.choices[0].text
+        else:
+            chat_messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+            chat_messages += [{"role": msg.role, "content": msg.content} for msg in messages]
+            completion = self.client.chat.completions.create(
+                messages=chat_messages,
+                **sampling_kwargs
+            )
+            text = completion.choices[0].message.content
+
+        return LocalModel._clean_response(text or "")
+
+    def generate_batch(self, message_batches: List[List[Message]]) -> List[str]:
+        """
+        Issue all conversations concurrently so the server can batch them
+
+        Args:
+            message_batches: List of conversation histories
+
+        Returns:
+            List of generated responses, in input order
+        """
+        if not message_batches:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(message_batches))) as executor:
+            return list(executor.map(self.generate, message_batches))
+
+
+def create_generation_model(config: ModelConfig):
+    """
+    Create the generation model for config.generation_backend
+
+    Args:
+        config: Model configuration
+
+    Returns:
+        LocalModel, VLLMModel or OpenAICompatibleModel
+        (all provide generate(messages) and generate_batch(message_batches))
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    backend = config.generation_backend
+    if backend == "hf":
+        return LocalModel(config)
+    if backend == "vllm":
+        return VLLMModel(config)
+    if backend == "openai":
+        return OpenAICompatibleModel(config)
+
+    raise ValueError(
+        f"Unknown generation backend '{backend}'. "
+        f"Available backends: {', '.join(GENERATION_BACKENDS)}"
+    )
@@ -0,0 +1,203 @@
+"""
+Judge Verdict Cache
+Persistent, content-addressed cache of LLM judge outputs (SQLite)
+
+缓存键为 (judge模型, 完整 prompt 消息, max_tokens) 的 SHA-256，
+prompt 中已包含 system prompt、最终规则描述、回复和上下文，
+因此回复完全相同的重复评估会直接命中缓存。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 每写入多少条记录触发一次淘汰检查
+_EVICT_INTERVAL = 1000
+
+
+class JudgeCache:
+    """SQLite-backed judge verdict cache, safe for concurrent writers"""
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: Optional[int] = None,
+        max_age_days: Optional[float] = None
+    ):
+        """
+        Initialize judge cache
+
+        Args:
+            path: SQLite database file path
+            max_entries: Optional max number of entries (least recently used evicted first)
+            max_age_days: Optional max entry age in days
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+
+        # sqlite3 连接不能跨线程共享，每个线程单独持有连接
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+
+        conn = self._get_conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS judge_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_judge_cache_accessed ON judge_cache(accessed_at)")
+        conn.commit()
+        self.evict()
+
+    @classmethod
+    def from_config(cls, evaluation_config) -> Optional["JudgeCache"]:
+        """
+        Create cache from EvaluationConfig
+
+        Returns:
+            JudgeCache if enable_cache and judge_cache_path are set, None otherwise
+        """
+        if not evaluation_config.enable_cache or not evaluation_config.judge_cache_path:
+            return None
+        return cls(
+            evaluation_config.judge_cache_path,
+            max_entries=evaluation_config.judge_cache_max_entries,
+            max_age_days=evaluation_config.judge_cache_max_age_days
+        )
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """Get the sqlite connection of the current thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            # WAL 模式下读写互不阻塞，多个写线程依靠 busy timeout 排队
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, messages: List[dict], max_tokens: int) -> str:
+        """
+        Build content-addressed cache key
+
+        Args:
+            model: Judge model name
+            messages: Full chat messages sent to the judge
+            max_tokens: Max output tokens of the request
+
+        Returns:
+            SHA-256 hex digest
+        """
+        payload = json.dumps(
+            {"model": model, "messages": messages, "max_tokens": max_tokens},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up cached judge output
+
+        Returns:
+            Cached output text, None on miss
+        """
+        conn = self._get_conn()
+        row = conn.execute(
+            "SELECT output, created_at FROM judge_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+        now = time.time()
+        if row is not None and self.max_age_days is not None:
+            if now - row[1] > self.max_age_days * 86400:
+                row = None
+
+        with self._stats_lock:
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+
+        if row is None:
+            return None
+
+        conn.execute("UPDATE judge_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return row[0]
+
+    def put(self, key: str, model: str, output: str):
+        """Store judge output"""
+        now = time.time()
+        conn = self._get_conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO judge_cache (key, model, output, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, model, output, now, now)
+        )
+        conn.commit()
+
+        with self._stats_lock:
+            self._writes += 1
+            should_evict = self._writes % _EVICT_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove expired entries and trim the cache to max_entries
+
+        Returns:
+            Number of removed entries
+        """
+        conn = self._get_conn()
+        removed = 0
+
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += conn.execute(
+                "DELETE FROM judge_cache WHERE created_at < ?", (cutoff,)
+            ).rowcount
+
+        if self.max_entries is not None:
+            removed += conn.execute(
+                "DELETE FROM judge_cache WHERE key IN ("
+                "SELECT key FROM judge_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+
+        conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        return self._get_conn().execute("SELECT COUNT(*) FROM judge_cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get hit-rate statistics of this process
+
+        Returns:
+            Dict with hits, misses, writes, hit_rate and entries
+        """
+        with self._stats_lock:
+            hits, misses, writes = self._hits, self._misses, self._writes
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "writes": writes,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self)
+        }
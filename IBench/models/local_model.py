@@ -163,41 +163,7 @@ class LocalModel:
         Returns:
             Formatted prompt string
         """
-        formatted_messages = []
-        
-        if self.system_prompt:
-            formatted_messages.append({
-                "role": "system",
-                "content": self.system_prompt
-            })
-        
-        for msg in messages:
-            formatted_messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        
-        if hasattr(self.tokenizer, 'apply_chat_template'):
-            try:
-                formatted = self.tokenizer.apply_chat_template(
-                    formatted_messages,
-                    tokenize=False,
-                    add_generation_prompt=True
-                )
-                return formatted
-            except:
-                pass
-        
-        prompt = ""
-        for msg in formatted_messages:
-            if msg["role"] == "system":
-                prompt += f"System: {msg['content']}\n"
-            elif msg["role"] == "user":
-                prompt += f"用户: {msg['content']}\n"
-            elif msg["role"] == "assistant":
-                prompt += f"助手: {msg['content']}\n"
-        prompt += "助手:"
-        return prompt
+        return format_chat_prompt(self.tokenizer, messages, self.system_prompt)
     
     def generate(self, messages: List[Message]) -> str:
         """
@@ -223,6 +189,21 @@ class LocalModel:
             padding=False
         )
         
+        inputs = self._move_inputs_to_device(inputs)
+        
+        # Generate
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, **self._generation_kwargs())
+        
+        # Decode only the generated part
+        input_length = inputs['input_ids'].shape[1]
+        generated_ids = outputs[0][input_length:]
+        response = self.tokenizer.decode(generated_ids, skip_special_tokens=True)
+        
+        return self._clean_response(response)
+    
+    def _move_inputs_to_device(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Move tokenized inputs to the model device"""
         # Move inputs to correct device - smart device mapping (方案A)
         if self.config.load_in_4bit or self.config.load_in_8bit:
             # 对于量化模型（device_map="auto"），获取模型实际设备
@@ -238,42 +219,112 @@ class LocalModel:
         elif self.device == "cuda":
             # 对于非量化模型，移到指定设备
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        return inputs
+    
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        """Sampling arguments shared by generate and generate_batch"""
+        return {
+            "max_new_tokens": self.config.max_new_tokens,
+            "temperature": self.config.temperature,
+            "top_p": self.config.top_p,
+            "do_sample": self.config.temperature > 0,
+            "pad_token_id": self.tokenizer.pad_token_id or self.tokenizer.eos_token_id,
+            "eos_token_id": self.tokenizer.eos_token_id,
+            "repetition_penalty": 1.0
+        }
+    
+    def generate_batch(
+        self,
+        message_batches: List[List[Message]],
+        max_batch_size: Optional[int] = None,
+        token_budget: Optional[int] = None
+    ) -> List[str]:
+        """
+        Generate responses for multiple conversations with length-bucketed batching
         
-        # Generate
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=self.config.max_new_tokens,
-                temperature=self.config.temperature,
-                top_p=self.config.top_p,
-                do_sample=self.config.temperature > 0,
-                pad_token_id=self.tokenizer.pad_token_id or self.tokenizer.eos_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                repetition_penalty=1.0
-            )
+        Prompts are sorted by token length and grouped into left-padded batches,
+        so each batch pads to a similar length.
         
-        # Decode only the generated part
-        input_length = inputs['input_ids'].shape[1]
-        generated_ids = outputs[0][input_length:]
-        response = self.tokenizer.decode(generated_ids, skip_special_tokens=True)
+        Args:
+            message_batches: List of conversation histories
+            max_batch_size: Max conversations per batch (overrides config.generation_batch_size)
+            token_budget: Max (padded prompt + max_new_tokens) tokens per batch
+                (overrides config.generation_token_budget)
+            
+        Returns:
+            List of generated responses, in input order
+        """
+        if self.model is None or self.tokenizer is None:
+            raise RuntimeError("Model not loaded")
+        if not message_batches:
+            return []
         
-        return self._clean_response(response)
+        max_batch_size = max_batch_size or self.config.generation_batch_size
+        token_budget = token_budget or self.config.generation_token_budget
+        
+        prompts = [self._format_messages(messages) for messages in message_batches]
+        lengths = [
+            min(len(self.tokenizer(prompt)["input_ids"]), 4096)
+            for prompt in prompts
+        ]
+        batches = self._plan_batches(lengths, max_batch_size, token_budget, self.config.max_new_tokens)
+        
+        responses: List[Optional[str]] = [None] * len(prompts)
+        for batch_num, indices in enumerate(batches, 1):
+            print(f"  批量生成 [{batch_num}/{len(batches)}]: {len(indices)}条, "
+                  f"最长 {max(lengths[i] for i in indices)} tokens")
+            
+            # tokenizer 已设置 padding_side="left"，生成部分在各行末尾对齐
+            inputs = self.tokenizer(
+                [prompts[i] for i in indices],
+                return_tensors="pt",
+                truncation=True,
+                max_length=4096,
+                padding=True
+            )
+            inputs = self._move_inputs_to_device(inputs)
+            
+            with torch.no_grad():
+                outputs = self.model.generate(**inputs, **self._generation_kwargs())
+            
+            input_length = inputs['input_ids'].shape[1]
+            for row, i in enumerate(indices):
+                response = self.tokenizer.decode(outputs[row][input_length:], skip_special_tokens=True)
+                responses[i] = self._clean_response(response)
+        
+        return responses
     
-    def generate_batch(self, message_batches: List[List[Message]]) -> List[str]:
+    @staticmethod
+    def _plan_batches(
+        lengths: List[int],
+        max_batch_size: int,
+        token_budget: int,
+        max_new_tokens: int
+    ) -> List[List[int]]:
         """
-        Generate responses for multiple conversations
+        Group prompt indices into length-sorted batches
         
         Args:
-            message_batches: List of conversation histories
+            lengths: Prompt token lengths
+            max_batch_size: Max prompts per batch
+            token_budget: Max batch_size * (longest prompt + max_new_tokens) per batch
+            max_new_tokens: Generation length reserved per row
             
         Returns:
-            List of generated responses
+            List of index lists; a prompt exceeding the budget alone gets its own batch
         """
-        responses = []
-        for messages in message_batches:
-            response = self.generate(messages)
-            responses.append(response)
-        return responses
+        batches = []
+        current = []
+        # 升序排列，新加入的总是当前批次中最长的
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            padded_tokens = (len(current) + 1) * (lengths[i] + max_new_tokens)
+            if current and (len(current) >= max_batch_size or padded_tokens > token_budget):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
     
     def check_precondition(
         self,
@@ -363,3 +414,55 @@ class LocalModel:
         except Exception as e:
             print(f"Error in precondition check: {e}")
             return False
+
+
+def format_chat_prompt(tokenizer, messages: List[Message], system_prompt: Optional[str] = None) -> str:
+    """
+    Format messages to prompt string with the tokenizer's chat template
+    
+    Shared by LocalModel and the vLLM / OpenAI-compatible generation backends,
+    so all backends see identical prompts.
+    
+    Args:
+        tokenizer: HuggingFace tokenizer of the evaluated model
+        messages: List of message objects
+        system_prompt: Optional system prompt prepended to the conversation
+        
+    Returns:
+        Formatted prompt string
+    """
+    formatted_messages = []
+    
+    if system_prompt:
+        formatted_messages.append({
+            "role": "system",
+            "content": system_prompt
+        })
+    
+    for msg in messages:
+        formatted_messages.append({
+            "role": msg.role,
+            "content": msg.content
+        })
+    
+    if hasattr(tokenizer, 'apply_chat_template'):
+        try:
+            formatted = tokenizer.apply_chat_template(
+                formatted_messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            return formatted
+        except:
+            pass
+    
+    prompt = ""
+    for msg in formatted_messages:
+        if msg["role"] == "system":
+            prompt += f"System: {msg['content']}\n"
+        elif msg["role"] == "user":
+            prompt += f"用户: {msg['content']}\n"
+        elif msg["role"] == "assistant":
+            prompt += f"助手: {msg['content']}\n"
+    prompt += "助手:"
+    return prompt
@@ -16,6 +16,16 @@ class ModelConfig:
     device_map: str = "auto"
     max_new_tokens: int = 512
     temperature: float = 0.0
+    generation_batch_size: int = 8  # generate_batch 每批最多条数
+    generation_token_budget: int = 32768  # generate_batch 每批 (最长prompt + max_new_tokens) * 条数 上限
+    
+    # Generation backend: "hf" (LocalModel) / "vllm" / "openai"（OpenAI 兼容服务）
+    generation_backend: str = "hf"
+    generation_api_base: Optional[str] = None  # openai 后端的服务地址，如 http://localhost:8000/v1
+    generation_api_key: str = "EMPTY"
+    generation_model_name: Optional[str] = None  # 服务端模型名，默认使用 name
+    generation_concurrency: int = 32  # openai 后端 generate_batch 的并发请求数
+    vllm_tensor_parallel_size: int = 1
     description: str = ""
     
     # API Configuration for Qwen (Dashscope)
@@ -23,6 +33,7 @@ class ModelConfig:
     api_base: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     user_model_name: str = "qwen-plus"
     judge_model_name: str = "qwen-max"
+    judge_max_concurrency: int = 8  # 异步评估模式下单个 event loop 内最大并发 judge 请求数
     
     # Additional generation parameters
     top_p: float = 0.9
@@ -143,6 +154,12 @@ class EvaluationConfig:
     batch_size: int = 8
     max_conversation_turns: int = 20
     enable_cache: bool = True
+    async_judge: bool = False  # 使用 AsyncOpenAI 并发评估同一条用例的所有规则
+    batch_judge: bool = False  # 同一条回复的多条 LLM 规则合并为一次 judge 请求
+    judge_cache_path: Optional[str] = None  # judge 结果持久化缓存（SQLite），为 None 时不启用
+    judge_cache_max_entries: Optional[int] = None  # 缓存最大条数，超出后按最近访问时间淘汰
+    judge_cache_max_age_days: Optional[float] = None  # 缓存条目最长保留天数
+    rule_prefilter: bool = False  # 前置条件能由正则确定时（如用户明确给出年龄）跳过 LLM 判断
 
 
 @dataclass
@@ -191,6 +208,27 @@ class Config:
         
         if output_dir := os.getenv("IBENCH_OUTPUT_DIR"):
             self.evaluation.output_dir = output_dir
+        
+        if async_judge := os.getenv("IBENCH_ASYNC_JUDGE"):
+            self.evaluation.async_judge = async_judge.lower() in ("1", "true", "yes")
+        
+        if batch_judge := os.getenv("IBENCH_BATCH_JUDGE"):
+            self.evaluation.batch_judge = batch_judge.lower() in ("1", "true", "yes")
+        
+        if rule_prefilter := os.getenv("IBENCH_RULE_PREFILTER"):
+            self.evaluation.rule_prefilter = rule_prefilter.lower() in ("1", "true", "yes")
+        
+        if generation_backend := os.getenv("IBENCH_GENERATION_BACKEND"):
+            self.model.generation_backend = generation_backend
+        
+        if generation_api_base := os.getenv("IBENCH_GENERATION_API_BASE"):
+            self.model.generation_api_base = generation_api_base
+        
+        if judge_cache_path := os.getenv("IBENCH_JUDGE_CACHE"):
+            self.evaluation.judge_cache_path = judge_cache_path
+        
+        if max_concurrency := os.getenv("IBENCH_JUDGE_MAX_CONCURRENCY"):
+            self.model.judge_max_concurrency = int(max_concurrency)
     
     def validate(self) -> bool:
         """Validate configuration"""
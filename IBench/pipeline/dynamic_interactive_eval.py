@@ -4,10 +4,12 @@ Supports the new dynamic interaction evaluation format with FIRST_N and N_th rul
 """
 
 import json
-from typing import List, Dict, Any, Optional
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
 from IBench.models.api_model import APIModel
+from IBench.models.judge_cache import JudgeCache
 from IBench.rules.dynamic_rule_registry import DynamicRuleRegistry, ParsedRule
 from IBench.rules.kwargs_extractor import KwargsExtractor
 from IBench.rules.single_rules import SingleRuleRegistry
@@ -40,13 +42,14 @@ class DynamicInteractiveEvaluator:
         # Initialize judge model
         self.judge_model = APIModel(
             self.config.model,
-            model_name=self.config.model.judge_model_name
+            model_name=self.config.model.judge_model_name,
+            judge_cache=JudgeCache.from_config(self.config.evaluation)
         )
 
         # Initialize registries
         self.dynamic_registry = DynamicRuleRegistry()
         self.single_rule_registry = SingleRuleRegistry()
-        self.stage_rule_registry = StageRuleRegistry()
+        self.stage_rule_registry = StageRuleRegistry(rule_prefilter=self.config.evaluation.rule_prefilter)
 
         # Initialize kwargs extractor
         self.kwargs_extractor = KwargsExtractor(llm_judge=self.judge_model)
@@ -166,26 +169,19 @@ class DynamicInteractiveEvaluator:
 
         return conversation_by_turn
 
-    def _evaluate_conversation(
-        self,
-        conversation_by_turn: Dict[int, Dict],
-        rule_list: List
-    ) -> Dict[str, Any]:
+    def _classify_rules(self, rule_list: List) -> Tuple[List[ParsedRule], List[ParsedRule], Dict[int, List[ParsedRule]]]:
         """
-        评估对话
+        解析规则列表并按调度方式分类
 
         Args:
-            conversation_by_turn: 按轮次组织的对话
             rule_list: 规则列表（支持字符串或对象格式）
 
         Returns:
-            评估结果字典
+            (单轮规则, FIRST_N规则, {目标turn_id: N_th规则列表})
         """
-        evaluations = {}
-
-        # 规则分类：单轮规则和阶段规则
         single_turn_rules = []
-        stage_turn_rules = []
+        first_n_rules = []
+        nth_rules_by_turn = defaultdict(list)
 
         for rule_config in rule_list:
             # 支持字符串和对象两种格式（与黄金历史评估统一）
@@ -209,81 +205,87 @@ class DynamicInteractiveEvaluator:
                 parsed.N = N
 
             if parsed.type == "single_turn":
-                single_turn_rules.append({
-                    "parsed": parsed
-                })
+                single_turn_rules.append(parsed)
             elif parsed.type == "stage_turn":
-                stage_turn_rules.append({
-                    "parsed": parsed
-                })
+                if parsed.N is None:
+                    print(f"⚠ 警告: 阶段规则 {rule_tag} 未指定N，跳过")
+                    continue
+                if parsed.rule_class == "N_th":
+                    # N_th规则：只在第N轮评估（turn_id从0开始，所以是N-1）
+                    nth_rules_by_turn[parsed.N - 1].append(parsed)
+                elif parsed.rule_class == "FIRST_N":
+                    first_n_rules.append(parsed)
+
+        return single_turn_rules, first_n_rules, nth_rules_by_turn
+
+    def _evaluate_conversation(
+        self,
+        conversation_by_turn: Dict[int, Dict],
+        rule_list: List
+    ) -> Dict[str, Any]:
+        """
+        增量评估对话：维护运行中的对话历史，每轮只评估需要评估的规则
+
+        - 单轮规则：每轮评估
+        - N_th规则：只在目标轮次评估
+        - FIRST_N规则：前N轮逐轮评估，一旦触发即停止（"至少触发一次"）
+
+        Args:
+            conversation_by_turn: 按轮次组织的对话
+            rule_list: 规则列表（支持字符串或对象格式）
+
+        Returns:
+            评估结果字典
+        """
+        evaluations = {}
+        single_turn_rules, first_n_rules, nth_rules_by_turn = self._classify_rules(rule_list)
+
+        # 尚未触发的FIRST_N规则
+        pending_first_n = list(first_n_rules)
+        conversation_history: List[Message] = []
 
-        # 评估每一轮
         for turn_id in sorted(conversation_by_turn.keys()):
             turn_data = conversation_by_turn[turn_id]
-            
-            # 获取assistant的回复
+
+            # 追加本轮消息（从第0轮到当前轮）
+            if "user" in turn_data:
+                conversation_history.append(turn_data["user"])
             if "assistant" not in turn_data:
                 continue
-            
+            conversation_history.append(turn_data["assistant"])
+
             response = turn_data["assistant"].content
-            
-            # 构建对话历史（从第0轮到当前轮）
-            conversation_history = []
-            for i in range(turn_id + 1):
-                if i in conversation_by_turn:
-                    if "user" in conversation_by_turn[i]:
-                        conversation_history.append(conversation_by_turn[i]["user"])
-                    if "assistant" in conversation_by_turn[i]:
-                        conversation_history.append(conversation_by_turn[i]["assistant"])
-            
-            # 评估该轮的规则
             rule_results = []
 
             # 评估单轮规则（默认应用于所有轮次）
-            for rule_info in single_turn_rules:
-                result = self._evaluate_single_rule(
-                    parsed_rule=rule_info["parsed"],
+            for parsed in single_turn_rules:
+                rule_results.append(self._evaluate_single_rule(
+                    parsed_rule=parsed,
+                    response=response,
+                    conversation=conversation_history
+                ))
+
+            # 评估阶段规则：本轮仍在窗口内且未触发的FIRST_N规则 + 目标为本轮的N_th规则
+            stage_rules = [parsed for parsed in pending_first_n if turn_id < parsed.N]
+            stage_rules += nth_rules_by_turn.get(turn_id, [])
+            for parsed in stage_rules:
+                result = self._evaluate_stage_rule(
+                    parsed_rule=parsed,
                     response=response,
                     conversation=conversation_history
                 )
                 rule_results.append(result)
-            
-            # 评估阶段规则
-            for rule_info in stage_turn_rules:
-                rule_class = rule_info["parsed"].rule_class
-                N = rule_info["parsed"].N
-                
-                should_evaluate = False
-                
-                if rule_class == "N_th":
-                    # N_th规则：只在第N轮评估
-                    if turn_id == N - 1:  # turn_id从0开始，所以是N-1
-                        should_evaluate = True
-                elif rule_class == "FIRST_N":
-                    # FIRST_N规则：在前N轮都评估（后续会汇总判断"至少触发一次"）
-                    if turn_id < N:
-                        should_evaluate = True
-                
-                if should_evaluate:
-                    result = self._evaluate_stage_rule(
-                        parsed_rule=rule_info["parsed"],
-                        response=response,
-                        conversation=conversation_history
-                    )
-                    rule_results.append(result)
-            
+                if parsed.rule_class == "FIRST_N" and result["triggered"]:
+                    pending_first_n.remove(parsed)
+
             evaluations[str(turn_id)] = {
                 "turn_id": turn_id,
                 "response": response,
                 "rules": rule_results
             }
 
-        # 处理FIRST_N规则的"至少触发一次"逻辑
-        evaluations = self._process_first_n_rules(
-            evaluations,
-            stage_turn_rules,
-            conversation_by_turn
-        )
+        # 前N轮都未触发的FIRST_N规则，在第N轮添加失败记录
+        self._add_first_n_failures(evaluations, pending_first_n)
 
         return evaluations
 
@@ -359,56 +361,27 @@ class DynamicInteractiveEvaluator:
             "reason": reason
         }
 
-    def _process_first_n_rules(
+    def _add_first_n_failures(
         self,
         evaluations: Dict[str, Any],
-        stage_turn_rules: List[Dict],
-        conversation_by_turn: Dict[int, Dict]
-    ) -> Dict[str, Any]:
+        untriggered_rules: List[ParsedRule]
+    ):
         """
         处理FIRST_N规则的"至少触发一次"逻辑
-        
-        对于FIRST_N规则，如果在前N轮中至少有一轮触发了规则，
-        则保留所有轮的评估结果；如果都没有触发，则标记为失败。
-        """
-        for rule_info in stage_turn_rules:
-            if rule_info["parsed"].rule_class != "FIRST_N":
-                continue
-            
-            N = rule_info["parsed"].N
-            rule_tag = rule_info["parsed"].full_name
-            
-            # 检查前N轮中是否有至少一次触发
-            has_triggered = False
-            triggered_turn = None
-            
-            for turn_id in range(N):
-                if str(turn_id) not in evaluations:
-                    continue
-                
-                turn_eval = evaluations[str(turn_id)]
-                for rule_result in turn_eval["rules"]:
-                    if rule_result["rule_tag"] == rule_tag and rule_result["triggered"]:
-                        has_triggered = True
-                        triggered_turn = turn_id
-                        break
-                
-                if has_triggered:
-                    break
-            
-            # 如果前N轮都没有触发，需要在最后一轮添加失败记录
-            if not has_triggered and N > 0:
-                last_turn_id = N - 1
-                if str(last_turn_id) in evaluations:
-                    evaluations[str(last_turn_id)]["rules"].append({
-                        "rule_tag": rule_tag,
-                        "passed": False,
-                        "score": rule_info["parsed"].score,
-                        "kwargs": {},
-                        "reason": f"FIRST_N规则：在前{N}轮中未触发"
-                    })
 
-        return evaluations
+        对于前N轮中一次都没有触发的FIRST_N规则，在第N轮（turn_id = N-1）添加失败记录。
+        """
+        for parsed in untriggered_rules:
+            N = parsed.N
+            last_turn_id = str(N - 1)
+            if N > 0 and last_turn_id in evaluations:
+                evaluations[last_turn_id]["rules"].append({
+                    "rule_tag": parsed.full_name,
+                    "passed": False,
+                    "score": parsed.score,
+                    "kwargs": {},
+                    "reason": f"FIRST_N规则：在前{N}轮中未触发"
+                })
 
     def _get_llm_judge_func(self):
         """获取LLM judge函数"""
@@ -0,0 +1,294 @@
+"""
+Streaming Golden History Runner
+JSONL-in / JSONL-out batch evaluation on top of JsonContextEvaluator.evaluate_record
+
+- 输入 JSONL 按需逐行读取，不一次性加载
+- 每条用例评估完成后立即追加一行结果到输出 JSONL
+- 汇总统计增量计算，内存占用与数据集大小无关
+- 可选 RunManifest：重启后跳过已完成用例，失败用例按指数退避重试
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from IBench.pipeline.json_context_evaluator import JsonContextEvaluator
+from IBench.pipeline.run_manifest import RunManifest
+
+
+def iter_jsonl(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取JSONL文件
+
+    Args:
+        file_path: JSONL文件路径
+
+    Yields:
+        JSON对象
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class StreamingSummary:
+    """Incrementally computed evaluation summary"""
+
+    def __init__(self):
+        self.total_entries = 0
+        self.evaluated_entries = 0
+        self.failed_entries = 0
+        self.total_score = 0
+        self.total_rules_checked = 0
+        self.total_rules_triggered = 0
+        self.resumed_entries = 0
+        self.failed_keys: List[str] = []
+
+    def add_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        记录一条成功的评估结果
+
+        Returns:
+            该条目的详情（key / score / triggered_count / total_rules / triggered_rules）
+        """
+        evaluations = result.get('evaluations', [])
+        score = sum(e.get('score', 0) for e in evaluations)
+        triggered_rules = [e['rule'] for e in evaluations if e.get('triggered', False)]
+
+        self.total_entries += 1
+        self.evaluated_entries += 1
+        self.total_score += score
+        self.total_rules_checked += len(evaluations)
+        self.total_rules_triggered += len(triggered_rules)
+
+        return {
+            "key": result.get('key'),
+            "score": score,
+            "triggered_count": len(triggered_rules),
+            "total_rules": len(evaluations),
+            "triggered_rules": triggered_rules
+        }
+
+    def add_failure(self, key: str):
+        """记录一条失败的条目"""
+        self.total_entries += 1
+        self.failed_entries += 1
+        self.failed_keys.append(key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        生成汇总报告
+
+        Returns:
+            汇总统计字典
+        """
+        avg_score = self.total_score / max(self.evaluated_entries, 1)
+        avg_triggered = self.total_rules_triggered / max(self.total_rules_checked, 1) * 100
+        return {
+            "total_entries": self.total_entries,
+            "evaluated_entries": self.evaluated_entries,
+            "failed_entries": self.failed_entries,
+            "total_score": self.total_score,
+            "total_rules_checked": self.total_rules_checked,
+            "total_rules_triggered": self.total_rules_triggered,
+            "average_score": round(avg_score, 2),
+            "average_triggered_percent": round(avg_triggered, 2),
+            "resumed_entries": self.resumed_entries,
+            "failed_keys": self.failed_keys
+        }
+
+
+def evaluate_stream(
+    evaluator: JsonContextEvaluator,
+    records: Iterable[Dict[str, Any]],
+    output_jsonl_path: str,
+    workers: int = 5,
+    batch_generate: bool = False,
+    chunk_size: int = 64,
+    manifest: Optional[RunManifest] = None,
+    max_retries: int = 0,
+    retry_backoff: float = 2.0
+) -> StreamingSummary:
+    """
+    流式评估：逐条读取用例，评估完成即写出结果
+
+    Args:
+        evaluator: 评估器
+        records: 用例迭代器（如 iter_jsonl 的返回值）
+        output_jsonl_path: 输出JSONL路径（每条用例一行，按完成顺序追加）
+        workers: 并发评估线程数
+        batch_generate: 是否按块批量生成回复（生成下一块时上一块的评估继续进行）
+        chunk_size: 每次读取的用例数（批量生成模式下即每次生成的用例数）
+        manifest: 可选的运行记录；提供时续写输出文件并跳过已完成的用例
+        max_retries: 失败用例的最大重试次数
+        retry_backoff: 重试的初始等待秒数（指数退避，带随机抖动）
+
+    Returns:
+        StreamingSummary
+    """
+    summary = StreamingSummary()
+    # 输出文件中已有结果的用例才视为完成（运行记录标记完成但结果行丢失的用例会重跑）
+    completed_keys = _restore_output(output_jsonl_path, manifest, summary) if manifest is not None else set()
+    print_lock = threading.Lock()
+    # 在途任务上限，避免一次性提交整个数据集
+    max_in_flight = max(workers * 2, chunk_size)
+    in_flight: Set[Future] = set()
+    counter = 0
+
+    with open(output_jsonl_path, 'a' if manifest is not None else 'w', encoding='utf-8') as output_f, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def drain(limit: int):
+            """写出已完成的结果，直到在途任务数不超过 limit"""
+            nonlocal in_flight
+            while len(in_flight) > limit:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, result, error = future.result()
+                    if result is not None:
+                        output_f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        output_f.flush()
+                        # 结果落盘后再标记完成；崩溃时的重复行在重启时清理
+                        if manifest is not None:
+                            os.fsync(output_f.fileno())
+                            manifest.mark_completed(key)
+                        detail = summary.add_result(result)
+                        with print_lock:
+                            print(f"  ✓ {key} 得分: {detail['score']}, "
+                                  f"触发规则: {detail['triggered_count']}/{detail['total_rules']}")
+                    else:
+                        summary.add_failure(key)
+                        with print_lock:
+                            print(f"  ✗ {key} 评估失败: {error}")
+
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            keyed = []
+            for record in chunk:
+                counter += 1
+                key = record.get('key', f'entry_{counter}')
+                if key in completed_keys:
+                    continue
+                keyed.append((key, record, counter))
+
+            responses = _generate_chunk(evaluator, keyed, manifest) if batch_generate else [
+                manifest.get_generated(key) if manifest is not None else None for key, _, _ in keyed
+            ]
+
+            for (key, record, index), response in zip(keyed, responses):
+                with print_lock:
+                    print(f"[{index}] 评估条目 {key}")
+                in_flight.add(executor.submit(
+                    _evaluate_one, evaluator, record, key, response, manifest, max_retries, retry_backoff
+                ))
+                drain(max_in_flight)
+
+        drain(0)
+
+    return summary
+
+
+def _restore_output(output_jsonl_path: str, manifest: RunManifest, summary: StreamingSummary) -> Set[str]:
+    """
+    续跑前整理输出文件：只保留运行记录中已完成的用例（每个 key 一行），并计入汇总
+
+    Returns:
+        已完成用例的 key 集合
+    """
+    if not os.path.exists(output_jsonl_path):
+        return set()
+
+    kept_keys = set()
+    tmp_path = output_jsonl_path + ".tmp"
+    with open(output_jsonl_path, 'r', encoding='utf-8') as src, \
+            open(tmp_path, 'w', encoding='utf-8') as dst:
+        for line in src:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            key = result.get('key')
+            if key in kept_keys or not manifest.is_completed(key):
+                continue
+            kept_keys.add(key)
+            dst.write(json.dumps(result, ensure_ascii=False) + '\n')
+            summary.add_result(result)
+    os.replace(tmp_path, output_jsonl_path)
+
+    summary.resumed_entries = len(kept_keys)
+    print(f"✓ 续跑: 已完成 {len(kept_keys)} 条，跳过")
+    return kept_keys
+
+
+def _generate_chunk(
+    evaluator: JsonContextEvaluator,
+    keyed: List[Tuple[str, Dict[str, Any], int]],
+    manifest: Optional[RunManifest] = None
+) -> List[Optional[str]]:
+    """
+    批量生成一块用例的回复（已持久化的回复直接复用）
+
+    失败时对应位置返回 None，由 _evaluate_one 逐条生成
+    """
+    responses = [manifest.get_generated(key) if manifest is not None else None for key, _, _ in keyed]
+    pending = [i for i, response in enumerate(responses) if response is None]
+    if not pending:
+        return responses
+
+    try:
+        generated = evaluator.generate_for_cases([keyed[i][1] for i in pending])
+    except Exception as e:
+        print(f"⚠ 批量生成失败，改为逐条生成（{len(pending)}条）: {e}")
+        return responses
+
+    for i, response in zip(pending, generated):
+        responses[i] = response
+        if manifest is not None:
+            manifest.mark_generated(keyed[i][0], response)
+    return responses
+
+
+def _evaluate_one(
+    evaluator: JsonContextEvaluator,
+    record: Dict[str, Any],
+    key: str,
+    generated_response: Optional[str],
+    manifest: Optional[RunManifest] = None,
+    max_retries: int = 0,
+    retry_backoff: float = 2.0
+) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """
+    评估单个条目（线程安全），失败时按指数退避重试
+
+    Returns:
+        (key, 评估结果, 错误信息)
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            # 先生成并持久化回复，评估阶段失败重试时不再重新生成
+            if generated_response is None:
+                generated_response = evaluator.generate_for_case(record)
+                if manifest is not None:
+                    manifest.mark_generated(key, generated_response)
+            return key, evaluator.evaluate_record(record, generated_response=generated_response), None
+        except Exception as e:
+            if manifest is not None:
+                manifest.mark_failed(key, str(e), attempts)
+            if attempts > max_retries:
+                return key, None, str(e)
+            delay = retry_backoff * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            print(f"  ⚠ {key} 第{attempts}次评估失败，{delay:.1f}s 后重试: {e}")
+            time.sleep(delay)
@@ -5,12 +5,21 @@ Mode: 输入完整对话（最后一条是user消息），生成最后一条回
 """
 
 import json
-from typing import List, Dict, Optional, Any
+import asyncio
+from typing import List, Dict, Optional, Any, Tuple
 from pathlib import Path
 
-from IBench.models.local_model import LocalModel
+from IBench.models.generation_backends import create_generation_model
 from IBench.models.api_model import APIModel
-from IBench.rules.dynamic_rule_registry import DynamicRuleRegistry, ParsedRule, resolve_dynamic_N
+from IBench.models.judge_cache import JudgeCache
+from IBench.rules.dynamic_rule_registry import (
+    DynamicRuleRegistry,
+    ParsedRule,
+    PreconditionIndex,
+    get_auto_precondition,
+    resolve_dynamic_N,
+    aresolve_dynamic_N
+)
 from IBench.rules.kwargs_extractor import KwargsExtractor
 from IBench.rules.single_rules import SingleRuleRegistry
 from IBench.rules.stage_rules import StageRuleRegistry
@@ -68,17 +77,18 @@ class JsonContextEvaluator:
         if api_key:
             self.config.model.api_key = api_key
 
-        # Initialize models
-        self.local_model = LocalModel(self.config.model)
+        # Initialize models（生成后端由 config.model.generation_backend 决定）
+        self.local_model = create_generation_model(self.config.model)
         self.judge_model = APIModel(
             self.config.model,
-            model_name=self.config.model.judge_model_name
+            model_name=self.config.model.judge_model_name,
+            judge_cache=JudgeCache.from_config(self.config.evaluation)
         )
 
         # Initialize registries
         self.dynamic_registry = DynamicRuleRegistry()
         self.single_rule_registry = SingleRuleRegistry()
-        self.stage_rule_registry = StageRuleRegistry()
+        self.stage_rule_registry = StageRuleRegistry(rule_prefilter=self.config.evaluation.rule_prefilter)
 
         # Initialize kwargs extractor
         self.kwargs_extractor = KwargsExtractor(llm_judge=self.judge_model)
@@ -88,7 +98,9 @@ class JsonContextEvaluator:
     def evaluate_from_json(
         self,
         input_json_path: str,
-        output_json_path: Optional[str] = None
+        output_json_path: Optional[str] = None,
+        async_judge: Optional[bool] = None,
+        generated_response: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         从JSON文件读取并评估（黄金历史评估模式）
@@ -96,14 +108,384 @@ class JsonContextEvaluator:
         Args:
             input_json_path: 输入JSON文件路径
             output_json_path: 可选的输出JSON文件路径
+            async_judge: 是否使用异步并发评估（默认读取 config.evaluation.async_judge）
+            generated_response: 已生成的回复（如批量生成的结果），提供时跳过生成
+
+        Returns:
+            评估结果字典
+        """
+        print(f"Loading JSON from {input_json_path}...")
+        return self.evaluate_record(
+            self._load_json(input_json_path),
+            output_json_path,
+            async_judge=async_judge,
+            generated_response=generated_response
+        )
+
+    def evaluate_record(
+        self,
+        input_data: Dict[str, Any],
+        output_json_path: Optional[str] = None,
+        async_judge: Optional[bool] = None,
+        generated_response: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        评估内存中的单条用例（格式同 evaluate_from_json 的输入文件）
+
+        Args:
+            input_data: 用例字典（key / messages / rule_list）
+            output_json_path: 可选的输出JSON文件路径
+            async_judge: 是否使用异步并发评估（默认读取 config.evaluation.async_judge）
+            generated_response: 已生成的回复，提供时跳过生成
+
+        Returns:
+            评估结果字典
+        """
+        if async_judge is None:
+            async_judge = self.config.evaluation.async_judge
+        if async_judge:
+            return asyncio.run(
+                self.aevaluate_record(input_data, output_json_path, generated_response)
+            )
+
+        # 1-3. 提取基础信息并验证输入格式
+        key, messages, rule_list = self._parse_case(input_data)
+
+        # 4. 生成最后一条assistant回复
+        if generated_response is None:
+            print("Generating assistant response...")
+            generated_response = self.local_model.generate(messages)
+            print(f"✓ 生成回复: {generated_response[:50]}...")
+
+        # 5. 将生成的回复添加到 messages 中（供 multi_turn 规则评估使用）
+        self._append_generated_response(messages, generated_response)
+
+        # 5. 评估规则
+        print("Evaluating rules...")
+        if self.config.evaluation.batch_judge:
+            rule_results = self._evaluate_rules_batched(rule_list, generated_response, messages)
+        else:
+            rule_results = self._evaluate_rules(rule_list, generated_response, messages)
+
+        # 6-7. 生成输出并保存
+        return self._finalize_output(key, generated_response, rule_results, output_json_path)
+
+    async def aevaluate_from_json(
+        self,
+        input_json_path: str,
+        output_json_path: Optional[str] = None,
+        generated_response: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        异步评估模式：同一条用例的所有 judge / precondition 调用并发执行
+
+        并发上限由 judge_model.max_concurrency 控制，结果仍按 rule_list 顺序返回
+
+        Args:
+            input_json_path: 输入JSON文件路径
+            output_json_path: 可选的输出JSON文件路径
+            generated_response: 已生成的回复，提供时跳过生成
 
         Returns:
             评估结果字典
         """
-        # 1. 加载JSON
         print(f"Loading JSON from {input_json_path}...")
-        input_data = self._load_json(input_json_path)
+        return await self.aevaluate_record(
+            self._load_json(input_json_path), output_json_path, generated_response
+        )
+
+    async def aevaluate_record(
+        self,
+        input_data: Dict[str, Any],
+        output_json_path: Optional[str] = None,
+        generated_response: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        evaluate_record 的异步版本
+
+        Args:
+            input_data: 用例字典（key / messages / rule_list）
+            output_json_path: 可选的输出JSON文件路径
+            generated_response: 已生成的回复，提供时跳过生成
+
+        Returns:
+            评估结果字典
+        """
+        key, messages, rule_list = self._parse_case(input_data)
+
+        # 本地生成是同步阻塞调用，放到线程中执行以免阻塞 event loop
+        if generated_response is None:
+            print("Generating assistant response...")
+            generated_response = await asyncio.to_thread(self.local_model.generate, messages)
+            print(f"✓ 生成回复: {generated_response[:50]}...")
+
+        self._append_generated_response(messages, generated_response)
+
+        print("Evaluating rules (async)...")
+        if self.config.evaluation.batch_judge:
+            rule_results = await self._aevaluate_rules_batched(rule_list, generated_response, messages)
+        else:
+            rule_results = await self._aevaluate_rules(rule_list, generated_response, messages)
+
+        return self._finalize_output(key, generated_response, rule_results, output_json_path)
+
+    def _evaluate_rules(
+        self,
+        rule_list: List[Any],
+        generated_response: str,
+        messages: List[Message]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        逐条评估规则（每条 LLM 规则一次 judge 请求）
+
+        Returns:
+            [(rule_tag, 评估结果字典)]，顺序与 rule_list 一致
+        """
+        rule_results = []
+        parsed_rules = [p for p in map(self._parse_rule_config, rule_list) if p is not None]
+        precondition_index = self._build_precondition_index(
+            parsed_rules, messages, self._get_llm_judge_func()
+        )
+
+        for rule_tag, N, parsed_rule in parsed_rules:
+            # 根据规则类型选择评估方式
+            if parsed_rule.type == "single_turn":
+                # single_turn规则：评估生成的回复
+                result = self._evaluate_single_rule(
+                    parsed_rule=parsed_rule,
+                    response=generated_response,
+                    conversation=messages
+                )
+            else:  # stage_turn (multi_turn)
+                # multi_turn规则：从历史中提取第N轮回复并评估
+                result = self._evaluate_multi_turn_rule(
+                    parsed_rule=parsed_rule,
+                    N=N,
+                    messages=messages,
+                    precondition_index=precondition_index
+                )
+
+            rule_results.append((rule_tag, result))
+
+        return rule_results
+
+    async def _aevaluate_rules(
+        self,
+        rule_list: List[Any],
+        generated_response: str,
+        messages: List[Message]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """_evaluate_rules 的异步版本：所有规则并发评估"""
+        llm_judge = self._get_async_llm_judge_func()
+        parsed_rules = [p for p in map(self._parse_rule_config, rule_list) if p is not None]
+        precondition_index = self._new_precondition_index(messages, llm_judge)
+        rule_tags = []
+        tasks = []
+
+        for rule_tag, N, parsed_rule in parsed_rules:
+            if parsed_rule.type == "single_turn":
+                coro = self._aevaluate_single_rule(
+                    parsed_rule=parsed_rule,
+                    response=generated_response,
+                    conversation=messages,
+                    llm_judge=llm_judge
+                )
+            else:
+                coro = self._aevaluate_multi_turn_rule(
+                    parsed_rule=parsed_rule,
+                    N=N,
+                    messages=messages,
+                    llm_judge=llm_judge,
+                    precondition_index=precondition_index
+                )
+            rule_tags.append(rule_tag)
+            tasks.append(coro)
+
+        # gather 保证返回顺序与 rule_list 一致
+        results = await asyncio.gather(*tasks)
+        return list(zip(rule_tags, results))
+
+    def _evaluate_rules_batched(
+        self,
+        rule_list: List[Any],
+        generated_response: str,
+        messages: List[Message]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        批量评估规则：评估同一条回复的 LLM 规则合并为一次 judge 请求
+
+        - single_turn 规则都评估生成的回复，合并为一组
+        - multi_turn 规则解析 N 后按目标回复（第N轮）分组
+
+        Returns:
+            [(rule_tag, 评估结果字典)]，顺序与 rule_list 一致
+        """
+        parsed_rules = [p for p in map(self._parse_rule_config, rule_list) if p is not None]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(parsed_rules)
+        llm_judge = self._get_llm_judge_func()
+        llm_judge_batch = self._get_llm_judge_batch_func()
+
+        # single_turn 规则
+        single_idx = [i for i, (_, _, rule) in enumerate(parsed_rules) if rule.type == "single_turn"]
+        verdicts = self.single_rule_registry.evaluate_rules_batch(
+            [(parsed_rules[i][2].rule_name, parsed_rules[i][2].N) for i in single_idx],
+            generated_response,
+            llm_judge_batch
+        )
+        for i, (triggered, reason) in zip(single_idx, verdicts):
+            results[i] = self._build_rule_result(
+                parsed_rules[i][2], triggered, reason, generated_response, messages
+            )
+
+        # multi_turn 规则：解析 N 并定位目标回复
+        precondition_index = self._build_precondition_index(parsed_rules, messages, llm_judge)
+        resolved = {}
+        for i, (_, N, parsed_rule) in enumerate(parsed_rules):
+            if parsed_rule.type != "single_turn":
+                resolved[i] = resolve_dynamic_N(
+                    N, parsed_rule, messages, precondition_index=precondition_index
+                )
+
+        for target, items in self._group_by_target(parsed_rules, resolved, messages, results):
+            verdicts = self.stage_rule_registry.evaluate_rules_batch(
+                [(parsed_rules[i][2].rule_name, resolved_N) for i, resolved_N in items],
+                target["response"],
+                llm_judge_batch,
+                target["conversation"]
+            )
+            for (i, _), (triggered, reason) in zip(items, verdicts):
+                results[i] = self._build_rule_result(
+                    parsed_rules[i][2], triggered, reason, target["response"], target["conversation"]
+                )
+
+        return [(rule_tag, result) for (rule_tag, _, _), result in zip(parsed_rules, results)]
+
+    async def _aevaluate_rules_batched(
+        self,
+        rule_list: List[Any],
+        generated_response: str,
+        messages: List[Message]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """_evaluate_rules_batched 的异步版本：各分组的批量 judge 请求并发执行"""
+        parsed_rules = [p for p in map(self._parse_rule_config, rule_list) if p is not None]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(parsed_rules)
+        llm_judge = self._get_async_llm_judge_func()
+        llm_judge_batch = self._get_async_llm_judge_batch_func()
+
+        multi_idx = [i for i, (_, _, rule) in enumerate(parsed_rules) if rule.type != "single_turn"]
+        precondition_index = self._new_precondition_index(messages, llm_judge)
+        resolved_Ns = await asyncio.gather(*[
+            aresolve_dynamic_N(
+                parsed_rules[i][1], parsed_rules[i][2], messages,
+                precondition_index=precondition_index
+            )
+            for i in multi_idx
+        ])
+        resolved = dict(zip(multi_idx, resolved_Ns))
+        groups = self._group_by_target(parsed_rules, resolved, messages, results)
+
+        single_idx = [i for i, (_, _, rule) in enumerate(parsed_rules) if rule.type == "single_turn"]
+        single_task = self.single_rule_registry.aevaluate_rules_batch(
+            [(parsed_rules[i][2].rule_name, parsed_rules[i][2].N) for i in single_idx],
+            generated_response,
+            llm_judge_batch
+        )
+        stage_tasks = [
+            self.stage_rule_registry.aevaluate_rules_batch(
+                [(parsed_rules[i][2].rule_name, resolved_N) for i, resolved_N in items],
+                target["response"],
+                llm_judge_batch,
+                target["conversation"]
+            )
+            for target, items in groups
+        ]
+        single_verdicts, *stage_verdicts = await asyncio.gather(single_task, *stage_tasks)
+
+        for i, (triggered, reason) in zip(single_idx, single_verdicts):
+            results[i] = self._build_rule_result(
+                parsed_rules[i][2], triggered, reason, generated_response, messages
+            )
+        for (target, items), verdicts in zip(groups, stage_verdicts):
+            for (i, _), (triggered, reason) in zip(items, verdicts):
+                results[i] = self._build_rule_result(
+                    parsed_rules[i][2], triggered, reason, target["response"], target["conversation"]
+                )
+
+        return [(rule_tag, result) for (rule_tag, _, _), result in zip(parsed_rules, results)]
+
+    def _new_precondition_index(self, messages: List[Message], llm_judge) -> PreconditionIndex:
+        """创建用例级 precondition 索引（所有规则共享）"""
+        return PreconditionIndex(
+            messages,
+            llm_judge,
+            max_workers=self.config.model.judge_max_concurrency,
+            rule_prefilter=self.config.evaluation.rule_prefilter
+        )
+
+    def _build_precondition_index(
+        self,
+        parsed_rules: List[Tuple[str, Any, ParsedRule]],
+        messages: List[Message],
+        llm_judge
+    ) -> PreconditionIndex:
+        """
+        创建 precondition 索引，并一次性并发检测所有 N=auto 规则的 precondition
+
+        Returns:
+            PreconditionIndex
+        """
+        index = self._new_precondition_index(messages, llm_judge)
+        preconditions = []
+        for _, N, parsed_rule in parsed_rules:
+            if parsed_rule.type == "single_turn":
+                continue
+            try:
+                precondition = get_auto_precondition(N, parsed_rule)
+            except ValueError:
+                # 非法 N 配置留给 resolve_dynamic_N 报错
+                continue
+            if precondition:
+                preconditions.append(precondition)
+        index.prefetch(preconditions)
+        return index
+
+    def _group_by_target(
+        self,
+        parsed_rules: List[Tuple[str, Any, ParsedRule]],
+        resolved: Dict[int, Optional[int]],
+        messages: List[Message],
+        results: List[Optional[Dict[str, Any]]]
+    ) -> List[Tuple[Dict[str, Any], List[Tuple[int, int]]]]:
+        """
+        将 multi_turn 规则按目标回复分组；无法评估的规则直接写入 results
+
+        Args:
+            parsed_rules: [(rule_tag, N, parsed_rule)]
+            resolved: {规则下标: 解析后的 N}
+            messages: 完整的消息列表
+            results: 评估结果列表（原地写入）
+
+        Returns:
+            [(target, [(规则下标, resolved_N)])]
+        """
+        groups: Dict[int, Tuple[Dict[str, Any], List[Tuple[int, int]]]] = {}
+        for i, resolved_N in resolved.items():
+            target = self._locate_target_response(parsed_rules[i][2], resolved_N, messages)
+            if "error" in target:
+                results[i] = target["error"]
+                continue
+            # 同一轮的回复对应相同的 conversation 前缀，以其长度作为分组键
+            group_key = len(target["conversation"])
+            groups.setdefault(group_key, (target, []))[1].append((i, resolved_N))
+        return list(groups.values())
+
+    def _parse_case(self, input_data: Dict[str, Any]) -> Tuple[str, List[Message], List[Any]]:
+        """
+        解析并验证单条黄金历史用例
 
+        Returns:
+            (key, messages, rule_list)
+        """
         # 2. 提取基础信息
         key = input_data.get("key", "unknown")
         messages = [Message(**msg) for msg in input_data["messages"]]
@@ -119,12 +501,10 @@ class JsonContextEvaluator:
 
         print(f"✓ 输入验证通过: {len(messages)}条消息，最后一条是user消息")
 
-        # 4. 生成最后一条assistant回复
-        print("Generating assistant response...")
-        generated_response = self.local_model.generate(messages)
-        print(f"✓ 生成回复: {generated_response[:50]}...")
+        return key, messages, rule_list
 
-        # 5. 将生成的回复添加到 messages 中（供 multi_turn 规则评估使用）
+    def _append_generated_response(self, messages: List[Message], generated_response: str):
+        """将生成的回复添加到 messages 中（供 multi_turn 规则评估使用）"""
         messages.append(
             Message(
                 role="assistant",
@@ -134,69 +514,66 @@ class JsonContextEvaluator:
         )
         print(f"✓ 已将生成回复添加到对话历史（用于 multi_turn 规则评估）")
 
-        # 5. 评估规则
-        print("Evaluating rules...")
-        evaluations = []
-        kwargs_list = []
-
-        for rule_config in rule_list:
-            # 支持字符串和对象两种格式
-            if isinstance(rule_config, str):
-                rule_tag = rule_config
-                N = None
-            elif isinstance(rule_config, dict):
-                rule_tag = rule_config["rule"]
-                N = rule_config.get("N")
-                # N 可以是 int、"auto" 或 {"value": "auto", "offset": 1}
-            else:
-                print(f"⚠ 警告: 不支持的规则配置格式 {type(rule_config)}，跳过")
-                continue
-            
-            # 解析规则
-            parsed_rule = self.dynamic_registry.parse_rule(rule_tag)
-            if not parsed_rule:
-                print(f"⚠ 警告: 无法解析规则 {rule_tag}，跳过")
-                continue
-            
-            # 设置N参数
-            if N is not None:
-                parsed_rule.N = N
+    def _parse_rule_config(self, rule_config: Any) -> Optional[Tuple[str, Any, ParsedRule]]:
+        """
+        解析 rule_list 中的单个规则配置
 
-            # 根据规则类型选择评估方式
-            if parsed_rule.type == "single_turn":
-                # single_turn规则：评估生成的回复
-                result = self._evaluate_single_rule(
-                    parsed_rule=parsed_rule,
-                    response=generated_response,
-                    conversation=messages
-                )
-            else:  # stage_turn (multi_turn)
-                # multi_turn规则：从历史中提取第N轮回复并评估
-                result = self._evaluate_multi_turn_rule(
-                    parsed_rule=parsed_rule,
-                    N=N,
-                    messages=messages
-                )
-            
-            evaluations.append({
-                "rule": rule_tag,
-                "triggered": result["triggered"],
-                "score": result["score"],
-                "kwargs": result["kwargs"],
-                "reason": result["reason"]
-            })
-            
-            kwargs_list.append(result["kwargs"])
-
-        # 6. 生成输出
+        Returns:
+            (rule_tag, N, parsed_rule)，无法解析时返回 None
+        """
+        # 支持字符串和对象两种格式
+        if isinstance(rule_config, str):
+            rule_tag = rule_config
+            N = None
+        elif isinstance(rule_config, dict):
+            rule_tag = rule_config["rule"]
+            N = rule_config.get("N")
+            # N 可以是 int、"auto" 或 {"value": "auto", "offset": 1}
+        else:
+            print(f"⚠ 警告: 不支持的规则配置格式 {type(rule_config)}，跳过")
+            return None
+        
+        # 解析规则
+        parsed_rule = self.dynamic_registry.parse_rule(rule_tag)
+        if not parsed_rule:
+            print(f"⚠ 警告: 无法解析规则 {rule_tag}，跳过")
+            return None
+        
+        # 设置N参数
+        if N is not None:
+            parsed_rule.N = N
+
+        return rule_tag, N, parsed_rule
+
+    @staticmethod
+    def _format_evaluation(rule_tag: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """生成输出中单条规则的评估记录"""
+        return {
+            "rule": rule_tag,
+            "triggered": result["triggered"],
+            "score": result["score"],
+            "kwargs": result["kwargs"],
+            "reason": result["reason"]
+        }
+
+    def _finalize_output(
+        self,
+        key: str,
+        generated_response: str,
+        rule_results: List[Tuple[str, Dict[str, Any]]],
+        output_json_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """生成输出字典，并保存到文件（如果指定）"""
         output_data = {
             "key": key,
             "generated_response": generated_response,
-            "evaluations": evaluations,
-            "kwargs": kwargs_list
+            "evaluations": [
+                self._format_evaluation(rule_tag, result)
+                for rule_tag, result in rule_results
+            ],
+            "kwargs": [result["kwargs"] for _, result in rule_results]
         }
 
-        # 7. 保存到文件（如果指定）
         if output_json_path:
             self._save_json(output_data, output_json_path)
             print(f"✓ 结果已保存到 {output_json_path}")
@@ -234,6 +611,31 @@ class JsonContextEvaluator:
 
         return results
 
+    def generate_for_case(self, case: Dict[str, Any]) -> str:
+        """
+        生成单条用例的最后一条assistant回复
+
+        Args:
+            case: 黄金历史用例（格式同 evaluate_from_json 的输入）
+
+        Returns:
+            生成的回复
+        """
+        return self.local_model.generate(self._parse_case(case)[1])
+
+    def generate_for_cases(self, cases: List[Dict[str, Any]]) -> List[str]:
+        """
+        批量生成多条用例的最后一条assistant回复（按长度分桶、left padding）
+
+        Args:
+            cases: 黄金历史用例列表（格式同 evaluate_from_json 的输入）
+
+        Returns:
+            生成的回复列表，顺序与 cases 一致
+        """
+        conversations = [self._parse_case(case)[1] for case in cases]
+        return self.local_model.generate_batch(conversations)
+
     def _load_json(self, json_path: str) -> Dict[str, Any]:
         """加载JSON文件"""
         with open(json_path, 'r', encoding='utf-8') as f:
@@ -305,28 +707,43 @@ class JsonContextEvaluator:
                 N=parsed_rule.N
             )
 
-        # 提取kwargs
-        kwargs = {}
-        if parsed_rule.has_kwargs:
-            kwargs = self.kwargs_extractor.extract(
-                rule_full_name=parsed_rule.full_name,
-                kwargs_schema=parsed_rule.kwargs_schema,
+        return self._build_rule_result(parsed_rule, triggered, reason, response, conversation)
+
+    async def _aevaluate_single_rule(
+        self,
+        parsed_rule: ParsedRule,
+        response: str,
+        conversation: List[Message],
+        llm_judge
+    ) -> Dict[str, Any]:
+        """_evaluate_single_rule 的异步版本"""
+        if parsed_rule.type == "single_turn":
+            threshold = parsed_rule.N if parsed_rule.N is not None else 1
+
+            triggered, reason = await self.single_rule_registry.aevaluate_rule(
+                rule_name=parsed_rule.rule_name,
                 response=response,
-                conversation=conversation
+                llm_judge=llm_judge,
+                threshold=threshold,
+                N=parsed_rule.N
+            )
+        else:
+            triggered, reason = await self.stage_rule_registry.aevaluate_rule(
+                rule_name=parsed_rule.rule_name,
+                response=response,
+                llm_judge=llm_judge,
+                conversation=conversation,
+                N=parsed_rule.N
             )
 
-        return {
-            "triggered": triggered,
-            "score": parsed_rule.score if triggered else 0,
-            "kwargs": kwargs,
-            "reason": reason
-        }
+        return self._build_rule_result(parsed_rule, triggered, reason, response, conversation)
 
     def _evaluate_multi_turn_rule(
         self,
         parsed_rule: ParsedRule,
         N: Optional[int],
-        messages: List[Message]
+        messages: List[Message],
+        precondition_index: Optional[PreconditionIndex] = None
     ) -> Dict[str, Any]:
         """
         评估multi_turn规则（从历史中提取第N轮回复）
@@ -335,6 +752,7 @@ class JsonContextEvaluator:
             parsed_rule: 解析后的规则
             N: 轮次编号（从1开始），可以是 int、"auto" 或 {"value": "auto", "offset": 1}
             messages: 完整的消息列表
+            precondition_index: 同一用例共享的 precondition 索引（可选）
         
         Returns:
             评估结果字典
@@ -344,17 +762,76 @@ class JsonContextEvaluator:
             N,
             parsed_rule,
             messages,
-            self._get_llm_judge_func()
+            self._get_llm_judge_func(),
+            precondition_index=precondition_index
         )
         
+        target = self._locate_target_response(parsed_rule, resolved_N, messages)
+        if "error" in target:
+            return target["error"]
+        
+        # 使用stage rule registry评估该回复（传递 resolved_N）
+        triggered, reason = self.stage_rule_registry.evaluate_rule(
+            rule_name=parsed_rule.rule_name,
+            response=target["response"],
+            llm_judge=self._get_llm_judge_func(),
+            conversation=target["conversation"],
+            N=resolved_N  # 传递实际的 N 值
+        )
+
+        return self._build_rule_result(
+            parsed_rule, triggered, reason, target["response"], target["conversation"]
+        )
+
+    async def _aevaluate_multi_turn_rule(
+        self,
+        parsed_rule: ParsedRule,
+        N: Optional[int],
+        messages: List[Message],
+        llm_judge,
+        precondition_index: Optional[PreconditionIndex] = None
+    ) -> Dict[str, Any]:
+        """_evaluate_multi_turn_rule 的异步版本"""
+        resolved_N = await aresolve_dynamic_N(
+            N, parsed_rule, messages, llm_judge, precondition_index=precondition_index
+        )
+
+        target = self._locate_target_response(parsed_rule, resolved_N, messages)
+        if "error" in target:
+            return target["error"]
+
+        triggered, reason = await self.stage_rule_registry.aevaluate_rule(
+            rule_name=parsed_rule.rule_name,
+            response=target["response"],
+            llm_judge=llm_judge,
+            conversation=target["conversation"],
+            N=resolved_N
+        )
+
+        return self._build_rule_result(
+            parsed_rule, triggered, reason, target["response"], target["conversation"]
+        )
+
+    def _locate_target_response(
+        self,
+        parsed_rule: ParsedRule,
+        resolved_N: Optional[int],
+        messages: List[Message]
+    ) -> Dict[str, Any]:
+        """
+        定位第N轮的assistant回复
+
+        Returns:
+            {"response": ..., "conversation": ...}；无法评估时返回 {"error": 评估结果字典}
+        """
         # 如果 precondition 未满足，跳过评估
         if resolved_N is None:
-            return {
+            return {"error": {
                 "triggered": False,
                 "score": 0,
                 "kwargs": {},
                 "reason": f"precondition 未满足，无法评估"
-            }
+            }}
         
         # 从messages中提取第N轮的assistant回复
         # 轮次计数方式：user + assistant 对算一轮
@@ -375,45 +852,49 @@ class JsonContextEvaluator:
         if assistant_idx >= len(messages):
             # 真正的超出范围（因为生成的回复已经添加到 messages 中了）
             print(f"⚠ 警告: 计算的 N={resolved_N} 超出范围（实际{max_turns}轮），跳过该规则")
-            return {
+            return {"error": {
                 "triggered": False,
                 "score": 0,
                 "kwargs": {},
                 "reason": f"N={resolved_N} 超出范围，对话仅有{max_turns}轮"
-            }
+            }}
         
         target_message = messages[assistant_idx]
         
         if target_message.role != "assistant":
-            return {
+            return {"error": {
                 "triggered": False,
                 "score": 0,
                 "kwargs": {},
                 "reason": f"第{resolved_N}轮的消息不是assistant，实际是: {target_message.role}"
-            }
+            }}
         
         target_response = target_message.content
         
         print(f"  评估multi_turn规则: {parsed_rule.full_name}, N={resolved_N}")
         print(f"  目标回复（第{resolved_N}轮）: {target_response[:50]}...")
-        
-        # 使用stage rule registry评估该回复（传递 resolved_N）
-        triggered, reason = self.stage_rule_registry.evaluate_rule(
-            rule_name=parsed_rule.rule_name,
-            response=target_response,
-            llm_judge=self._get_llm_judge_func(),
-            conversation=messages[:assistant_idx+1],
-            N=resolved_N  # 传递实际的 N 值
-        )
 
-        # 提取kwargs
+        return {
+            "response": target_response,
+            "conversation": messages[:assistant_idx+1]
+        }
+
+    def _build_rule_result(
+        self,
+        parsed_rule: ParsedRule,
+        triggered: bool,
+        reason: str,
+        response: str,
+        conversation: List[Message]
+    ) -> Dict[str, Any]:
+        """提取kwargs并生成单条规则的评估结果"""
         kwargs = {}
         if parsed_rule.has_kwargs:
             kwargs = self.kwargs_extractor.extract(
                 rule_full_name=parsed_rule.full_name,
                 kwargs_schema=parsed_rule.kwargs_schema,
-                response=target_response,
-                conversation=messages[:assistant_idx+1]
+                response=response,
+                conversation=conversation
             )
 
         return {
@@ -431,3 +912,27 @@ class JsonContextEvaluator:
             )
         return None
 
+    def _get_llm_judge_batch_func(self):
+        """获取批量LLM judge函数（一次请求评估多条规则）"""
+        if self.judge_model:
+            return lambda response, rule_descs, context=None: (
+                self.judge_model.evaluate_with_judge_batch(response, rule_descs, context)
+            )
+        return None
+
+    def _get_async_llm_judge_batch_func(self):
+        """获取异步批量LLM judge函数"""
+        if self.judge_model:
+            return lambda response, rule_descs, context=None: (
+                self.judge_model.aevaluate_with_judge_batch(response, rule_descs, context)
+            )
+        return None
+
+    def _get_async_llm_judge_func(self):
+        """获取异步LLM judge函数"""
+        if self.judge_model:
+            return lambda response, rule_desc, context=None: (
+                self.judge_model.aevaluate_with_judge(response, rule_desc, context)
+            )
+        return None
+
@@ -0,0 +1,133 @@
+"""
+Run Manifest
+Crash-safe checkpoint of a batch evaluation run (append-only JSONL)
+
+每行记录一个用例状态变化：generated（已生成回复）/ completed（结果已写出）/ failed。
+记录带有模型与配置指纹，配置变化后旧记录自动失效。
+每条 judge 结果由 JudgeCache 持久化，重跑未完成的用例时不会重复已完成的 judge 调用。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from IBench.models.model_configs import Config
+
+
+class RunManifest:
+    """Append-only manifest keyed by case key and config fingerprint"""
+
+    def __init__(self, path: str, fingerprint: str, resume: bool = True):
+        """
+        Initialize run manifest
+
+        Args:
+            path: Manifest JSONL path
+            fingerprint: Model / config fingerprint of this run
+            resume: Load existing records; False starts a fresh manifest
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+        if resume and self.path.exists():
+            self._load()
+        elif self.path.exists():
+            self.path.unlink()
+
+    @staticmethod
+    def config_fingerprint(config: Config) -> str:
+        """
+        Fingerprint the settings that affect generated responses and verdicts
+
+        Returns:
+            Short SHA-256 hex digest
+        """
+        model = config.model
+        payload = {
+            "model": model.name,
+            "path": model.path,
+            "generation_backend": model.generation_backend,
+            "generation_model_name": model.generation_model_name,
+            "max_new_tokens": model.max_new_tokens,
+            "temperature": model.temperature,
+            "top_p": model.top_p,
+            "system_prompt": model.system_prompt,
+            "judge_model_name": model.judge_model_name,
+            "batch_judge": config.evaluation.batch_judge,
+            "rule_prefilter": config.evaluation.rule_prefilter
+        }
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _load(self):
+        """Replay manifest records of the current fingerprint"""
+        stale = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能不完整
+                    continue
+                if record.get("fingerprint") != self.fingerprint:
+                    stale += 1
+                    continue
+                self._apply(record)
+
+        completed = sum(1 for state in self._states.values() if state.get("completed"))
+        print(f"✓ 加载运行记录: {completed} 条已完成" + (f"，忽略 {stale} 条旧配置记录" if stale else ""))
+
+    def _apply(self, record: Dict[str, Any]):
+        """Apply one record to the in-memory state"""
+        state = self._states.setdefault(record["key"], {})
+        status = record["status"]
+        if status == "generated":
+            state["response"] = record["response"]
+        elif status == "completed":
+            state["completed"] = True
+        elif status == "failed":
+            state["failures"] = state.get("failures", 0) + 1
+            state["error"] = record.get("error")
+
+    def _append(self, record: Dict[str, Any]):
+        """Append and fsync one record"""
+        record = {"fingerprint": self.fingerprint, "time": time.time(), **record}
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def is_completed(self, key: str) -> bool:
+        """用例是否已完成"""
+        with self._lock:
+            return self._states.get(key, {}).get("completed", False)
+
+    def get_generated(self, key: str) -> Optional[str]:
+        """获取已持久化的生成回复"""
+        with self._lock:
+            return self._states.get(key, {}).get("response")
+
+    def mark_generated(self, key: str, response: str):
+        """记录生成的回复（重试或重启后不再重新生成）"""
+        self._append({"key": key, "status": "generated", "response": response})
+
+    def mark_completed(self, key: str):
+        """记录用例已完成（结果已写入输出文件）"""
+        self._append({"key": key, "status": "completed"})
+
+    def mark_failed(self, key: str, error: str, attempts: int):
+        """记录用例失败"""
+        self._append({"key": key, "status": "failed", "error": error, "attempts": attempts})
@@ -0,0 +1,236 @@
+"""
+Compiled Rule Engine
+Precompiled fast path for all RuleType.RULE rules and keyword / regex preconditions
+
+- 所有正则在模块加载时编译一次
+- 一条回复只提取一次特征（问号数、解释性标点、列表项、性别关键词），所有确定性规则共用
+- evaluate_dataset 一次处理整个数据集的回复
+- decide_precondition 作为"廉价规则优先"的预过滤：正则能确定结果时跳过 LLM 前置条件判断
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from IBench.utils.common import Message, RuleDefinition, RuleType
+
+# punctuation: 引号 / 括号 / 破折号 / 连字符解释，五个模式合并为一个交替模式
+_EXPLAIN_PUNCTUATION_PATTERN = re.compile("|".join(f"(?:{p})" for p in (
+    r'["\"][^\"\"]*["\"]',
+    r"['\'][^'\']*['\']",
+    r'\([^)]*\)',
+    r'—[^—]*—',
+    r'-[^-]*-',
+)))
+# list: 逐行匹配 "1. "（等价于按 '\n' 切分后对每行 re.match(r'^\s*\d+\.\s')）
+_LIST_ITEM_PATTERN = re.compile(r'^[^\S\n]*\d+\.[^\S\n]', re.MULTILINE)
+_GENDER_PATTERN = re.compile('|'.join(map(re.escape, ['男', '女', '性别', '是男是女', '先生还是女士'])))
+
+# 前置条件关键词（LLM 不可用时的降级逻辑）
+_EXAM_PATTERN = re.compile('|'.join(map(re.escape, ['检查', '体检', '化验', '测试', '诊断'])))
+_MEDICATION_PATTERN = re.compile('|'.join(map(re.escape, ['药', '吃药', '服药', '药物', '治疗'])))
+_VISIT_PATTERN = re.compile('|'.join(map(re.escape, ['去过医院', '看过医生', '就诊', '去过'])))
+_AGE_PATTERN = re.compile(r'(\d+)\s*[岁岁]')
+_AGE_PRECONDITION_PATTERN = re.compile(r'用户年[龄纪]\s*>=\s*(\d+)\s*岁')
+
+
+@dataclass(frozen=True)
+class ResponseFeatures:
+    """Features of one response used by all deterministic rules"""
+    question_count: int
+    has_explain_punctuation: bool
+    list_count: int
+    mentions_gender: bool
+
+    @classmethod
+    def extract(cls, response: str) -> "ResponseFeatures":
+        """
+        Extract all features from a response in one pass over the compiled patterns
+
+        Args:
+            response: Response text
+
+        Returns:
+            ResponseFeatures
+        """
+        return cls(
+            question_count=response.count('？') + response.count('?'),
+            has_explain_punctuation=_EXPLAIN_PUNCTUATION_PATTERN.search(response) is not None,
+            list_count=len(_LIST_ITEM_PATTERN.findall(response)),
+            mentions_gender=_GENDER_PATTERN.search(response) is not None
+        )
+
+
+def _multi_question(features: ResponseFeatures, threshold: int) -> Tuple[bool, str]:
+    question_count = features.question_count
+    if question_count > threshold:
+        return False, f"违规: 发现{question_count}个问题，超过阈值{threshold}"
+    return True, f"未违规: 发现{question_count}个问题，未超过阈值{threshold}"
+
+
+def _punctuation(features: ResponseFeatures, threshold: int) -> Tuple[bool, str]:
+    if features.has_explain_punctuation:
+        return False, "违规: 使用了标点符号进行解释"
+    return True, "未违规: 未使用标点符号进行解释"
+
+
+def _list(features: ResponseFeatures, threshold: int) -> Tuple[bool, str]:
+    if features.list_count:
+        return False, f"违规: 发现{features.list_count}个列表项"
+    return True, "未违规: 未使用列表格式"
+
+
+def _gender(features: ResponseFeatures, threshold: int) -> Tuple[bool, str]:
+    found = features.mentions_gender
+    return found, f"{'符合' if found else '不符合'}: {'询问了性别' if found else '未询问性别'}"
+
+
+# 规则名 -> 判定函数 (features, threshold) -> (passed, reason)
+_RULE_CHECKS: Dict[str, Callable[[ResponseFeatures, int], Tuple[bool, str]]] = {
+    "multi_question": _multi_question,
+    "punctuation": _punctuation,
+    "list": _list,
+    "gender": _gender,
+}
+
+
+class CompiledRuleEngine:
+    """Deterministic evaluation of RuleType.RULE rules and keyword preconditions"""
+
+    def supports(self, rule: RuleDefinition) -> bool:
+        """规则是否可由本引擎确定性评估"""
+        return rule.rule_type == RuleType.RULE
+
+    def evaluate(
+        self,
+        rule: RuleDefinition,
+        response: str,
+        threshold: int = 1,
+        features: Optional[ResponseFeatures] = None
+    ) -> Tuple[bool, str]:
+        """
+        Evaluate one rule-based rule
+
+        Args:
+            rule: Rule definition (RuleType.RULE)
+            response: Response text
+            threshold: Threshold for rules that support it (e.g., multi_question)
+            features: Precomputed features of response (optional)
+
+        Returns:
+            Tuple of (passed, reason)
+        """
+        check = _RULE_CHECKS.get(rule.name)
+        if check is None:
+            return True, "规则未实现"
+        if features is None:
+            features = ResponseFeatures.extract(response)
+        return check(features, threshold)
+
+    def evaluate_all(
+        self,
+        response: str,
+        rules: Iterable[Tuple[RuleDefinition, int]]
+    ) -> List[Tuple[bool, str]]:
+        """
+        Evaluate several rule-based rules against one response (features extracted once)
+
+        Args:
+            response: Response text
+            rules: (rule, threshold) pairs
+
+        Returns:
+            List of (passed, reason), in rules order
+        """
+        features = ResponseFeatures.extract(response)
+        return [self.evaluate(rule, response, threshold, features) for rule, threshold in rules]
+
+    def evaluate_dataset(
+        self,
+        responses: Iterable[str],
+        rules: List[Tuple[RuleDefinition, int]]
+    ) -> List[List[Tuple[bool, str]]]:
+        """
+        Evaluate the same rule-based rules against a whole dataset of responses
+
+        Args:
+            responses: Response texts
+            rules: (rule, threshold) pairs
+
+        Returns:
+            One list of (passed, reason) per response, in input order
+        """
+        checks = [(_RULE_CHECKS.get(rule.name), threshold) for rule, threshold in rules]
+        results = []
+        for response in responses:
+            features = ResponseFeatures.extract(response)
+            results.append([
+                check(features, threshold) if check else (True, "规则未实现")
+                for check, threshold in checks
+            ])
+        return results
+
+    def decide_precondition(self, rule: RuleDefinition, conversation: List[Message]) -> Optional[bool]:
+        """
+        廉价预过滤：正则能确定前置条件时直接给出结果，否则返回 None（交给 LLM 判断）
+
+        目前可确定的前置条件：
+        - 用户年纪 >= 60岁：对话中出现明确年龄（"xx岁"），与 check_precondition_by_keywords
+          一致取全文第一个年龄
+
+        Args:
+            rule: Rule definition
+            conversation: Conversation context
+
+        Returns:
+            True / False，或 None 表示无法确定
+        """
+        if rule.rule_id == 6 or rule.name == "collect_phone_complication":
+            full_context = "\n".join([msg.content for msg in conversation])
+            age_match = _AGE_PATTERN.search(full_context)
+            if age_match:
+                return int(age_match.group(1)) >= 60
+        return None
+
+    def decide_precondition_text(self, precondition: str, text: str) -> Optional[bool]:
+        """
+        按 precondition 描述对单段文本做廉价预过滤（PreconditionIndex 逐轮检测时使用）
+
+        目前可确定的前置条件：
+        - "用户年龄 >= xx岁"：文本中出现明确年龄（"xx岁"）
+
+        Args:
+            precondition: 前置条件描述
+            text: 待检测文本（单轮 user 消息）
+
+        Returns:
+            True / False，或 None 表示无法确定
+        """
+        threshold_match = _AGE_PRECONDITION_PATTERN.search(precondition)
+        if threshold_match:
+            age_match = _AGE_PATTERN.search(text)
+            if age_match:
+                return int(age_match.group(1)) >= int(threshold_match.group(1))
+        return None
+
+    def check_precondition_by_keywords(self, rule: RuleDefinition, conversation: List[Message]) -> bool:
+        """关键词匹配判断前置条件（LLM 不可用时的降级逻辑）"""
+        full_context = "\n".join([msg.content for msg in conversation])
+
+        # Rule 3: User didn't mention examination/checkup (examination_invitation)
+        if rule.rule_id == 3 or rule.name == "examination_invitation":
+            return _EXAM_PATTERN.search(full_context) is None
+
+        # Rule 5: User mentioned medication history (collect_phone_medication)
+        if rule.rule_id == 5 or rule.name == "collect_phone_medication":
+            return _MEDICATION_PATTERN.search(full_context) is not None
+
+        # Rule 6: User age >= 60 (collect_phone_complication)
+        if rule.rule_id == 6 or rule.name == "collect_phone_complication":
+            age_match = _AGE_PATTERN.search(full_context)
+            return bool(age_match) and int(age_match.group(1)) >= 60
+
+        # Rule 7: User hasn't visited doctor (collect_phone_expert_interpretation)
+        if rule.rule_id == 7 or rule.name == "collect_phone_expert_interpretation":
+            return _VISIT_PATTERN.search(full_context) is None
+
+        return True
@@ -3,9 +3,13 @@ Dynamic Rule Registry
 Handles dynamic rule loading from JSON configurations
 """
 
-from typing import List, Dict, Optional, Callable, Any
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable, Any, Iterable
 from dataclasses import dataclass
 
+from IBench.rules.compiled_rules import CompiledRuleEngine
 from IBench.rules.rule_mappings import get_rule_mapping
 from IBench.rules.single_rules import SingleRuleRegistry
 from IBench.rules.stage_rules import StageRuleRegistry
@@ -215,7 +219,8 @@ def resolve_dynamic_N(
     N_config: Any,
     parsed_rule: ParsedRule,
     messages: List[Message],
-    llm_judge_func: Optional[Callable] = None
+    llm_judge_func: Optional[Callable] = None,
+    precondition_index: Optional["PreconditionIndex"] = None
 ) -> Optional[int]:
     """
     解析动态 N 值（支持 auto 模式）
@@ -225,6 +230,8 @@ def resolve_dynamic_N(
         parsed_rule: 解析后的规则对象
         messages: 对话历史
         llm_judge_func: LLM judge 函数（用于检测 precondition）
+        precondition_index: 可选的对话级 precondition 索引（同一用例的规则共享，
+            提供时忽略 llm_judge_func）
     
     Returns:
         实际的 N 值，如果 precondition 未满足则返回 None
@@ -237,6 +244,71 @@ def resolve_dynamic_N(
         return None
     
     # Case 2: "auto" 模式
+    offset, precondition = _parse_auto_N(N_config, parsed_rule)
+    
+    # 扫描对话，找到 precondition 满足的轮次
+    if precondition_index is not None:
+        triggered_turn = precondition_index.find_turn(precondition)
+    else:
+        triggered_turn = find_precondition_turn(messages, precondition, llm_judge_func)
+    
+    return _apply_offset(triggered_turn, offset, precondition)
+
+
+async def aresolve_dynamic_N(
+    N_config: Any,
+    parsed_rule: ParsedRule,
+    messages: List[Message],
+    llm_judge_func: Optional[Callable] = None,
+    precondition_index: Optional["PreconditionIndex"] = None
+) -> Optional[int]:
+    """
+    resolve_dynamic_N 的异步版本（llm_judge_func 为异步函数）
+    
+    Args:
+        N_config: 可以是 int、"auto" 或 {"value": "auto", "offset": 1}
+        parsed_rule: 解析后的规则对象
+        messages: 对话历史
+        llm_judge_func: 异步 LLM judge 函数（用于检测 precondition）
+        precondition_index: 可选的对话级 precondition 索引（以异步 judge 函数构造）
+    
+    Returns:
+        实际的 N 值，如果 precondition 未满足则返回 None
+    """
+    if isinstance(N_config, int):
+        return N_config
+    
+    if N_config is None:
+        return None
+    
+    offset, precondition = _parse_auto_N(N_config, parsed_rule)
+    if precondition_index is not None:
+        triggered_turn = await precondition_index.afind_turn(precondition)
+    else:
+        triggered_turn = await afind_precondition_turn(messages, precondition, llm_judge_func)
+    
+    return _apply_offset(triggered_turn, offset, precondition)
+
+
+def get_auto_precondition(N_config: Any, parsed_rule: ParsedRule) -> Optional[str]:
+    """
+    获取 auto 模式规则的 precondition（用于预先构建 PreconditionIndex）
+
+    Returns:
+        precondition 描述；显式 N 或未配置 N 时返回 None
+    """
+    if N_config is None or isinstance(N_config, int):
+        return None
+    return _parse_auto_N(N_config, parsed_rule)[1]
+
+
+def _parse_auto_N(N_config: Any, parsed_rule: ParsedRule) -> tuple[int, str]:
+    """
+    解析 auto 模式的 N 配置
+
+    Returns:
+        (offset, precondition)
+    """
     offset = 0  # 默认 offset（precondition满足的那一轮）
 
     if isinstance(N_config, str):
@@ -259,14 +331,15 @@ def resolve_dynamic_N(
     if not precondition:
         raise ValueError(f"规则 {parsed_rule.rule_name} 没有 precondition，无法使用 N=auto")
     
-    # 扫描对话，找到 precondition 满足的轮次
-    triggered_turn = find_precondition_turn(messages, precondition, llm_judge_func)
-    
+    return offset, precondition
+
+
+def _apply_offset(triggered_turn: Optional[int], offset: int, precondition: str) -> Optional[int]:
+    """计算 N = N' + offset，precondition 未满足时返回 None"""
     if triggered_turn is None:
         print(f"⚠ 警告: precondition '{precondition}' 从未满足，跳过该规则")
         return None
     
-    # 计算 N = N' + offset
     return triggered_turn + offset
 
 
@@ -290,6 +363,188 @@ def find_precondition_turn(
         print(f"⚠ 警告: 没有 LLM judge，无法检测 precondition '{precondition}'")
         return None
     
+    for turn_id, user_message in _iter_user_turns(messages):
+        prompt = _build_precondition_prompt(precondition, user_message)
+        
+        try:
+            result = llm_judge_func(user_message, prompt)
+            if _is_precondition_satisfied(result):
+                return turn_id
+        except Exception as e:
+            print(f"⚠ 警告: 检测 precondition 时出错: {e}")
+            continue
+    
+    return None
+
+
+async def afind_precondition_turn(
+    messages: List[Message],
+    precondition: str,
+    llm_judge_func: Optional[Callable] = None
+) -> Optional[int]:
+    """
+    find_precondition_turn 的异步版本
+    
+    Args:
+        messages: 完整对话历史
+        precondition: 前置条件描述
+        llm_judge_func: 异步 LLM judge 函数
+    
+    Returns:
+        满足条件的第一轮次编号，如果未满足则返回 None
+    """
+    if not llm_judge_func:
+        print(f"⚠ 警告: 没有 LLM judge，无法检测 precondition '{precondition}'")
+        return None
+    
+    for turn_id, user_message in _iter_user_turns(messages):
+        prompt = _build_precondition_prompt(precondition, user_message)
+        
+        try:
+            result = await llm_judge_func(user_message, prompt)
+            if _is_precondition_satisfied(result):
+                return turn_id
+        except Exception as e:
+            print(f"⚠ 警告: 检测 precondition 时出错: {e}")
+            continue
+    
+    return None
+
+
+class PreconditionIndex:
+    """
+    Per-conversation precondition index
+
+    同一用例中的所有 N=auto 规则共享一个索引：每个不同的 precondition 在每个
+    user 轮次上只检测一次，且所有候选轮次并发检测，返回最早满足的轮次。
+    """
+
+    def __init__(
+        self,
+        messages: List[Message],
+        llm_judge_func: Optional[Callable] = None,
+        max_workers: int = 8,
+        rule_prefilter: bool = False
+    ):
+        """
+        Initialize precondition index
+
+        Args:
+            messages: 完整对话历史
+            llm_judge_func: LLM judge 函数；使用 afind_turn / aprefetch 时需为异步函数
+            max_workers: 同步模式下并发检测的线程数
+            rule_prefilter: 正则能确定某轮结果时跳过 LLM 判断（见 CompiledRuleEngine.decide_precondition_text）
+        """
+        self.turns = list(_iter_user_turns(messages))
+        self.llm_judge_func = llm_judge_func
+        self.max_workers = max_workers
+        self.rule_engine = CompiledRuleEngine() if rule_prefilter else None
+        self._earliest: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def find_turn(self, precondition: str) -> Optional[int]:
+        """
+        获取满足 precondition 的最早轮次
+
+        Returns:
+            轮次编号，未满足则返回 None
+        """
+        self.prefetch([precondition])
+        return self._earliest[precondition]
+
+    def prefetch(self, preconditions: Iterable[str]):
+        """一次并发检测多个 precondition 在所有轮次上的结果（已检测过的跳过）"""
+        with self._lock:
+            pending = [p for p in dict.fromkeys(preconditions) if p not in self._earliest]
+            if not pending:
+                return
+            if not self.llm_judge_func:
+                for precondition in pending:
+                    print(f"⚠ 警告: 没有 LLM judge，无法检测 precondition '{precondition}'")
+                    self._earliest[precondition] = None
+                return
+
+            jobs = [(p, turn_id, user_message) for p in pending for turn_id, user_message in self.turns]
+            verdicts = {}
+            if jobs:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+                    satisfied = executor.map(lambda job: self._check(*job), jobs)
+                    verdicts = {(p, turn_id): ok for (p, turn_id, _), ok in zip(jobs, satisfied)}
+
+            for precondition in pending:
+                self._earliest[precondition] = next(
+                    (turn_id for turn_id, _ in self.turns if verdicts[(precondition, turn_id)]), None
+                )
+
+    async def afind_turn(self, precondition: str) -> Optional[int]:
+        """find_turn 的异步版本（并发调用同一 precondition 时共享同一次检测）"""
+        if precondition in self._earliest:
+            return self._earliest[precondition]
+        task = self._tasks.get(precondition)
+        if task is None:
+            task = asyncio.ensure_future(self._ascan(precondition))
+            self._tasks[precondition] = task
+        return await task
+
+    async def aprefetch(self, preconditions: Iterable[str]):
+        """prefetch 的异步版本"""
+        await asyncio.gather(*[self.afind_turn(p) for p in dict.fromkeys(preconditions)])
+
+    async def _ascan(self, precondition: str) -> Optional[int]:
+        """并发检测所有轮次，返回最早满足的轮次"""
+        if not self.llm_judge_func:
+            print(f"⚠ 警告: 没有 LLM judge，无法检测 precondition '{precondition}'")
+            earliest = None
+        else:
+            satisfied = await asyncio.gather(*[
+                self._acheck(precondition, turn_id, user_message)
+                for turn_id, user_message in self.turns
+            ])
+            earliest = next(
+                (turn_id for (turn_id, _), ok in zip(self.turns, satisfied) if ok), None
+            )
+        self._earliest[precondition] = earliest
+        return earliest
+
+    def _prefilter(self, precondition: str, user_message: str) -> Optional[bool]:
+        """廉价预过滤：正则能确定结果时返回 True / False，否则返回 None"""
+        if self.rule_engine is None:
+            return None
+        return self.rule_engine.decide_precondition_text(precondition, user_message)
+
+    def _check(self, precondition: str, turn_id: int, user_message: str) -> bool:
+        """检测单个轮次"""
+        decided = self._prefilter(precondition, user_message)
+        if decided is not None:
+            return decided
+        prompt = _build_precondition_prompt(precondition, user_message)
+        try:
+            return _is_precondition_satisfied(self.llm_judge_func(user_message, prompt))
+        except Exception as e:
+            print(f"⚠ 警告: 检测 precondition 时出错（第{turn_id}轮）: {e}")
+            return False
+
+    async def _acheck(self, precondition: str, turn_id: int, user_message: str) -> bool:
+        """检测单个轮次（异步）"""
+        decided = self._prefilter(precondition, user_message)
+        if decided is not None:
+            return decided
+        prompt = _build_precondition_prompt(precondition, user_message)
+        try:
+            return _is_precondition_satisfied(await self.llm_judge_func(user_message, prompt))
+        except Exception as e:
+            print(f"⚠ 警告: 检测 precondition 时出错（第{turn_id}轮）: {e}")
+            return False
+
+
+def _iter_user_turns(messages: List[Message]):
+    """
+    按轮次遍历 user 消息
+
+    Yields:
+        (turn_id, user_message) 元组，turn_id 从 1 开始
+    """
     # 跳过 system 消息
     start_idx = 1 if messages[0].role == "system" else 0
 
@@ -306,10 +561,12 @@ def find_precondition_turn(
         if user_idx >= len(messages):
             break
         
-        user_message = messages[user_idx].content
-        
-        # 使用 LLM judge 检测是否满足 precondition
-        prompt = f"""请检查用户的以下回复是否满足条件：{precondition}
+        yield turn_id, messages[user_idx].content
+
+
+def _build_precondition_prompt(precondition: str, user_message: str) -> str:
+    """构造检测单轮 user 消息是否满足 precondition 的 prompt"""
+    return f"""请检查用户的以下回复是否满足条件：{precondition}
 
 用户回复：{user_message}
 
@@ -317,17 +574,10 @@ def find_precondition_turn(
 - "YES"：满足条件
 - "NO"：不满足条件
 """
-        
-        try:
-            result = llm_judge_func(user_message, prompt)
-            
-            # result 是 tuple[bool, str]，解包获取响应文本
-            if result and isinstance(result, tuple) and len(result) >= 2:
-                response_text = result[1]  # 获取第二个元素（reason）
-                if "YES" in response_text.upper():
-                    return turn_id
-        except Exception as e:
-            print(f"⚠ 警告: 检测 precondition 时出错: {e}")
-            continue
-    
-    return None
+
+
+def _is_precondition_satisfied(result: Any) -> bool:
+    """解析 judge 返回值：result 是 tuple[bool, str]，第二个元素（reason）中包含 YES 即满足"""
+    if result and isinstance(result, tuple) and len(result) >= 2:
+        return "YES" in result[1].upper()
+    return False
@@ -2,8 +2,8 @@
 Single Rules Definition and Evaluation
 6 single-turn rules for evaluating assistant responses
 """
-import re
 from typing import Optional, Callable
+from IBench.rules.compiled_rules import CompiledRuleEngine
 from IBench.utils.common import RuleDefinition, RuleType
 
 # Single rule definitions
@@ -79,6 +79,7 @@ class SingleRuleRegistry:
     def __init__(self):
         self.rules = SINGLE_RULES.copy()
         self.name_to_id = {rule.name: rule_id for rule_id, rule in self.rules.items()}
+        self.rule_engine = CompiledRuleEngine()
     
     def get_rule(self, rule_name: str) -> Optional[RuleDefinition]:
         """
@@ -133,6 +134,118 @@ class SingleRuleRegistry:
                 raise ValueError(f"LLM judge is required for LLM-based rule '{rule_name}'")
             return self._evaluate_llm_based(rule, response, llm_judge, N=N)
     
+    async def aevaluate_rule(
+        self,
+        rule_name: str,
+        response: str,
+        llm_judge: Optional[Callable] = None,
+        threshold: int = 1,
+        N: Optional[int] = None
+    ) -> tuple[bool, str]:
+        """
+        Async version of evaluate_rule
+
+        Args:
+            rule_name: Rule name (str) to evaluate
+            response: Assistant's response
+            llm_judge: Optional async LLM judge function for LLM-based rules
+            threshold: Threshold value for rules that support it (e.g., multi_question)
+            N: Optional N value for dynamic description
+
+        Returns:
+            Tuple of (passed: bool, reason: str)
+        """
+        rule = self.get_rule(rule_name)
+        if not rule:
+            raise ValueError(f"Rule '{rule_name}' not found")
+
+        if rule.rule_type == RuleType.RULE:
+            return self._evaluate_rule_based(rule.rule_id, response, rule, threshold)
+        if llm_judge is None:
+            raise ValueError(f"LLM judge is required for LLM-based rule '{rule_name}'")
+        return await llm_judge(response, self._get_llm_description(rule, N))
+    
+    def evaluate_rules_batch(
+        self,
+        rules: list[tuple[str, Optional[int]]],
+        response: str,
+        llm_judge_batch: Optional[Callable] = None
+    ) -> list[tuple[bool, str]]:
+        """
+        Evaluate several single rules against the same response
+        
+        Rule-based rules are evaluated locally; all LLM-based rules are sent
+        to the judge together in one llm_judge_batch call.
+        
+        Args:
+            rules: List of (rule_name, N); N is also the threshold for rule-based rules (default 1)
+            response: Assistant's response
+            llm_judge_batch: Batch LLM judge function (response, rule_descriptions) -> list[(passed, reason)]
+        
+        Returns:
+            List of (passed: bool, reason: str), in rules order
+        """
+        results, pending = self._prepare_batch(rules, response, llm_judge_batch)
+        if pending:
+            verdicts = self._evaluate_llm_based_batch(
+                [(rule, N) for _, rule, N in pending], response, llm_judge_batch
+            )
+            for (i, _, _), verdict in zip(pending, verdicts):
+                results[i] = verdict
+        return results
+    
+    async def aevaluate_rules_batch(
+        self,
+        rules: list[tuple[str, Optional[int]]],
+        response: str,
+        llm_judge_batch: Optional[Callable] = None
+    ) -> list[tuple[bool, str]]:
+        """
+        Async version of evaluate_rules_batch (llm_judge_batch is an async function)
+        """
+        results, pending = self._prepare_batch(rules, response, llm_judge_batch)
+        if pending:
+            verdicts = await self._evaluate_llm_based_batch(
+                [(rule, N) for _, rule, N in pending], response, llm_judge_batch
+            )
+            for (i, _, _), verdict in zip(pending, verdicts):
+                results[i] = verdict
+        return results
+    
+    def _prepare_batch(
+        self,
+        rules: list[tuple[str, Optional[int]]],
+        response: str,
+        llm_judge_batch: Optional[Callable]
+    ) -> tuple[list, list]:
+        """
+        Evaluate rule-based rules and collect LLM-based rules for batch judging
+        
+        Returns:
+            (results, pending): results has None placeholders for pending LLM rules;
+            pending is a list of (index, rule, N)
+        """
+        results = [None] * len(rules)
+        pending = []
+        rule_based = []
+        for i, (rule_name, N) in enumerate(rules):
+            rule = self.get_rule(rule_name)
+            if not rule:
+                raise ValueError(f"Rule '{rule_name}' not found")
+            
+            if rule.rule_type == RuleType.RULE:
+                rule_based.append((i, rule, N if N is not None else 1))
+            else:
+                if llm_judge_batch is None:
+                    raise ValueError(f"LLM judge is required for LLM-based rule '{rule_name}'")
+                pending.append((i, rule, N))
+        
+        # 所有确定性规则共用一次特征提取
+        verdicts = self.rule_engine.evaluate_all(response, [(rule, threshold) for _, rule, threshold in rule_based])
+        for (i, _, _), verdict in zip(rule_based, verdicts):
+            results[i] = verdict
+        return results, pending
+    
     def _evaluate_rule_based(
         self,
         rule_id: int,
@@ -140,40 +253,8 @@ class SingleRuleRegistry:
         rule: RuleDefinition,
         threshold: int = 1
     ) -> tuple[bool, str]:
-        """Evaluate rule-based rules"""
-
-        # Rule 4: Check for multiple questions (multi_question)
-        if rule_id == 4 or rule.name == "multi_question":
-            question_count = response.count('？') + response.count('?')
-            passed = question_count <= threshold
-            if not passed:
-                return False, f"违规: 发现{question_count}个问题，超过阈值{threshold}"
-            else:
-                return True, f"未违规: 发现{question_count}个问题，未超过阈值{threshold}"
-
-        # Rule 7: Check for punctuation used for explanation (punctuation)
-        if rule_id == 7 or rule.name == "punctuation":
-            # Check for quotes or brackets used for explanation
-            has_quotes = bool(re.search(r'["\"][^\"\"]*["\"]', response))
-            has_single_quotes = bool(re.search(r"['\'][^'\']*['\']", response))
-            has_parens = bool(re.search(r'\([^)]*\)', response))
-            has_dashes = bool(re.search(r'—[^—]*—', response))
-            has_hyphens = bool(re.search(r'-[^-]*-', response))
-
-            if has_quotes or has_single_quotes or has_parens or has_dashes or has_hyphens:
-                return False, "违规: 使用了标点符号进行解释"
-            return True, "未违规: 未使用标点符号进行解释"
-
-        # Rule 8: Check for list format (list)
-        if rule_id == 8 or rule.name == "list":
-            # Check for numbered list format like "1.", "2.", "3."
-            list_pattern = r'^\s*\d+\.\s'
-            lines = response.split('\n')
-            list_count = sum(1 for line in lines if re.match(list_pattern, line))
-            passed = list_count == 0
-            return passed, f"{'违规' if not passed else '未违规'}: 发现{list_count}个列表项" if not passed else "未违规: 未使用列表格式"
-
-        return True, "规则未实现"
+        """Evaluate rule-based rules (precompiled, see CompiledRuleEngine)"""
+        return self.rule_engine.evaluate(rule, response, threshold)
     
     def _evaluate_llm_based(
         self,
@@ -194,13 +275,33 @@ class SingleRuleRegistry:
         Returns:
             Tuple of (passed, reason)
         """
-        # 获取动态描述（如果提供了N值）
-        if N is not None:
-            dynamic_description = self.get_description_with_N(rule.name, N=N)
-        else:
-            dynamic_description = rule.description
+        return llm_judge(response, self._get_llm_description(rule, N))
+    
+    def _evaluate_llm_based_batch(
+        self,
+        rules: list[tuple[RuleDefinition, Optional[int]]],
+        response: str,
+        llm_judge_batch: Callable
+    ):
+        """
+        Evaluate several LLM-based rules against one response in a single judge call
+        
+        Args:
+            rules: List of (rule, N)
+            response: Response text
+            llm_judge_batch: Batch LLM judge function (response, rule_descriptions) -> list[(passed, reason)]
         
-        return llm_judge(response, dynamic_description)
+        Returns:
+            Whatever llm_judge_batch returns (awaitable for async judges)
+        """
+        descriptions = [self._get_llm_description(rule, N) for rule, N in rules]
+        return llm_judge_batch(response, descriptions)
+    
+    def _get_llm_description(self, rule: RuleDefinition, N: Optional[int] = None) -> str:
+        """获取发送给 LLM judge 的规则描述（提供N值时使用动态描述）"""
+        if N is not None:
+            return self.get_description_with_N(rule.name, N=N)
+        return rule.description
     
     def get_rules_for_turn(self, turn_id: int, rule_mapping: dict) -> list[int]:
         """
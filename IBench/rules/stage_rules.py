@@ -2,8 +2,8 @@
 Stage Rules Definition and Evaluation
 7 stage rules for evaluating assistant responses at specific turns
 """
-import re
 from typing import Optional, Callable, Dict
+from IBench.rules.compiled_rules import CompiledRuleEngine
 from IBench.utils.common import RuleDefinition, RuleType, Message
 
 # Stage rule definitions
@@ -157,9 +157,15 @@ STAGE_RULES = {
 class StageRuleRegistry:
     """Registry for stage rules"""
     
-    def __init__(self):
+    def __init__(self, rule_prefilter: bool = False):
+        """
+        Args:
+            rule_prefilter: 前置条件能由正则确定时跳过 LLM 判断（见 CompiledRuleEngine.decide_precondition）
+        """
         self.rules = STAGE_RULES.copy()
         self.name_to_id = {rule.name: rule_id for rule_id, rule in self.rules.items()}
+        self.rule_engine = CompiledRuleEngine()
+        self.rule_prefilter = rule_prefilter
     
     def get_rule(self, rule_name: str) -> Optional[RuleDefinition]:
         """
@@ -218,6 +224,159 @@ class StageRuleRegistry:
                 raise ValueError(f"LLM judge is required for LLM-based rule '{rule_name}'")
             return self._evaluate_llm_based(rule, response, llm_judge, conversation, N=N)
     
+    async def aevaluate_rule(
+        self,
+        rule_name: str,
+        response: str,
+        llm_judge: Optional[Callable] = None,
+        conversation: Optional[list[Message]] = None,
+        N: Optional[int] = None
+    ) -> tuple[bool, str]:
+        """
+        Async version of evaluate_rule
+        
+        Args:
+            rule_name: Rule name (str) to evaluate
+            response: Assistant's response
+            llm_judge: Optional async LLM judge function for LLM-based rules
+            conversation: Full conversation context for precondition checking
+            N: Optional N value for dynamic description
+            
+        Returns:
+            Tuple of (passed: bool, reason: str)
+        """
+        rule = self.get_rule(rule_name)
+        if not rule:
+            raise ValueError(f"Rule '{rule_name}' not found")
+        
+        if rule.precondition and not await self._acheck_precondition(rule, conversation, llm_judge):
+            return True, f"规则{rule.rule_id}前置条件未满足: {rule.precondition}"
+        
+        if rule.rule_type == RuleType.RULE:
+            return self._evaluate_rule_based(rule.rule_id, response, rule)
+        if llm_judge is None:
+            raise ValueError(f"LLM judge is required for LLM-based rule '{rule_name}'")
+        return await llm_judge(
+            response,
+            self._get_llm_description(rule, N),
+            self._format_context(conversation)
+        )
+    
+    def evaluate_rules_batch(
+        self,
+        rules: list[tuple[str, Optional[int]]],
+        response: str,
+        llm_judge_batch: Optional[Callable] = None,
+        conversation: Optional[list[Message]] = None
+    ) -> list[tuple[bool, str]]:
+        """
+        Evaluate several stage rules against the same response and context
+        
+        Preconditions are checked per rule; all remaining LLM-based rules are
+        sent to the judge together in one llm_judge_batch call.
+        
+        Args:
+            rules: List of (rule_name, N)
+            response: Assistant's response
+            llm_judge_batch: Batch LLM judge function (response, rule_descriptions, context) -> list[(passed, reason)]
+            conversation: Full conversation context for precondition checking
+            
+        Returns:
+            List of (passed: bool, reason: str), in rules order
+        """
+        results = [None] * len(rules)
+        pending = []
+        for i, (rule_name, N) in enumerate(rules):
+            rule = self._get_rule_or_raise(rule_name)
+            if rule.precondition and not self._check_precondition(rule, conversation, llm_judge_batch):
+                results[i] = (True, f"规则{rule.rule_id}前置条件未满足: {rule.precondition}")
+            else:
+                self._collect_batch_item(i, rule, N, response, llm_judge_batch, results, pending)
+        
+        if pending:
+            verdicts = self._evaluate_llm_based_batch(
+                [(rule, N) for _, rule, N in pending], response, llm_judge_batch, conversation
+            )
+            for (i, _, _), verdict in zip(pending, verdicts):
+                results[i] = verdict
+        return results
+    
+    async def aevaluate_rules_batch(
+        self,
+        rules: list[tuple[str, Optional[int]]],
+        response: str,
+        llm_judge_batch: Optional[Callable] = None,
+        conversation: Optional[list[Message]] = None
+    ) -> list[tuple[bool, str]]:
+        """
+        Async version of evaluate_rules_batch (llm_judge_batch is an async function)
+        """
+        results = [None] * len(rules)
+        pending = []
+        for i, (rule_name, N) in enumerate(rules):
+            rule = self._get_rule_or_raise(rule_name)
+            if rule.precondition and not await self._acheck_precondition(rule, conversation, llm_judge_batch):
+                results[i] = (True, f"规则{rule.rule_id}前置条件未满足: {rule.precondition}")
+            else:
+                self._collect_batch_item(i, rule, N, response, llm_judge_batch, results, pending)
+        
+        if pending:
+            verdicts = await self._evaluate_llm_based_batch(
+                [(rule, N) for _, rule, N in pending], response, llm_judge_batch, conversation
+            )
+            for (i, _, _), verdict in zip(pending, verdicts):
+                results[i] = verdict
+        return results
+    
+    def _get_rule_or_raise(self, rule_name: str) -> RuleDefinition:
+        """Get rule by name, raise ValueError if not found"""
+        rule = self.get_rule(rule_name)
+        if not rule:
+            raise ValueError(f"Rule '{rule_name}' not found")
+        return rule
+    
+    def _collect_batch_item(
+        self,
+        index: int,
+        rule: RuleDefinition,
+        N: Optional[int],
+        response: str,
+        llm_judge_batch: Optional[Callable],
+        results: list,
+        pending: list
+    ):
+        """Evaluate a rule-based rule in place, or queue an LLM-based rule for batch judging"""
+        if rule.rule_type == RuleType.RULE:
+            results[index] = self._evaluate_rule_based(rule.rule_id, response, rule)
+        else:
+            if llm_judge_batch is None:
+                raise ValueError(f"LLM judge is required for LLM-based rule '{rule.name}'")
+            pending.append((index, rule, N))
+    
+    async def _acheck_precondition(self, rule: RuleDefinition, conversation: Optional[list[Message]], llm_judge=None) -> bool:
+        """
+        _check_precondition 的异步版本（llm_judge 需提供 acheck_precondition）
+        """
+        if not rule.precondition:
+            return True
+        
+        if not conversation:
+            return False
+        
+        # 廉价规则优先：正则能确定结果时不再调用 LLM
+        if self.rule_prefilter:
+            decided = self.rule_engine.decide_precondition(rule, conversation)
+            if decided is not None:
+                return decided
+        
+        if llm_judge and hasattr(llm_judge, 'acheck_precondition'):
+            try:
+                return await llm_judge.acheck_precondition(self._format_context(conversation), rule.precondition)
+            except Exception as e:
+                print(f"LLM precondition check failed for rule {rule.rule_id}, falling back to keyword matching: {e}")
+        
+        return self._check_precondition_by_keywords(rule, conversation)
+    
     def _check_precondition(self, rule: RuleDefinition, conversation: Optional[list[Message]], llm_judge=None) -> bool:
         """
         Check if rule precondition is met
@@ -229,44 +388,25 @@ class StageRuleRegistry:
         if not conversation:
             return False
         
+        # 廉价规则优先：正则能确定结果时不再调用 LLM
+        if self.rule_prefilter:
+            decided = self.rule_engine.decide_precondition(rule, conversation)
+            if decided is not None:
+                return decided
+        
         # 尝试使用 LLM 判断
         if llm_judge and hasattr(llm_judge, 'check_precondition'):
             try:
-                context_str = "\n".join([f"{msg.role}: {msg.content}" for msg in conversation])
-                return llm_judge.check_precondition(context_str, rule.precondition)
+                return llm_judge.check_precondition(self._format_context(conversation), rule.precondition)
             except Exception as e:
                 print(f"LLM precondition check failed for rule {rule.rule_id}, falling back to keyword matching: {e}")
         
         # Fallback: 关键词匹配（保留原有逻辑）
-        full_context = "\n".join([msg.content for msg in conversation])
-        
-        # Rule 3: User didn't mention examination/checkup (examination_invitation)
-        if rule.rule_id == 3 or rule.name == "examination_invitation":
-            exam_keywords = ['检查', '体检', '化验', '测试', '诊断']
-            has_exam = any(keyword in full_context for keyword in exam_keywords)
-            return not has_exam
-        
-        # Rule 5: User mentioned medication history (collect_phone_medication)
-        if rule.rule_id == 5 or rule.name == "collect_phone_medication":
-            medication_keywords = ['药', '吃药', '服药', '药物', '治疗']
-            has_medication = any(keyword in full_context for keyword in medication_keywords)
-            return has_medication
-        
-        # Rule 6: User age >= 60 (collect_phone_complication)
-        if rule.rule_id == 6 or rule.name == "collect_phone_complication":
-            age_match = re.search(r'(\d+)\s*[岁岁]', full_context)
-            if age_match:
-                age = int(age_match.group(1))
-                return age >= 60
-            return False
-        
-        # Rule 7: User hasn't visited doctor (collect_phone_expert_interpretation)
-        if rule.rule_id == 7 or rule.name == "collect_phone_expert_interpretation":
-            visit_keywords = ['去过医院', '看过医生', '就诊', '去过']
-            has_visited = any(keyword in full_context for keyword in visit_keywords)
-            return not has_visited
-        
-        return True
+        return self._check_precondition_by_keywords(rule, conversation)
+    
+    def _check_precondition_by_keywords(self, rule: RuleDefinition, conversation: list[Message]) -> bool:
+        """关键词匹配判断前置条件（LLM 不可用时的降级逻辑）"""
+        return self.rule_engine.check_precondition_by_keywords(rule, conversation)
     
     def _evaluate_rule_based(
         self,
@@ -274,15 +414,8 @@ class StageRuleRegistry:
         response: str,
         rule: RuleDefinition
     ) -> tuple[bool, str]:
-        """Evaluate rule-based rules"""
-        
-        # Rule 4: Ask about gender (inquire_gender)
-        if rule_id == 4 or rule.name == "inquire_gender":
-            gender_keywords = ['男', '女', '性别', '是男是女', '先生还是女士']
-            found = any(keyword in response for keyword in gender_keywords)
-            return found, f"{'符合' if found else '不符合'}: {'询问了性别' if found else '未询问性别'}"
-        
-        return True, "规则未实现"
+        """Evaluate rule-based rules (precompiled, see CompiledRuleEngine)"""
+        return self.rule_engine.evaluate(rule, response)
     
     def _evaluate_llm_based(
         self,
@@ -305,21 +438,50 @@ class StageRuleRegistry:
         Returns:
             Tuple of (passed, reason)
         """
-        # 获取动态描述（如果提供了N值）
+        return llm_judge(
+            response,
+            self._get_llm_description(rule, N),
+            self._format_context(conversation)
+        )
+    
+    def _evaluate_llm_based_batch(
+        self,
+        rules: list[tuple[RuleDefinition, Optional[int]]],
+        response: str,
+        llm_judge_batch: Callable,
+        conversation: Optional[list[Message]] = None
+    ):
+        """
+        Evaluate several LLM-based rules against one response in a single judge call
+        
+        Args:
+            rules: List of (rule, N)
+            response: Response text
+            llm_judge_batch: Batch LLM judge function
+            conversation: Full conversation context
+            
+        Returns:
+            Whatever llm_judge_batch returns (awaitable for async judges)
+        """
+        descriptions = [self._get_llm_description(rule, N) for rule, N in rules]
+        return llm_judge_batch(response, descriptions, self._format_context(conversation))
+    
+    def _get_llm_description(self, rule: RuleDefinition, N: Optional[int] = None) -> str:
+        """获取发送给 LLM judge 的规则描述（提供N值时使用动态描述）"""
         if N is not None:
-            dynamic_description = self.get_description_with_N(
+            return self.get_description_with_N(
                 rule.name,
                 N=N,
                 rule_class=getattr(rule, 'rule_class', None)
             )
-        else:
-            dynamic_description = rule.description
-        
-        context_str = ""
-        if conversation:
-            context_str = "\n".join([f"{msg.role}: {msg.content}" for msg in conversation])
-        
-        return llm_judge(response, dynamic_description, context_str)
+        return rule.description
+    
+    @staticmethod
+    def _format_context(conversation: Optional[list[Message]]) -> str:
+        """将对话格式化为 judge 使用的上下文字符串"""
+        if not conversation:
+            return ""
+        return "\n".join([f"{msg.role}: {msg.content}" for msg in conversation])
     
     def get_rules_for_turn(self, turn_id: int, rule_mapping: dict) -> list[int]:
         """
@@ -432,6 +594,7 @@ class StageRuleRegistry:
                 17: "N_th",  # ask_phone
                 19: "N_th",  # hospital_information
             }
-            rule_class = default_class_map.get(rule.rule_id, "FIRST_N")
+            rule = self.get_rule(rule_name)
+            rule_class = default_class_map.get(rule.rule_id if rule else None, "FIRST_N")
         
         return f"multi_turn:{rule_class}:{category}:{rule_name}"
@@ -12,15 +12,17 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from IBench.pipeline.json_context_evaluator import JsonContextEvaluator
+from IBench.pipeline.golden_history_runner import evaluate_stream
 
 
-def batch_evaluate_dataset(dataset_path: str, output_dir: str):
+def batch_evaluate_dataset(dataset_path: str, output_dir: str, workers: int = 1):
     """
     批量评估数据集
 
     Args:
         dataset_path: 数据集JSON文件路径
         output_dir: 输出目录
+        workers: 并发评估线程数
     """
     # 加载数据集
     print(f"📂 加载数据集: {dataset_path}")
@@ -38,82 +40,25 @@ def batch_evaluate_dataset(dataset_path: str, output_dir: str):
     evaluator = JsonContextEvaluator()
     print("✓ 评估器初始化完成\n")
 
-    # 批量评估
-    results = []
-    summary = {
-        "total_cases": len(test_cases),
-        "evaluated_cases": 0,
-        "failed_cases": 0,
-        "total_score": 0,
-        "case_details": []
-    }
-
     print("="*60)
     print("开始批量评估")
     print("="*60 + "\n")
 
-    for i, test_case in enumerate(test_cases, 1):
-        case_key = test_case['key']
-        case_desc = test_case.get('description', 'N/A')
-
-        print(f"[{i}/{len(test_cases)}] 测试用例 {case_key}: {case_desc}")
-
-        try:
-            # 保存临时输入文件
-            temp_input = os.path.join(output_dir, f"temp_input_{case_key}.json")
-            with open(temp_input, 'w', encoding='utf-8') as f:
-                json.dump(test_case, f, ensure_ascii=False, indent=2)
-
-            # 评估
-            temp_output = os.path.join(output_dir, f"output_{case_key}.json")
-            result = evaluator.evaluate_from_json(temp_input, temp_output)
-
-            # 提取评估结果
-            evaluations = result['evaluations']
-            total_score = sum(e['score'] for e in evaluations)
-            triggered_rules = [e['rule'] for e in evaluations if e['triggered']]
-
-            results.append(result)
-            summary['evaluated_cases'] += 1
-            summary['total_score'] += total_score
-
-            print(f"  ✓ 得分: {total_score}")
-            print(f"  ✓ 触发规则: {len(triggered_rules)} 条")
-            print(f"  ✓ 生成回复: {result['generated_response'][:50]}...")
-
-            # 记录详情
-            summary['case_details'].append({
-                "key": case_key,
-                "description": case_desc,
-                "score": total_score,
-                "triggered_rules": triggered_rules,
-                "total_rules": len(evaluations)
-            })
-
-        except Exception as e:
-            print(f"  ✗ 评估失败: {e}")
-            summary['failed_cases'] += 1
-            summary['case_details'].append({
-                "key": case_key,
-                "description": case_desc,
-                "error": str(e)
-            })
-
-        print()
+    # 每条用例评估完成即追加写入，不再保留全部结果在内存中
+    all_results_path = os.path.join(output_dir, "all_results.jsonl")
+    stream_summary = evaluate_stream(evaluator, test_cases, all_results_path, workers=workers)
 
     # 生成汇总报告
     print("="*60)
     print("评估汇总")
     print("="*60)
 
-    avg_score = summary['total_score'] / max(summary['evaluated_cases'], 1)
-    summary['average_score'] = avg_score
-
-    print(f"总用例数: {summary['total_cases']}")
-    print(f"成功评估: {summary['evaluated_cases']}")
-    print(f"失败数量: {summary['failed_cases']}")
+    summary = stream_summary.to_dict()
+    print(f"总用例数: {summary['total_entries']}")
+    print(f"成功评估: {summary['evaluated_entries']}")
+    print(f"失败数量: {summary['failed_entries']}")
     print(f"总得分: {summary['total_score']}")
-    print(f"平均得分: {avg_score:.2f}")
+    print(f"平均得分: {summary['average_score']:.2f}")
 
     # 保存汇总报告
     summary_path = os.path.join(output_dir, "evaluation_summary.json")
@@ -121,15 +66,6 @@ def batch_evaluate_dataset(dataset_path: str, output_dir: str):
         json.dump(summary, f, ensure_ascii=False, indent=2)
 
     print(f"\n✓ 汇总报告已保存: {summary_path}")
-
-    # 保存完整结果
-    all_results_path = os.path.join(output_dir, "all_results.json")
-    with open(all_results_path, 'w', encoding='utf-8') as f:
-        json.dump({
-            "summary": summary,
-            "results": results
-        }, f, ensure_ascii=False, indent=2)
-
     print(f"✓ 完整结果已保存: {all_results_path}")
 
     return summary
@@ -6,122 +6,39 @@
 import json
 import os
 import sys
-import uuid
-import threading
 import argparse
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Optional
 
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from IBench.pipeline.json_context_evaluator import JsonContextEvaluator
+from IBench.pipeline.golden_history_runner import evaluate_stream, iter_jsonl
+from IBench.pipeline.run_manifest import RunManifest
 from IBench.models.model_configs import Config, list_available_models
 
 
-def load_jsonl(file_path: str) -> List[Dict[str, Any]]:
-    """
-    加载JSONL文件
-    
-    Args:
-        file_path: JSONL文件路径
-    
-    Returns:
-        JSON对象列表
-    """
-    data = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data.append(json.loads(line))
-    return data
-
-
-def evaluate_single_entry(
-    entry: Dict[str, Any],
-    index: int,
-    total: int,
-    output_dir: str,
-    evaluator: 'JsonContextEvaluator',
-    print_lock: threading.Lock
-) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-    """
-    评估单个条目（线程安全）
-    
-    Args:
-        entry: 数据条目
-        index: 条目索引
-        total: 总条目数
-        output_dir: 输出目录
-        evaluator: 评估器
-        print_lock: 打印锁
-    
-    Returns:
-        (评估结果, 详情信息) 或 (None, 错误信息)
-    """
-    key = entry.get('key', f'entry_{index}')
-    unique_id = str(uuid.uuid4())[:8]
-    temp_input_path = os.path.join(output_dir, f"temp_input_{key}_{unique_id}.json")
-    
-    try:
-        # 线程安全的打印
-        with print_lock:
-            print(f"[{index}/{total}] 评估条目 {key}")
-        
-        # 保存临时输入文件
-        with open(temp_input_path, 'w', encoding='utf-8') as f:
-            json.dump(entry, f, ensure_ascii=False, indent=2)
-        
-        # 评估
-        result = evaluator.evaluate_from_json(temp_input_path, None)
-        
-        # 提取评估结果
-        evaluations = result.get('evaluations', [])
-        total_score = sum(e.get('score', 0) for e in evaluations)
-        triggered_rules = [e['rule'] for e in evaluations if e.get('triggered', False)]
-        
-        # 线程安全的打印结果
-        with print_lock:
-            print(f"  ✓ {key} 得分: {total_score}, 触发规则: {len(triggered_rules)}/{len(evaluations)}")
-        
-        # 记录详情
-        detail = {
-            "key": key,
-            "score": total_score,
-            "triggered_count": len(triggered_rules),
-            "total_rules": len(evaluations),
-            "triggered_rules": triggered_rules
-        }
-        
-        return result, detail
-        
-    except Exception as e:
-        # 线程安全的打印错误
-        with print_lock:
-            print(f"  ✗ {key} 评估失败: {e}")
-        
-        error_detail = {
-            "key": key,
-            "error": str(e)
-        }
-        return None, error_detail
-        
-    finally:
-        # 清理临时文件
-        try:
-            os.remove(temp_input_path)
-        except:
-            pass
-
-
 def evaluate_golden_history_jsonl(
     jsonl_path: str,
     output_dir: str,
     model_name: str = "Qwen3-8B",
     api_key: Optional[str] = None,
-    workers: int = 5
+    workers: int = 5,
+    async_judge: bool = False,
+    judge_concurrency: Optional[int] = None,
+    batch_judge: bool = False,
+    judge_cache: Optional[str] = None,
+    judge_cache_max_entries: Optional[int] = None,
+    judge_cache_max_age_days: Optional[float] = None,
+    batch_generate: bool = False,
+    gen_batch_size: Optional[int] = None,
+    gen_token_budget: Optional[int] = None,
+    backend: Optional[str] = None,
+    generation_api_base: Optional[str] = None,
+    resume: bool = False,
+    max_retries: int = 2,
+    rule_prefilter: bool = False
 ) -> Dict[str, Any]:
     """
     批量评估黄金历史JSONL数据集
@@ -132,14 +49,25 @@ def evaluate_golden_history_jsonl(
         model_name: 模型名称
         api_key: API密钥（可选）
         workers: 并发线程数
+        async_judge: 是否使用异步并发 judge 评估
+        judge_concurrency: 每条用例的最大并发 judge 请求数（可选）
+        batch_judge: 是否将同一条回复的多条 LLM 规则合并为一次 judge 请求
+        judge_cache: judge 结果缓存文件路径（SQLite，默认 输出目录/judge_cache.sqlite）
+        judge_cache_max_entries: judge 缓存最大条数，超出后淘汰最久未访问的条目（0 表示不限制）
+        judge_cache_max_age_days: judge 缓存条目最长保留天数（0 表示不限制）
+        batch_generate: 是否按块批量生成回复，再评估规则
+        gen_batch_size: 批量生成每批最多条数（可选）
+        gen_token_budget: 批量生成每批 token 上限（可选）
+        backend: 生成后端 hf / vllm / openai（可选）
+        generation_api_base: openai 生成后端的服务地址（可选）
+        resume: 是否从上次中断处继续（跳过已完成用例，复用已生成回复和 judge 结果）
+        max_retries: 失败用例的最大重试次数
+        rule_prefilter: 前置条件能由正则确定时跳过 LLM 判断
 
     Returns:
         汇总统计信息
     """
-    # 加载数据集
-    print(f"📂 加载数据集: {jsonl_path}")
-    entries = load_jsonl(jsonl_path)
-    print(f"✓ 找到 {len(entries)} 个条目\n")
+    print(f"📂 数据集: {jsonl_path}（流式读取）\n")
 
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
@@ -149,81 +77,84 @@ def evaluate_golden_history_jsonl(
     config = Config(model_name=model_name)
     if api_key:
         config.model.api_key = api_key
+    if async_judge:
+        config.evaluation.async_judge = True
+    if judge_concurrency:
+        config.model.judge_max_concurrency = judge_concurrency
+    if batch_judge:
+        config.evaluation.batch_judge = True
+    if judge_cache:
+        config.evaluation.judge_cache_path = judge_cache
+    if judge_cache_max_entries is not None:
+        config.evaluation.judge_cache_max_entries = judge_cache_max_entries or None
+    if judge_cache_max_age_days is not None:
+        config.evaluation.judge_cache_max_age_days = judge_cache_max_age_days or None
+    if rule_prefilter:
+        config.evaluation.rule_prefilter = True
+    if gen_batch_size:
+        config.model.generation_batch_size = gen_batch_size
+    if gen_token_budget:
+        config.model.generation_token_budget = gen_token_budget
+    if backend:
+        config.model.generation_backend = backend
+    if generation_api_base:
+        config.model.generation_api_base = generation_api_base
+    # 逐条 judge 结果默认持久化到输出目录，中断重跑时不重复已完成的 judge 调用
+    if not config.evaluation.judge_cache_path:
+        config.evaluation.judge_cache_path = os.path.join(output_dir, "judge_cache.sqlite")
     evaluator = JsonContextEvaluator(config=config)
-    print("✓ 评估器初始化完成\n")
+    print("✓ 评估器初始化完成")
+    if config.evaluation.enable_cache:
+        print(f"  Judge缓存: {config.evaluation.judge_cache_path}")
+    else:
+        print("  Judge缓存: 关闭")
+    print()
     
-    # 批量评估
+    # 流式评估：逐条读取、完成即写出
     output_jsonl_path = os.path.join(output_dir, "golden_history_output.jsonl")
-    results = []
-    summary = {
-        "total_entries": len(entries),
-        "evaluated_entries": 0,
-        "failed_entries": 0,
-        "total_score": 0,
-        "total_rules_checked": 0,
-        "total_rules_triggered": 0,
-        "entry_details": []
-    }
     
     print("=" * 60)
     print(f"开始批量评估（并发模式，{workers}线程）")
+    if batch_generate:
+        print(f"批量生成回复（每批最多 {config.model.generation_batch_size} 条，"
+              f"token 上限 {config.model.generation_token_budget}）")
     print("=" * 60 + "\n")
     
-    # 创建打印锁
-    print_lock = threading.Lock()
-    
-    # 使用线程池并发评估
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        # 提交所有任务
-        future_to_entry = {
-            executor.submit(evaluate_single_entry, entry, i, len(entries), output_dir, evaluator, print_lock): entry
-            for i, entry in enumerate(entries, 1)
-        }
-        
-        # 收集结果
-        for future in as_completed(future_to_entry):
-            result, detail = future.result()
-            
-            if result is not None:
-                # 成功评估
-                results.append(result)
-                summary['evaluated_entries'] += 1
-                summary['total_score'] += detail['score']
-                summary['total_rules_checked'] += detail['total_rules']
-                summary['total_rules_triggered'] += detail['triggered_count']
-                summary['entry_details'].append(detail)
-            else:
-                # 评估失败
-                summary['failed_entries'] += 1
-                summary['entry_details'].append(detail)
-    
-    # 统一写入JSONL文件
-    print("\n" + "=" * 60)
-    print("写入评估结果...")
-    print("=" * 60)
-    with open(output_jsonl_path, 'w', encoding='utf-8') as output_f:
-        for result in results:
-            output_line = json.dumps(result, ensure_ascii=False)
-            output_f.write(output_line + '\n')
-    print(f"✓ 已写入 {len(results)} 条结果到 {output_jsonl_path}")
+    manifest = RunManifest(
+        os.path.join(output_dir, "run_manifest.jsonl"),
+        RunManifest.config_fingerprint(config),
+        resume=resume
+    )
+    stream_summary = evaluate_stream(
+        evaluator,
+        iter_jsonl(jsonl_path),
+        output_jsonl_path,
+        workers=workers,
+        batch_generate=batch_generate,
+        manifest=manifest,
+        max_retries=max_retries
+    )
+    print(f"\n✓ 已写入 {stream_summary.evaluated_entries} 条结果到 {output_jsonl_path}")
     
     # 生成汇总报告
     print("=" * 60)
     print("评估汇总")
     print("=" * 60)
     
-    avg_score = summary['total_score'] / max(summary['evaluated_entries'], 1)
-    avg_triggered = summary['total_rules_triggered'] / max(summary['total_rules_checked'], 1) * 100
-    
-    summary['average_score'] = round(avg_score, 2)
-    summary['average_triggered_percent'] = round(avg_triggered, 2)
-    
+    summary = stream_summary.to_dict()
     print(f"总条目数: {summary['total_entries']}")
     print(f"成功评估: {summary['evaluated_entries']}")
     print(f"失败数量: {summary['failed_entries']}")
     print(f"总得分: {summary['total_score']}")
-    print(f"平均得分: {avg_score:.2f}")
-    print(f"规则触发率: {avg_triggered:.1f}%")
+    print(f"平均得分: {summary['average_score']:.2f}")
+    print(f"规则触发率: {summary['average_triggered_percent']:.1f}%")
+    
+    cache_stats = evaluator.judge_model.cache_stats()
+    if cache_stats is not None:
+        summary['judge_cache'] = cache_stats
+        print(f"Judge缓存命中率: {cache_stats['hit_rate'] * 100:.1f}% "
+              f"({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']}, "
+              f"共 {cache_stats['entries']} 条)")
     
     # 保存汇总报告
     summary_path = os.path.join(output_dir, "evaluation_summary.json")
@@ -288,6 +219,100 @@ def parse_args():
         help='并发线程数（默认：5）'
     )
 
+    parser.add_argument(
+        '--async-judge',
+        action='store_true',
+        help='异步并发评估每条用例的所有规则（AsyncOpenAI）'
+    )
+
+    parser.add_argument(
+        '--judge-concurrency',
+        type=int,
+        default=None,
+        help='异步模式下每条用例的最大并发 judge 请求数（默认：8）'
+    )
+
+    parser.add_argument(
+        '--batch-judge',
+        action='store_true',
+        help='同一条回复的多条 LLM 规则合并为一次 judge 请求（解析失败时逐条评估）'
+    )
+
+    parser.add_argument(
+        '--rule-prefilter',
+        action='store_true',
+        help='廉价规则优先：前置条件能由正则确定时（如用户明确给出年龄）跳过 LLM 判断'
+    )
+
+    parser.add_argument(
+        '--judge-cache',
+        type=str,
+        default=None,
+        help='judge 结果持久化缓存文件（SQLite），重复评估相同回复时直接复用结果（默认开启：输出目录/judge_cache.sqlite）'
+    )
+
+    parser.add_argument(
+        '--judge-cache-max-entries',
+        type=int,
+        default=100000,
+        help='judge 缓存最大条数，超出后淘汰最久未访问的条目（默认：100000，0 表示不限制）'
+    )
+
+    parser.add_argument(
+        '--judge-cache-max-age-days',
+        type=float,
+        default=30,
+        help='judge 缓存条目最长保留天数（默认：30，0 表示不限制）'
+    )
+
+    parser.add_argument(
+        '--batch-generate',
+        action='store_true',
+        help='按块读取用例，先按长度分桶批量生成回复再评估规则（生成下一块时上一块继续评估）'
+    )
+
+    parser.add_argument(
+        '--gen-batch-size',
+        type=int,
+        default=None,
+        help='批量生成每批最多条数（默认：8）'
+    )
+
+    parser.add_argument(
+        '--gen-token-budget',
+        type=int,
+        default=None,
+        help='批量生成每批 (最长prompt + max_new_tokens) * 条数 上限（默认：32768）'
+    )
+
+    parser.add_argument(
+        '--backend',
+        type=str,
+        default=None,
+        choices=['hf', 'vllm', 'openai'],
+        help='生成后端：hf（Transformers，默认）/ vllm / openai（OpenAI 兼容服务，需配合 --generation-api-base）'
+    )
+
+    parser.add_argument(
+        '--generation-api-base',
+        type=str,
+        default=None,
+        help='openai 生成后端的服务地址，如 http://localhost:8000/v1'
+    )
+
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='从上次中断处继续：跳过已完成用例，复用已生成的回复和 judge 结果（模型或配置变化时自动失效）'
+    )
+
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=2,
+        help='失败用例的最大重试次数（指数退避，默认：2）'
+    )
+
     parser.add_argument(
         '--list-models',
         action='store_true',
@@ -335,6 +360,11 @@ def main():
         print(f"  模型: {args.model}")
         print(f"  输出目录: {output_dir}")
         print(f"  并发线程: {args.workers}")
+        print(f"  异步Judge: {'开启' if args.async_judge else '关闭'}")
+        print(f"  批量Judge: {'开启' if args.batch_judge else '关闭'}")
+        print(f"  批量生成: {'开启' if args.batch_generate else '关闭'}")
+        print(f"  生成后端: {args.backend or 'hf'}")
+        print(f"  续跑: {'开启' if args.resume else '关闭'}")
         print(f"  API Key: {'已设置' if api_key else '未设置'}")
         print()
 
@@ -343,7 +373,21 @@ def main():
             output_dir=str(output_dir),
             model_name=args.model,
             api_key=api_key or None,
-            workers=args.workers
+            workers=args.workers,
+            async_judge=args.async_judge,
+            judge_concurrency=args.judge_concurrency,
+            batch_judge=args.batch_judge,
+            judge_cache=args.judge_cache,
+            judge_cache_max_entries=args.judge_cache_max_entries,
+            judge_cache_max_age_days=args.judge_cache_max_age_days,
+            batch_generate=args.batch_generate,
+            gen_batch_size=args.gen_batch_size,
+            gen_token_budget=args.gen_token_budget,
+            backend=args.backend,
+            generation_api_base=args.generation_api_base,
+            resume=args.resume,
+            max_retries=args.max_retries,
+            rule_prefilter=args.rule_prefilter
         )
         print("\n✓ 批量评估完成！")
         return 0
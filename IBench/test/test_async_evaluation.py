@@ -0,0 +1,136 @@
+"""
+Test async evaluation mode of JsonContextEvaluator
+Uses fake local/judge models, no GPU or API key required
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.models.model_configs import Config
+from IBench.pipeline.json_context_evaluator import JsonContextEvaluator
+from IBench.rules.dynamic_rule_registry import DynamicRuleRegistry
+from IBench.rules.kwargs_extractor import KwargsExtractor
+from IBench.rules.single_rules import SingleRuleRegistry
+from IBench.rules.stage_rules import StageRuleRegistry
+
+
+TEST_CASE = {
+    "key": "async_001",
+    "messages": [
+        {"role": "system", "content": "你是医院客服", "turn_id": 0},
+        {"role": "user", "content": "孩子太矮了", "turn_id": 1},
+        {"role": "assistant", "content": "请问是为谁咨询？", "turn_id": 1},
+        {"role": "user", "content": "我在吃药，5岁", "turn_id": 2}
+    ],
+    "rule_list": [
+        "single_turn:sty:gratitude",
+        "single_turn:ask:multi_question",
+        {"rule": "multi_turn:FIRST_N:ask:consult_subject", "N": 1},
+        "single_turn:med:diagnosis_name",
+        {"rule": "multi_turn:N_th:conv:medication_phone", "N": "auto"},
+        "single_turn:sty:list"
+    ]
+}
+
+
+class FakeLocalModel:
+    """Returns a fixed response"""
+
+    def generate(self, messages):
+        return "感谢您的咨询，孩子多高了？平时吃饭怎么样？"
+
+    def generate_batch(self, message_batches):
+        return [self.generate(messages) for messages in message_batches]
+
+
+class FakeJudge:
+    """Deterministic judge with random latency to shuffle completion order"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _verdict(self, response, rule_description):
+        if "用户回复" in rule_description:
+            return True, "YES" if "药" in response else "NO"
+        violated = len(rule_description) % 2 == 0
+        return not violated, "VIOLATED" if violated else "NOT_VIOLATED"
+
+    def evaluate_with_judge(self, response, rule_description, context=None, N=None):
+        return self._verdict(response, rule_description)
+
+    async def aevaluate_with_judge(self, response, rule_description, context=None, N=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(random.uniform(0, 0.02))
+            return self._verdict(response, rule_description)
+        finally:
+            self.in_flight -= 1
+
+    def evaluate_with_judge_batch(self, response, rule_descriptions, context=None):
+        return [self._verdict(response, d) for d in rule_descriptions]
+
+    async def aevaluate_with_judge_batch(self, response, rule_descriptions, context=None):
+        return [await self.aevaluate_with_judge(response, d, context) for d in rule_descriptions]
+
+
+def _build_evaluator(judge):
+    evaluator = JsonContextEvaluator.__new__(JsonContextEvaluator)
+    evaluator.config = Config()
+    evaluator.local_model = FakeLocalModel()
+    evaluator.judge_model = judge
+    evaluator.dynamic_registry = DynamicRuleRegistry()
+    evaluator.single_rule_registry = SingleRuleRegistry()
+    evaluator.stage_rule_registry = StageRuleRegistry()
+    evaluator.kwargs_extractor = KwargsExtractor(llm_judge=judge)
+    return evaluator
+
+
+def test_async_matches_sync(tmp_path):
+    """异步模式的结果（包括顺序）应与同步模式完全一致"""
+    input_path = tmp_path / "case.json"
+    input_path.write_text(json.dumps(TEST_CASE, ensure_ascii=False), encoding="utf-8")
+
+    judge = FakeJudge()
+    evaluator = _build_evaluator(judge)
+
+    sync_result = evaluator.evaluate_from_json(str(input_path), async_judge=False)
+    async_result = evaluator.evaluate_from_json(str(input_path), async_judge=True)
+
+    assert async_result == sync_result
+    assert [e["rule"] for e in async_result["evaluations"]] == [
+        r if isinstance(r, str) else r["rule"] for r in TEST_CASE["rule_list"]
+    ]
+    assert judge.max_in_flight > 1
+    print("✓ async evaluation matches sync evaluation")
+
+
+def test_async_batch_matches_sync_batch(tmp_path):
+    """批量 judge 模式下，异步与同步结果一致"""
+    input_path = tmp_path / "case.json"
+    input_path.write_text(json.dumps(TEST_CASE, ensure_ascii=False), encoding="utf-8")
+
+    evaluator = _build_evaluator(FakeJudge())
+    evaluator.config.evaluation.batch_judge = True
+
+    sync_result = evaluator.evaluate_from_json(str(input_path), async_judge=False)
+    async_result = evaluator.evaluate_from_json(str(input_path), async_judge=True)
+
+    assert async_result == sync_result
+    print("✓ async batched evaluation matches sync batched evaluation")
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_async_matches_sync(Path(tmp_dir))
+        test_async_batch_matches_sync_batch(Path(tmp_dir))
@@ -0,0 +1,128 @@
+"""
+Test length-bucketed batch generation (LocalModel.generate_batch)
+Uses a fake tokenizer / model, no GPU or model weights required
+(numpy arrays stand in for tensors: test_quickstart replaces sys.modules['torch'])
+"""
+
+import dataclasses
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.models.generation_backends import OpenAICompatibleModel
+from IBench.models.local_model import LocalModel
+from IBench.models.model_configs import Config
+from IBench.utils.common import Message
+
+
+class FakeTokenizer:
+    """按字符编码，left padding"""
+    pad_token_id = 0
+    eos_token_id = 0
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return messages[-1]["content"]
+
+    def __call__(self, text, return_tensors=None, truncation=False, max_length=None, padding=False):
+        if isinstance(text, str):
+            return {"input_ids": [ord(c) for c in text]}
+        width = max(len(t) for t in text)
+        ids = [[0] * (width - len(t)) + [ord(c) for c in t] for t in text]
+        mask = [[0] * (width - len(t)) + [1] * len(t) for t in text]
+        return {"input_ids": np.array(ids), "attention_mask": np.array(mask)}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(i) for i in ids.tolist() if i != 0)
+
+
+class FakeModel:
+    """生成 = 重复 prompt 最后一个字符，并记录每批大小"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def parameters(self):
+        return iter([SimpleNamespace(device="cpu")])
+
+    def generate(self, input_ids, attention_mask, **kwargs):
+        self.batch_sizes.append(input_ids.shape[0])
+        return np.concatenate([input_ids, np.repeat(input_ids[:, -1:], 2, axis=1)], axis=1)
+
+
+def _build_local_model():
+    model = LocalModel.__new__(LocalModel)
+    # Config().model 是注册表中的共享对象，复制后再修改
+    model.config = dataclasses.replace(Config().model, max_new_tokens=4)
+    model.system_prompt = None
+    model.device = "cpu"
+    model.tokenizer = FakeTokenizer()
+    model.model = FakeModel()
+    return model
+
+
+def test_plan_batches():
+    """按长度排序分桶，遵守条数和 token 上限"""
+    lengths = [50, 10, 30, 20, 40]
+    assert LocalModel._plan_batches(lengths, 2, 10_000, 10) == [[1, 3], [2, 4], [0]]
+    # (30+10) * 3 = 120 > 90，第三条另起一批
+    assert LocalModel._plan_batches(lengths, 8, 90, 10) == [[1, 3], [2], [4], [0]]
+    # 单条超出上限也单独成批
+    assert LocalModel._plan_batches([500], 8, 100, 10) == [[0]]
+    print("✓ batch planning")
+
+
+def test_generate_batch_keeps_order():
+    """left padding 批量生成的结果按输入顺序返回"""
+    model = _build_local_model()
+    contents = ["孩子太矮了怎么办a", "b", "请问需要做什么检查c", "好的d", "谢谢e"]
+    conversations = [[Message(role="user", content=c, turn_id=1)] for c in contents]
+
+    responses = model.generate_batch(conversations, max_batch_size=2)
+
+    assert responses == [c[-1] * 2 for c in contents]
+    assert model.model.batch_sizes == [2, 2, 1]
+    print("✓ batched generation keeps input order")
+
+
+class FakeCompletions:
+    """Fake completions endpoint: 回复 = prompt 最后一个字符重复两次"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def create(self, model, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return SimpleNamespace(choices=[SimpleNamespace(text=prompt[-1] * 2)])
+
+
+def test_openai_backend_matches_local_prompt():
+    """OpenAI 兼容后端使用与 LocalModel 相同的 prompt，并发请求结果按输入顺序返回"""
+    local = _build_local_model()
+    local.system_prompt = "你是医院客服"
+
+    backend = OpenAICompatibleModel.__new__(OpenAICompatibleModel)
+    backend.config = local.config
+    backend.system_prompt = local.system_prompt
+    backend.model_name = "served-model"
+    backend.max_concurrency = 4
+    backend.tokenizer = local.tokenizer
+    completions = FakeCompletions()
+    backend.client = SimpleNamespace(completions=completions)
+
+    contents = ["孩子太矮了a", "b", "请问需要做什么检查c"]
+    conversations = [[Message(role="user", content=c, turn_id=1)] for c in contents]
+
+    assert backend.generate_batch(conversations) == local.generate_batch(conversations)
+    assert sorted(completions.prompts) == sorted(local._format_messages(c) for c in conversations)
+    print("✓ openai backend matches LocalModel prompts")
+
+
+if __name__ == "__main__":
+    test_plan_batches()
+    test_generate_batch_keeps_order()
+    test_openai_backend_matches_local_prompt()
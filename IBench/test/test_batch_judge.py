@@ -0,0 +1,140 @@
+"""
+Test batched multi-rule judge (APIModel.evaluate_with_judge_batch)
+Uses a fake OpenAI client, no API key required
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.models.api_model import APIModel
+from IBench.models.model_configs import Config
+from IBench.pipeline.json_context_evaluator import JsonContextEvaluator
+from IBench.rules.dynamic_rule_registry import DynamicRuleRegistry
+from IBench.rules.kwargs_extractor import KwargsExtractor
+from IBench.rules.single_rules import SingleRuleRegistry
+from IBench.rules.stage_rules import StageRuleRegistry
+
+from IBench.test.test_async_evaluation import TEST_CASE, FakeLocalModel
+
+
+def _is_violated(rule_description):
+    return len(rule_description) % 2 == 0
+
+
+class FakeCompletions:
+    """Fake chat.completions endpoint: answers single and batched judge prompts"""
+
+    def __init__(self, malformed_batch=False):
+        self.malformed_batch = malformed_batch
+        self.calls = []
+
+    def create(self, model, messages, **kwargs):
+        user_prompt = messages[-1]["content"]
+        self.calls.append(user_prompt)
+
+        if user_prompt.startswith("规则列表:"):
+            if self.malformed_batch:
+                content = "VIOLATED"
+            else:
+                rules_block = user_prompt.split("\n\n", 1)[0].splitlines()[1:]
+                items = []
+                for line in rules_block:
+                    idx, description = line.split(". ", 1)
+                    verdict = "VIOLATED" if _is_violated(description) else "NOT_VIOLATED"
+                    items.append({"id": int(idx), "verdict": verdict, "reason": "fake"})
+                content = "```json\n" + json.dumps(items, ensure_ascii=False) + "\n```"
+        elif user_prompt.startswith("规则描述:"):
+            description = user_prompt.split("\n", 1)[0][len("规则描述: "):]
+            content = "VIOLATED" if _is_violated(description) else "NOT_VIOLATED"
+        else:
+            content = "NO"
+
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _build_api_model(completions, judge_cache=None):
+    model = APIModel.__new__(APIModel)
+    model.config = Config().model
+    model.model_name = "fake-judge"
+    model.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    model.judge_cache = judge_cache
+    return model
+
+
+def _build_evaluator(judge, batch_judge):
+    evaluator = JsonContextEvaluator.__new__(JsonContextEvaluator)
+    evaluator.config = Config()
+    evaluator.config.evaluation.batch_judge = batch_judge
+    evaluator.local_model = FakeLocalModel()
+    evaluator.judge_model = judge
+    evaluator.dynamic_registry = DynamicRuleRegistry()
+    evaluator.single_rule_registry = SingleRuleRegistry()
+    evaluator.stage_rule_registry = StageRuleRegistry()
+    evaluator.kwargs_extractor = KwargsExtractor(llm_judge=judge)
+    return evaluator
+
+
+def test_parse_batch_verdicts():
+    """解析批量 judge 的 JSON 结果"""
+    text = '结果如下：[{"id": 2, "verdict": "VIOLATED", "reason": "有感谢"}, {"id": 1, "verdict": "not_violated"}]'
+    assert APIModel._parse_batch_verdicts(text, 2) == [
+        (True, "NOT_VIOLATED"),
+        (False, "VIOLATED: 有感谢"),
+    ]
+    # 缺少规则 / 非法 verdict / 非 JSON 都视为解析失败
+    assert APIModel._parse_batch_verdicts('[{"id": 1, "verdict": "VIOLATED"}]', 2) is None
+    assert APIModel._parse_batch_verdicts('[{"id": 1, "verdict": "MAYBE"}]', 1) is None
+    assert APIModel._parse_batch_verdicts("VIOLATED", 1) is None
+    print("✓ batch verdict parsing")
+
+
+def test_batch_judge_matches_per_rule(tmp_path):
+    """批量评估的触发结果与逐条评估一致，且 judge 请求数减少"""
+    input_path = tmp_path / "case.json"
+    input_path.write_text(json.dumps(TEST_CASE, ensure_ascii=False), encoding="utf-8")
+
+    per_rule_completions = FakeCompletions()
+    per_rule = _build_evaluator(_build_api_model(per_rule_completions), batch_judge=False)
+    per_rule_result = per_rule.evaluate_from_json(str(input_path), async_judge=False)
+
+    batch_completions = FakeCompletions()
+    batched = _build_evaluator(_build_api_model(batch_completions), batch_judge=True)
+    batch_result = batched.evaluate_from_json(str(input_path), async_judge=False)
+
+    assert [e["rule"] for e in batch_result["evaluations"]] == [
+        e["rule"] for e in per_rule_result["evaluations"]
+    ]
+    assert [e["triggered"] for e in batch_result["evaluations"]] == [
+        e["triggered"] for e in per_rule_result["evaluations"]
+    ]
+    assert len(batch_completions.calls) < len(per_rule_completions.calls)
+    print("✓ batched judge matches per-rule judge")
+
+
+def test_batch_judge_fallback():
+    """批量结果无法解析时降级为逐条评估"""
+    completions = FakeCompletions(malformed_batch=True)
+    judge = _build_api_model(completions)
+    descriptions = ["使用感谢用语", "直接给出疾病名称", "编造医院名称"]
+
+    verdicts = judge.evaluate_with_judge_batch("感谢您的咨询", descriptions)
+
+    assert verdicts == [judge.evaluate_with_judge("感谢您的咨询", d) for d in descriptions]
+    assert len(completions.calls) == 1 + 2 * len(descriptions)
+    print("✓ batched judge falls back to per-rule calls")
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    test_parse_batch_verdicts()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_batch_judge_matches_per_rule(Path(tmp_dir))
+    test_batch_judge_fallback()
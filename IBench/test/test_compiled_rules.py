@@ -0,0 +1,112 @@
+"""
+Test precompiled rule engine (RuleType.RULE rules and keyword preconditions)
+Compares against the original per-call regex implementation, no API key required
+"""
+
+import os
+import re
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.rules.compiled_rules import CompiledRuleEngine
+from IBench.rules.single_rules import SingleRuleRegistry
+from IBench.rules.stage_rules import StageRuleRegistry
+from IBench.utils.common import Message, RuleType
+
+RESPONSES = [
+    "",
+    "您好，请问孩子多大了？平时吃饭怎么样?",
+    "建议这样做：\n1. 多喝水\n2. 早睡\n 3. 少吃甜食",
+    "1.\n2. 第二项\r\n10. 第十项",
+    "这叫\"生长痛\"，也就是（骨骼发育）引起的",
+    "这是(暂时的)现象，属于—生理性—变化",
+    "请问是男孩还是女孩？",
+    "先生还是女士呢",
+    "普通回复 - 没有问题 - 的情况",
+    "It's 'fine' here",
+]
+
+
+def _legacy_rule_based(rule_name, response, threshold=1):
+    """原实现（每次调用重新执行未编译的正则）"""
+    if rule_name == "multi_question":
+        question_count = response.count('？') + response.count('?')
+        return question_count <= threshold
+    if rule_name == "punctuation":
+        return not any(re.search(p, response) for p in (
+            r'["\"][^\"\"]*["\"]', r"['\'][^'\']*['\']", r'\([^)]*\)', r'—[^—]*—', r'-[^-]*-'
+        ))
+    if rule_name == "list":
+        return sum(1 for line in response.split('\n') if re.match(r'^\s*\d+\.\s', line)) == 0
+    if rule_name == "gender":
+        return any(k in response for k in ['男', '女', '性别', '是男是女', '先生还是女士'])
+    return True
+
+
+def _rule_based_rules():
+    single = SingleRuleRegistry().get_rules_by_type(RuleType.RULE)
+    stage = StageRuleRegistry().get_rules_by_type(RuleType.RULE)
+    return [(rule, 1) for rule in single + stage]
+
+
+def test_matches_legacy_implementation():
+    """编译后的规则与原实现结果一致"""
+    engine = CompiledRuleEngine()
+    rules = _rule_based_rules()
+    assert sorted(rule.name for rule, _ in rules) == ["gender", "list", "multi_question", "punctuation"]
+
+    for response in RESPONSES:
+        for rule, threshold in rules:
+            passed, _ = engine.evaluate(rule, response, threshold)
+            assert passed == _legacy_rule_based(rule.name, response, threshold), (rule.name, response)
+    print("✓ compiled rules match legacy implementation")
+
+
+def test_evaluate_dataset():
+    """整个数据集一次评估与逐条评估一致"""
+    engine = CompiledRuleEngine()
+    rules = _rule_based_rules()
+    expected = [[engine.evaluate(rule, response, threshold) for rule, threshold in rules] for response in RESPONSES]
+
+    assert engine.evaluate_dataset(RESPONSES, rules) == expected
+    assert [engine.evaluate_all(response, rules) for response in RESPONSES] == expected
+    print("✓ dataset evaluation")
+
+
+def test_precondition_prefilter():
+    """正则能确定前置条件时不调用 LLM，无法确定时仍交给 LLM"""
+
+    class CountingPreconditionJudge:
+        def __init__(self):
+            self.calls = 0
+
+        def check_precondition(self, context, precondition):
+            self.calls += 1
+            return True
+
+    registry = StageRuleRegistry(rule_prefilter=True)
+    rule = registry.get_rule("complication_phone")
+    judge = CountingPreconditionJudge()
+
+    young = [Message(role="user", content="我今年35岁，最近头晕", turn_id=0), Message(role="assistant", content="60岁以上要注意", turn_id=0)]
+    old = [Message(role="user", content="我72 岁了", turn_id=0)]
+    unknown = [Message(role="user", content="我父亲年纪大了", turn_id=0)]
+
+    assert registry._check_precondition(rule, young, judge) is False
+    assert registry._check_precondition(rule, old, judge) is True
+    assert judge.calls == 0
+    assert registry._check_precondition(rule, unknown, judge) is True
+    assert judge.calls == 1
+
+    # 默认关闭：始终由 LLM 判断
+    assert StageRuleRegistry()._check_precondition(rule, young, judge) is True
+    assert judge.calls == 2
+    print("✓ precondition prefilter")
+
+
+if __name__ == "__main__":
+    test_matches_legacy_implementation()
+    test_evaluate_dataset()
+    test_precondition_prefilter()
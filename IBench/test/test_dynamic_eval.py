@@ -9,7 +9,43 @@ import os
 # Add the parent directory to the path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from IBench.models.model_configs import Config
 from IBench.pipeline.dynamic_interactive_eval import DynamicInteractiveEvaluator
+from IBench.rules.dynamic_rule_registry import DynamicRuleRegistry
+from IBench.rules.kwargs_extractor import KwargsExtractor
+from IBench.rules.single_rules import SingleRuleRegistry
+from IBench.rules.stage_rules import StageRuleRegistry
+from IBench.utils.common import Message
+
+
+class CountingJudge:
+    """Records judge calls; a rule passes when the response mentions 咨询"""
+
+    def __init__(self):
+        self.calls = []
+
+    def evaluate_with_judge(self, response, rule_description, context=None, N=None):
+        self.calls.append((response, rule_description, context))
+        return "咨询" in response, "judged"
+
+
+def _build_evaluator(judge):
+    evaluator = DynamicInteractiveEvaluator.__new__(DynamicInteractiveEvaluator)
+    evaluator.config = Config()
+    evaluator.judge_model = judge
+    evaluator.dynamic_registry = DynamicRuleRegistry()
+    evaluator.single_rule_registry = SingleRuleRegistry()
+    evaluator.stage_rule_registry = StageRuleRegistry()
+    evaluator.kwargs_extractor = KwargsExtractor(llm_judge=judge)
+    return evaluator
+
+
+def _build_conversation(responses):
+    messages = []
+    for turn_id, response in enumerate(responses):
+        messages.append(Message(role="user", content=f"问题{turn_id}", turn_id=turn_id))
+        messages.append(Message(role="assistant", content=response, turn_id=turn_id))
+    return messages
 
 
 def test_dynamic_interactive_evaluator():
@@ -103,6 +139,61 @@ def test_json_format():
     return True
 
 
+def test_incremental_rule_scheduling():
+    """FIRST_N规则触发后不再调用judge，N_th规则只在目标轮次评估"""
+    responses = ["您好", "请说", "请问是为谁咨询？", "好的", "嗯", "再见"]
+    judge = CountingJudge()
+    evaluator = _build_evaluator(judge)
+    conversation_by_turn = evaluator._organize_conversation(_build_conversation(responses))
+
+    evaluations = evaluator._evaluate_conversation(
+        conversation_by_turn=conversation_by_turn,
+        rule_list=[
+            {"rule": "multi_turn:FIRST_N:ask:consult_subject", "N": 4},
+            {"rule": "multi_turn:N_th:conv:ask_phone", "N": 5},
+        ]
+    )
+
+    tags_by_turn = {
+        int(turn_id): [r["rule_tag"] for r in turn_eval["rules"]]
+        for turn_id, turn_eval in evaluations.items()
+    }
+    # FIRST_N 在第2轮触发后停止；N_th 只在第4轮（N-1）评估
+    assert tags_by_turn == {
+        0: ["multi_turn:FIRST_N:ask:consult_subject"],
+        1: ["multi_turn:FIRST_N:ask:consult_subject"],
+        2: ["multi_turn:FIRST_N:ask:consult_subject"],
+        3: [],
+        4: ["multi_turn:N_th:conv:ask_phone"],
+        5: [],
+    }
+    assert [response for response, _, _ in judge.calls] == responses[:3] + [responses[4]]
+    assert evaluations["2"]["rules"][0]["triggered"]
+
+    # 每轮的上下文只包含到当前轮为止的对话
+    assert "问题2" in judge.calls[2][2] and "问题3" not in judge.calls[2][2]
+    print("✓ incremental rule scheduling")
+
+
+def test_first_n_not_triggered():
+    """FIRST_N规则前N轮都未触发时，在第N轮添加失败记录"""
+    judge = CountingJudge()
+    evaluator = _build_evaluator(judge)
+    conversation_by_turn = evaluator._organize_conversation(_build_conversation(["您好", "请说", "好的"]))
+
+    evaluations = evaluator._evaluate_conversation(
+        conversation_by_turn=conversation_by_turn,
+        rule_list=[{"rule": "multi_turn:FIRST_N:ask:consult_subject", "N": 2}]
+    )
+
+    assert len(judge.calls) == 2
+    failure = evaluations["1"]["rules"][-1]
+    assert failure["passed"] is False
+    assert failure["reason"] == "FIRST_N规则：在前2轮中未触发"
+    assert evaluations["2"]["rules"] == []
+    print("✓ FIRST_N not triggered")
+
+
 def main():
     """Run all tests"""
     print("\n" + "=" * 60)
@@ -112,6 +203,8 @@ def main():
     # Run tests
     test_dynamic_interactive_evaluator()
     test_json_format()
+    test_incremental_rule_scheduling()
+    test_first_n_not_triggered()
     
     print("\n" + "=" * 60)
     print("Test Suite Completed")
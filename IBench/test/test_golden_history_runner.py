@@ -0,0 +1,173 @@
+"""
+Test streaming golden history runner (evaluate_record / evaluate_stream)
+Uses fake local/judge models, no GPU or API key required
+"""
+
+import copy
+import json
+import os
+import sys
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.pipeline.golden_history_runner import evaluate_stream, iter_jsonl
+from IBench.pipeline.run_manifest import RunManifest
+
+from IBench.test.test_async_evaluation import TEST_CASE, FakeJudge, FakeLocalModel, _build_evaluator
+
+
+class CountingLocalModel(FakeLocalModel):
+    """Counts generate calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, messages):
+        self.calls += 1
+        return super().generate(messages)
+
+
+class FlakyJudge(FakeJudge):
+    """Fails the first `failures` judge calls"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def evaluate_with_judge(self, response, rule_description, context=None, N=None):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("judge unavailable")
+        return super().evaluate_with_judge(response, rule_description, context, N)
+
+
+def _write_dataset(path, num_cases):
+    """写入 num_cases 条用例，最后一条格式非法（最后一条消息不是 user）"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_cases):
+            case = copy.deepcopy(TEST_CASE)
+            case["key"] = f"case_{i:03d}"
+            f.write(json.dumps(case, ensure_ascii=False) + '\n')
+        bad_case = copy.deepcopy(TEST_CASE)
+        bad_case["key"] = "bad_case"
+        bad_case["messages"] = bad_case["messages"][:3]
+        f.write(json.dumps(bad_case, ensure_ascii=False) + '\n')
+
+
+def test_evaluate_record_matches_file(tmp_path):
+    """内存评估与文件评估结果一致"""
+    input_path = tmp_path / "case.json"
+    input_path.write_text(json.dumps(TEST_CASE, ensure_ascii=False), encoding="utf-8")
+    evaluator = _build_evaluator(FakeJudge())
+
+    assert evaluator.evaluate_record(copy.deepcopy(TEST_CASE)) == evaluator.evaluate_from_json(str(input_path))
+    print("✓ evaluate_record matches evaluate_from_json")
+
+
+def test_evaluate_stream(tmp_path):
+    """流式评估：每条一行输出，汇总增量统计，失败条目单独计数"""
+    input_path = tmp_path / "input.jsonl"
+    output_path = tmp_path / "output.jsonl"
+    _write_dataset(input_path, 7)
+    evaluator = _build_evaluator(FakeJudge())
+    expected = evaluator.evaluate_record(copy.deepcopy(TEST_CASE))
+
+    for batch_generate in (False, True):
+        summary = evaluate_stream(
+            evaluator, iter_jsonl(str(input_path)), str(output_path),
+            workers=3, batch_generate=batch_generate, chunk_size=2
+        )
+
+        results = list(iter_jsonl(str(output_path)))
+        assert sorted(r["key"] for r in results) == [f"case_{i:03d}" for i in range(7)]
+        assert all(r["evaluations"] == expected["evaluations"] for r in results)
+
+        stats = summary.to_dict()
+        assert stats["total_entries"] == 8
+        assert stats["evaluated_entries"] == 7
+        assert stats["failed_keys"] == ["bad_case"]
+        assert stats["total_score"] == 7 * sum(e["score"] for e in expected["evaluations"])
+    print("✓ streaming runner")
+
+
+def test_resume_from_manifest(tmp_path):
+    """续跑：已完成用例跳过，已生成回复复用，失败用例重试"""
+    input_path = tmp_path / "input.jsonl"
+    output_path = tmp_path / "output.jsonl"
+    manifest_path = tmp_path / "run_manifest.jsonl"
+    _write_dataset(input_path, 5)
+    evaluator = _build_evaluator(FakeJudge())
+    local_model = CountingLocalModel()
+    evaluator.local_model = local_model
+
+    evaluate_stream(
+        evaluator, iter_jsonl(str(input_path)), str(output_path),
+        workers=2, manifest=RunManifest(str(manifest_path), "fp")
+    )
+    assert local_model.calls == 5
+
+    # 模拟崩溃：丢失两条结果行，另一条写出后未来得及标记完成，并残留半行运行记录
+    lines = output_path.read_text(encoding="utf-8").splitlines()
+    kept = lines[:3]
+    output_path.write_text("\n".join(kept + [kept[0]]) + "\n", encoding="utf-8")
+    with open(manifest_path, 'a', encoding='utf-8') as f:
+        f.write('{"fingerprint": "fp", "key": ')
+
+    local_model.calls = 0
+    summary = evaluate_stream(
+        evaluator, iter_jsonl(str(input_path)), str(output_path),
+        workers=2, manifest=RunManifest(str(manifest_path), "fp")
+    )
+    results = list(iter_jsonl(str(output_path)))
+    assert sorted(r["key"] for r in results) == [f"case_{i:03d}" for i in range(5)]
+    # 丢失结果的用例只重新评估，不重新生成
+    assert local_model.calls == 0
+    stats = summary.to_dict()
+    assert stats["resumed_entries"] == 3
+    assert stats["evaluated_entries"] == 5
+    assert stats["failed_keys"] == ["bad_case"]
+
+    # 配置指纹变化：旧记录失效，全部重跑
+    summary = evaluate_stream(
+        evaluator, iter_jsonl(str(input_path)), str(output_path),
+        workers=2, manifest=RunManifest(str(manifest_path), "other")
+    )
+    assert summary.resumed_entries == 0
+    assert local_model.calls == 5
+    print("✓ resume from manifest")
+
+
+def test_retry_failed_case(tmp_path):
+    """失败用例按退避重试，重试时不重新生成"""
+    input_path = tmp_path / "input.jsonl"
+    output_path = tmp_path / "output.jsonl"
+    _write_dataset(input_path, 1)
+    judge = FlakyJudge(failures=1)
+    evaluator = _build_evaluator(judge)
+    local_model = CountingLocalModel()
+    evaluator.local_model = local_model
+    manifest = RunManifest(str(tmp_path / "run_manifest.jsonl"), "fp")
+
+    summary = evaluate_stream(
+        evaluator, iter_jsonl(str(input_path)), str(output_path),
+        workers=1, manifest=manifest, max_retries=2, retry_backoff=0.01
+    )
+    assert judge.failures == 0
+    assert summary.evaluated_entries == 1
+    assert local_model.calls == 1
+    assert manifest.is_completed("case_000")
+    # 格式非法的用例重试后仍失败
+    assert summary.failed_keys == ["bad_case"]
+    print("✓ retry failed case")
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_evaluate_record_matches_file(Path(tmp_dir))
+        test_evaluate_stream(Path(tmp_dir))
+        test_resume_from_manifest(Path(tmp_dir))
+        test_retry_failed_case(Path(tmp_dir))
@@ -0,0 +1,105 @@
+"""
+Test persistent judge verdict cache (JudgeCache)
+Uses a fake OpenAI client, no API key required
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.models.judge_cache import JudgeCache
+
+from IBench.test.test_batch_judge import FakeCompletions, _build_api_model
+
+
+def test_cache_hits_skip_judge_calls(tmp_path):
+    """相同的评估请求第二次直接命中缓存，跨实例持久化"""
+    cache_path = str(tmp_path / "judge_cache.sqlite")
+    descriptions = ["使用感谢用语", "直接给出疾病名称", "编造医院名称"]
+
+    completions = FakeCompletions()
+    judge = _build_api_model(completions, JudgeCache(cache_path))
+    first = judge.evaluate_with_judge("感谢您的咨询", descriptions[0])
+    first_batch = judge.evaluate_with_judge_batch("感谢您的咨询", descriptions)
+    calls = len(completions.calls)
+
+    assert judge.evaluate_with_judge("感谢您的咨询", descriptions[0]) == first
+    assert judge.evaluate_with_judge_batch("感谢您的咨询", descriptions) == first_batch
+    assert len(completions.calls) == calls
+
+    # 新实例读取同一缓存文件
+    reopened = _build_api_model(FakeCompletions(), JudgeCache(cache_path))
+    assert reopened.evaluate_with_judge_batch("感谢您的咨询", descriptions) == first_batch
+    assert reopened.client.chat.completions.calls == []
+
+    # 不同回复不会命中
+    judge.evaluate_with_judge("您好", descriptions[0])
+    assert len(completions.calls) == calls + 1
+
+    stats = judge.cache_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 3
+    assert stats["hit_rate"] == 0.4
+    print("✓ judge cache hits skip API calls")
+
+
+def test_malformed_batch_not_cached(tmp_path):
+    """无法解析的批量结果不写入缓存"""
+    cache = JudgeCache(str(tmp_path / "judge_cache.sqlite"))
+    judge = _build_api_model(FakeCompletions(malformed_batch=True), cache)
+
+    judge.evaluate_with_judge_batch("感谢您的咨询", ["使用感谢用语", "直接给出疾病名称"])
+
+    # 只缓存了降级后的两条逐条评估结果
+    assert len(cache) == 2
+    print("✓ malformed batch output is not cached")
+
+
+def test_eviction(tmp_path):
+    """按条数和存活时间淘汰"""
+    cache = JudgeCache(str(tmp_path / "judge_cache.sqlite"), max_entries=3)
+    for i in range(5):
+        cache.put(f"key{i}", "fake-judge", f"output{i}")
+        time.sleep(0.001)
+    cache.get("key0")  # 命中后刷新访问时间，key1 / key2 成为最久未访问
+
+    assert cache.evict() == 2
+    assert len(cache) == 3
+    assert cache.get("key1") is None
+    assert cache.get("key0") == "output0"
+
+    aged = JudgeCache(str(tmp_path / "judge_cache.sqlite"), max_age_days=0)
+    assert len(aged) == 0
+    print("✓ judge cache eviction")
+
+
+def test_concurrent_writers(tmp_path):
+    """线程池中并发读写同一缓存"""
+    cache = JudgeCache(str(tmp_path / "judge_cache.sqlite"))
+
+    def worker(i):
+        key = JudgeCache.make_key("fake-judge", [{"role": "user", "content": str(i % 20)}], 10)
+        if cache.get(key) is None:
+            cache.put(key, "fake-judge", f"output{i % 20}")
+        return cache.get(key)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outputs = list(executor.map(worker, range(200)))
+
+    assert outputs == [f"output{i % 20}" for i in range(200)]
+    assert len(cache) == 20
+    print("✓ concurrent cache writers")
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_cache_hits_skip_judge_calls(Path(tmp_dir) / "a")
+        test_malformed_batch_not_cached(Path(tmp_dir) / "b")
+        test_eviction(Path(tmp_dir) / "c")
+        test_concurrent_writers(Path(tmp_dir) / "d")
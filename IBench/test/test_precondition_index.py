@@ -0,0 +1,132 @@
+"""
+Test per-conversation precondition index (PreconditionIndex)
+Uses a fake judge, no API key required
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+# Add the parent directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from IBench.rules.dynamic_rule_registry import (
+    DynamicRuleRegistry,
+    PreconditionIndex,
+    aresolve_dynamic_N,
+    find_precondition_turn,
+    resolve_dynamic_N
+)
+from IBench.utils.common import Message
+
+
+MESSAGES = [
+    Message(role="system", content="你是医院客服", turn_id=0),
+    Message(role="user", content="孩子太矮了", turn_id=1),
+    Message(role="assistant", content="请问孩子多大？", turn_id=1),
+    Message(role="user", content="5岁", turn_id=2),
+    Message(role="assistant", content="平时在吃什么药吗？", turn_id=2),
+    Message(role="user", content="在吃药", turn_id=3),
+    Message(role="assistant", content="好的", turn_id=3),
+    Message(role="user", content="一直在吃药", turn_id=4),
+]
+
+
+class CountingJudge:
+    """precondition judge：user 消息包含"药"即满足，并记录调用次数"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _verdict(self, user_message):
+        with self._lock:
+            self.calls.append(user_message)
+        return True, "YES" if "药" in user_message else "NO"
+
+    def __call__(self, user_message, prompt):
+        return self._verdict(user_message)
+
+    async def acall(self, user_message, prompt):
+        await asyncio.sleep(0)
+        return self._verdict(user_message)
+
+
+def _rule():
+    return DynamicRuleRegistry().parse_rule("multi_turn:N_th:conv:medication_phone")
+
+
+def test_index_matches_sequential_scan():
+    """索引结果与逐轮扫描一致，且同一 precondition 每轮只检测一次"""
+    judge = CountingJudge()
+    expected = find_precondition_turn(MESSAGES, "用户提及用药史", judge)
+    assert expected == 3
+
+    judge = CountingJudge()
+    index = PreconditionIndex(MESSAGES, judge, max_workers=4)
+    rule = _rule()
+    assert resolve_dynamic_N("auto", rule, MESSAGES, precondition_index=index) == expected
+    assert resolve_dynamic_N({"value": "auto", "offset": 1}, rule, MESSAGES, precondition_index=index) == expected + 1
+    assert len(judge.calls) == len(index.turns) == 4
+    print("✓ precondition index matches sequential scan")
+
+
+def test_async_index_shares_scan():
+    """并发解析多条共享 precondition 的规则时只检测一次"""
+    judge = CountingJudge()
+    index = PreconditionIndex(MESSAGES, judge.acall)
+    rule = _rule()
+
+    async def resolve_all():
+        return await asyncio.gather(
+            aresolve_dynamic_N("auto", rule, MESSAGES, precondition_index=index),
+            aresolve_dynamic_N({"value": "auto", "offset": 2}, rule, MESSAGES, precondition_index=index)
+        )
+
+    assert asyncio.run(resolve_all()) == [3, 5]
+    assert len(judge.calls) == 4
+    print("✓ async precondition index shares one scan")
+
+
+def test_index_unsatisfied():
+    """precondition 从未满足时返回 None"""
+    index = PreconditionIndex(MESSAGES[:4], CountingJudge())
+    assert index.find_turn("用户提及用药史") is None
+    assert PreconditionIndex(MESSAGES, None).find_turn("用户提及用药史") is None
+    print("✓ unsatisfied precondition")
+
+
+def test_index_prefilter():
+    """正则能确定某轮结果时不调用 judge，无法确定的轮次仍交给 judge"""
+    messages = [
+        Message(role="user", content="我父亲身体不好", turn_id=1),
+        Message(role="assistant", content="请问老人家多大年纪？", turn_id=1),
+        Message(role="user", content="45岁", turn_id=2),
+        Message(role="assistant", content="好的", turn_id=2),
+        Message(role="user", content="说错了，是72岁", turn_id=3),
+    ]
+    precondition = "用户年龄 >= 60岁"
+
+    judge = CountingJudge()
+    index = PreconditionIndex(messages, judge, rule_prefilter=True)
+    assert index.find_turn(precondition) == 3
+    assert judge.calls == ["我父亲身体不好"]
+
+    judge = CountingJudge()
+    index = PreconditionIndex(messages, judge.acall, rule_prefilter=True)
+    assert asyncio.run(index.afind_turn(precondition)) == 3
+    assert judge.calls == ["我父亲身体不好"]
+
+    # 默认关闭：每轮都由 judge 判断
+    judge = CountingJudge()
+    PreconditionIndex(messages, judge).find_turn(precondition)
+    assert len(judge.calls) == 3
+    print("✓ precondition index prefilter")
+
+
+if __name__ == "__main__":
+    test_index_matches_sequential_scan()
+    test_async_index_shares_scan()
+    test_index_unsatisfied()
+    test_index_prefilter()
@@ -46,13 +46,33 @@ class BenchmarkSettings(BaseSettings):
         default="data/IFBench_test.jsonl",
         description="Path to IFBench test file",
     )
+    multi_turn_input: str = Field(
+        default="dataset/IFBench_multi-turn/ifbench_constraints",
+        description="IFBench_multi-turn parquet file or directory",
+    )
     output_file: str = Field(
         default="data/responses.jsonl",
         description="Output file for responses",
     )
     workers: int = Field(
         default=8,
-        description="Number of parallel workers",
+        description="Maximum number of concurrent requests",
+    )
+    min_workers: int = Field(
+        default=1,
+        description="Minimum number of concurrent requests when backing off",
+    )
+    latency_target: float | None = Field(
+        default=None,
+        description="Request latency (seconds) above which concurrency is reduced",
+    )
+    max_retries: int = Field(
+        default=5,
+        description="Retries per prompt on 429/5xx and connection errors",
+    )
+    retry_backoff: float = Field(
+        default=1.0,
+        description="Base delay (seconds) of the jittered exponential backoff",
     )
 
 
@@ -17,10 +17,15 @@
 
 import collections
 import dataclasses
+import inspect
 import json
+import multiprocessing
+import pickle
 from typing import Dict, Optional, Union
 
+import instructions
 import instructions_registry
+import instructions_util
 
 
 @dataclasses.dataclass
@@ -31,6 +36,15 @@ class InputExample:
   kwargs: list[Dict[str, Optional[Union[str, int]]]]
 
 
+@dataclasses.dataclass
+class CompiledExample:
+  """An InputExample with ready-to-call, pre-built checker instances."""
+  key: int
+  instruction_id_list: list[str]
+  prompt: str
+  instructions: list[instructions.Instruction]
+
+
 @dataclasses.dataclass
 class OutputExample:
   instruction_id_list: list[str]
@@ -78,19 +92,13 @@ def test_instruction_following_strict(
 ):
   """Tests response to see if instrutions are followed."""
   response = prompt_to_response[inp.prompt]
-  instruction_list = inp.instruction_id_list
+  analysis = instructions_util.ResponseAnalysis(response) if response else None
+  if not isinstance(inp, CompiledExample):
+    inp = compile_example(inp)
   is_following_list = []
 
-  for index, instruction_id in enumerate(instruction_list):
-    instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
-    instruction = instruction_cls(instruction_id)
-    inp.kwargs[index] = {key: value for key, value in inp.kwargs[index].items() if value is not None}
-    instruction.build_description(**inp.kwargs[index])
-    args = instruction.get_instruction_args()
-    if args and "prompt" in args:
-      instruction.build_description(prompt=inp.prompt)
-
-    if response and response.strip() and instruction.check_following(response):
+  for instruction in inp.instructions:
+    if response and response.strip() and instruction.check_analysis(analysis):
       is_following_list.append(True)
     else:
       is_following_list.append(False)
@@ -119,6 +127,33 @@ def test_instruction_following_loose(
           follow_instruction_list=[False] * len(inp.instruction_id_list),
       )
 
+  # Tokenizations of each variant are shared by all instructions.
+  all_responses = [
+      instructions_util.ResponseAnalysis(r) for r in _response_variants(response)]
+  if not isinstance(inp, CompiledExample):
+    inp = compile_example(inp)
+  is_following_list = []
+
+  for instruction in inp.instructions:
+    is_following = False
+    for r in all_responses:
+      if r.text.strip() and instruction.check_analysis(r):
+        is_following = True
+        break
+
+    is_following_list.append(is_following)
+
+  return OutputExample(
+      instruction_id_list=inp.instruction_id_list,
+      prompt=inp.prompt,
+      response=response,
+      follow_all_instructions=all(is_following_list),
+      follow_instruction_list=is_following_list,
+  )
+
+
+def _response_variants(response):
+  """Returns the 8 loose-mode variants of a response (response itself first)."""
   r = response.split("\n")
   response_remove_first = "\n".join(r[1:]).strip()
   response_remove_last = "\n".join(r[:-1]).strip()
@@ -127,7 +162,7 @@ def test_instruction_following_loose(
   revised_response_remove_first = response_remove_first.replace("*", "")
   revised_response_remove_last = response_remove_last.replace("*", "")
   revised_response_remove_both = response_remove_both.replace("*", "")
-  all_responses = [
+  return [
       response,
       revised_response,
       response_remove_first,
@@ -137,33 +172,185 @@ def test_instruction_following_loose(
       revised_response_remove_last,
       revised_response_remove_both,
   ]
-  instruction_list = inp.instruction_id_list
-  is_following_list = []
 
-  for index, instruction_id in enumerate(instruction_list):
-    instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
-    instruction = instruction_cls(instruction_id)
 
-    instruction.build_description(**inp.kwargs[index])
-    args = instruction.get_instruction_args()
-    if args and "prompt" in args:
-      instruction.build_description(prompt=inp.prompt)
+def build_instruction(instruction_id, kwargs, prompt):
+  """Builds a checker with validated arguments.
+
+  Args:
+    instruction_id: Instruction id, a key of INSTRUCTION_DICT.
+    kwargs: Arguments of `build_description`; None values are dropped.
+    prompt: The prompt, passed to checkers that take it as an argument.
+
+  Returns:
+    The built checker instance.
+
+  Raises:
+    ValueError: If the instruction id is unknown or an argument is not
+      accepted by the checker.
+  """
+  if instruction_id not in instructions_registry.INSTRUCTION_DICT:
+    raise ValueError(f"Unknown instruction id: {instruction_id}")
+  instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
+  instruction = instruction_cls(instruction_id)
+
+  kwargs = {key: value for key, value in kwargs.items() if value is not None}
+  parameters = inspect.signature(instruction.build_description).parameters
+  if not any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+    unknown = sorted(set(kwargs) - set(parameters))
+    if unknown:
+      raise ValueError(
+          f"Invalid arguments {unknown} for instruction {instruction_id}; "
+          f"expected a subset of {sorted(parameters)}")
+
+  instruction.build_description(**kwargs)
+  args = instruction.get_instruction_args()
+  if args and "prompt" in args:
+    instruction.build_description(prompt=prompt)
+  return instruction
+
+
+def compile_example(inp):
+  """Compiles an InputExample into a CompiledExample (inp is not modified)."""
+  return CompiledExample(
+      key=inp.key,
+      instruction_id_list=inp.instruction_id_list,
+      prompt=inp.prompt,
+      instructions=[
+          build_instruction(instruction_id, inp.kwargs[index], inp.prompt)
+          for index, instruction_id in enumerate(inp.instruction_id_list)
+      ],
+  )
 
-    is_following = False
-    for r in all_responses:
-      if r.strip() and instruction.check_following(r):
-        is_following = True
-        break
 
-    is_following_list.append(is_following)
+def compile_evaluation_plan(inputs):
+  """Compiles input examples into an evaluation plan.
 
-  return OutputExample(
+  The plan holds ready-to-call checkers, so scoring many response files
+  against the same prompts skips all checker construction and validation.
+
+  Args:
+    inputs: List of InputExample.
+
+  Returns:
+    List of CompiledExample, in input order.
+  """
+  return [compile_example(inp) for inp in inputs]
+
+
+def save_evaluation_plan(plan, plan_filename):
+  """Writes an evaluation plan to disk (pickle)."""
+  with open(plan_filename, "wb") as f:
+    pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_evaluation_plan(plan_filename):
+  """Reads an evaluation plan written by save_evaluation_plan."""
+  with open(plan_filename, "rb") as f:
+    return pickle.load(f)
+
+
+def test_instruction_following_strict_and_loose(inp, response):
+  """Tests a response in strict and loose mode in a single pass.
+
+  Each checker is built once per instruction and the loose-mode variants are
+  computed once per response. A strictly followed instruction is also loosely
+  followed (the response itself is the first variant), so loose checking only
+  runs on the remaining variants when the strict check fails.
+
+  Args:
+    inp: InputExample or CompiledExample.
+    response: The response to inp.prompt (may be None).
+
+  Returns:
+    A (strict, loose) pair of OutputExample.
+  """
+  if not isinstance(inp, CompiledExample):
+    inp = compile_example(inp)
+
+  # Tokenizations of each variant are computed lazily and shared by all
+  # instructions.
+  variants = [
+      instructions_util.ResponseAnalysis(r) for r in _response_variants(response)
+  ] if response is not None else []
+  strict_list = []
+  loose_list = []
+
+  for instruction in inp.instructions:
+    is_following_strict = bool(
+        response and response.strip() and instruction.check_analysis(variants[0]))
+    is_following_loose = is_following_strict or any(
+        r.text.strip() and instruction.check_analysis(r) for r in variants[1:])
+    strict_list.append(is_following_strict)
+    loose_list.append(is_following_loose)
+
+  strict = OutputExample(
       instruction_id_list=inp.instruction_id_list,
       prompt=inp.prompt,
       response=response,
-      follow_all_instructions=all(is_following_list),
-      follow_instruction_list=is_following_list,
+      follow_all_instructions=all(strict_list),
+      follow_instruction_list=strict_list,
+  )
+  loose = OutputExample(
+      instruction_id_list=inp.instruction_id_list,
+      prompt=inp.prompt,
+      response=response if response is not None else "",
+      follow_all_instructions=all(loose_list),
+      follow_instruction_list=loose_list,
   )
+  return strict, loose
+
+
+def _evaluate_example(example):
+  """Pool worker: example is an (InputExample or CompiledExample, response) pair."""
+  return test_instruction_following_strict_and_loose(*example)
+
+
+def evaluate_strict_and_loose(inputs, prompt_to_response, workers=1,
+                              chunksize=16):
+  """Evaluates all inputs in strict and loose mode in one pass.
+
+  Args:
+    inputs: List of InputExample, or an evaluation plan (list of
+      CompiledExample) to skip building the checkers.
+    prompt_to_response: Dictionary matching prompt and response.
+    workers: Number of worker processes; 1 evaluates in this process.
+    chunksize: Number of examples sent to a worker at a time.
+
+  Returns:
+    A (strict_outputs, loose_outputs) pair of lists, in input order.
+  """
+  return evaluate_responses(
+      inputs, [prompt_to_response[inp.prompt] for inp in inputs],
+      workers=workers, chunksize=chunksize)
+
+
+def evaluate_responses(inputs, responses, workers=1, chunksize=16):
+  """Evaluates one response per input in strict and loose mode.
+
+  Unlike evaluate_strict_and_loose, responses are matched by position, so
+  inputs may share a prompt (e.g. the multi-turn split, where one prompt is
+  paired with several constraints).
+
+  Args:
+    inputs: List of InputExample or CompiledExample.
+    responses: The response to each input, in input order (may be None).
+    workers: Number of worker processes; 1 evaluates in this process.
+    chunksize: Number of examples sent to a worker at a time.
+
+  Returns:
+    A (strict_outputs, loose_outputs) pair of lists, in input order.
+  """
+  # Only each example's own response is sent to the workers.
+  examples = list(zip(inputs, responses))
+  if workers > 1:
+    with multiprocessing.Pool(workers) as pool:
+      results = pool.map(_evaluate_example, examples, chunksize=chunksize)
+  else:
+    results = [_evaluate_example(example) for example in examples]
+  strict_outputs = [strict for strict, _ in results]
+  loose_outputs = [loose for _, loose in results]
+  return strict_outputs, loose_outputs
 
 
 def read_prompt_to_response_dict(input_jsonl_filename):
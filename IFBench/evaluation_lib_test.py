@@ -0,0 +1,158 @@
+# coding=utf-8
+# Copyright 2025 Allen Institute for AI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for evaluation_lib.py."""
+
+import copy
+import os
+import tempfile
+
+from absl.testing import absltest
+import evaluation_lib
+
+
+KEYWORDS = {
+    "keyword1": "kaleidoscope",
+    "keyword2": "nebula",
+    "keyword3": "whisper",
+    "keyword4": "labyrinth",
+    "keyword5": "paradox",
+}
+
+KEYWORD_RESPONSE = " ".join(
+    ["kaleidoscope"] + ["nebula"] * 2 + ["whisper"] * 3 + ["labyrinth"] * 5
+    + ["paradox"] * 7)
+
+
+def _inputs():
+  return [
+      evaluation_lib.InputExample(
+          key=0,
+          instruction_id_list=["format:no_whitespace", "count:keywords_multiple"],
+          prompt="p0",
+          kwargs=[{"N": None}, dict(KEYWORDS)]),
+      evaluation_lib.InputExample(
+          key=1,
+          instruction_id_list=["count:keywords_multiple"],
+          prompt="p1",
+          kwargs=[dict(KEYWORDS)]),
+      evaluation_lib.InputExample(
+          key=2,
+          instruction_id_list=["format:no_whitespace"],
+          prompt="p2",
+          kwargs=[{}]),
+      evaluation_lib.InputExample(
+          key=3,
+          instruction_id_list=["format:no_whitespace"],
+          prompt="p3",
+          kwargs=[{}]),
+  ]
+
+
+PROMPT_TO_RESPONSE = {
+    # Strictly fails no_whitespace, loosely passes once the first line is removed.
+    "p0": "Sure, here you go:\n**nowhitespace**",
+    "p1": KEYWORD_RESPONSE,
+    "p2": "   ",
+    "p3": None,
+}
+
+
+class EvaluationLibTest(absltest.TestCase):
+
+    def _sequential(self):
+        """Strict then loose over all inputs, as run_eval used to do."""
+        inputs = _inputs()
+        strict = [evaluation_lib.test_instruction_following_strict(inp, PROMPT_TO_RESPONSE)
+                  for inp in inputs]
+        loose = [evaluation_lib.test_instruction_following_loose(inp, PROMPT_TO_RESPONSE)
+                 for inp in inputs]
+        return strict, loose
+
+    def test_single_pass_matches_sequential(self):
+        expected_strict, expected_loose = self._sequential()
+        strict, loose = evaluation_lib.evaluate_strict_and_loose(
+            _inputs(), PROMPT_TO_RESPONSE)
+        self.assertEqual(strict, expected_strict)
+        self.assertEqual(loose, expected_loose)
+        self.assertEqual(strict[0].follow_instruction_list, [False, False])
+        self.assertEqual(loose[0].follow_instruction_list, [True, False])
+        self.assertTrue(strict[1].follow_all_instructions)
+        self.assertEqual(loose[3].response, "")
+
+    def test_process_pool_matches_single_process(self):
+        expected = evaluation_lib.evaluate_strict_and_loose(
+            _inputs(), PROMPT_TO_RESPONSE)
+        pooled = evaluation_lib.evaluate_strict_and_loose(
+            _inputs(), PROMPT_TO_RESPONSE, workers=2, chunksize=1)
+        self.assertEqual(pooled, expected)
+
+    def test_does_not_mutate_inputs(self):
+        inputs = _inputs()
+        before = copy.deepcopy(inputs)
+        evaluation_lib.evaluate_strict_and_loose(inputs, PROMPT_TO_RESPONSE)
+        self.assertEqual(inputs, before)
+
+    def test_evaluation_plan_round_trip(self):
+        expected = evaluation_lib.evaluate_strict_and_loose(
+            _inputs(), PROMPT_TO_RESPONSE)
+        plan = evaluation_lib.compile_evaluation_plan(_inputs())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plan_filename = os.path.join(tmp_dir, "plan.pkl")
+            evaluation_lib.save_evaluation_plan(plan, plan_filename)
+            loaded = evaluation_lib.load_evaluation_plan(plan_filename)
+
+        self.assertEqual([example.key for example in loaded], [0, 1, 2, 3])
+        # A plan is reusable across response files and worker processes.
+        for _ in range(2):
+            self.assertEqual(
+                evaluation_lib.evaluate_strict_and_loose(loaded, PROMPT_TO_RESPONSE),
+                expected)
+        self.assertEqual(
+            evaluation_lib.evaluate_strict_and_loose(
+                loaded, PROMPT_TO_RESPONSE, workers=2, chunksize=2),
+            expected)
+
+    def test_evaluate_responses_matches_by_position(self):
+        """Inputs sharing a prompt (as in the multi-turn split) keep their own responses."""
+        inputs = [
+            evaluation_lib.InputExample(
+                key=key, instruction_id_list=["count:keywords_multiple"],
+                prompt="same prompt", kwargs=[dict(KEYWORDS)])
+            for key in (0, 1)
+        ]
+        strict, loose = evaluation_lib.evaluate_responses(
+            inputs, [KEYWORD_RESPONSE, "nebula"])
+        self.assertEqual([o.follow_all_instructions for o in strict], [True, False])
+        self.assertEqual([o.follow_all_instructions for o in loose], [True, False])
+
+    def test_compile_rejects_invalid_arguments(self):
+        inp = evaluation_lib.InputExample(
+            key=0,
+            instruction_id_list=["count:keywords_multiple"],
+            prompt="p",
+            kwargs=[dict(KEYWORDS, keyword6="extra")])
+        with self.assertRaisesRegex(ValueError, "keyword6"):
+            evaluation_lib.compile_evaluation_plan([inp])
+
+        inp = evaluation_lib.InputExample(
+            key=0, instruction_id_list=["no:such_instruction"], prompt="p",
+            kwargs=[{}])
+        with self.assertRaisesRegex(ValueError, "Unknown instruction id"):
+            evaluation_lib.compile_evaluation_plan([inp])
+
+
+if __name__ == "__main__":
+    absltest.main()
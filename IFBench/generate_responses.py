@@ -2,9 +2,12 @@
 """Generate responses from an OpenAI-compatible API for IFBench evaluation."""
 
 import json
+import time
+import random
+import asyncio
 import argparse
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable
 
 import httpx
 from tqdm import tqdm
@@ -12,6 +15,10 @@ from tqdm import tqdm
 from config import get_settings
 
 
+# Status codes that signal an overloaded server: back off and retry.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
 def load_prompts(input_file: str) -> list[dict]:
     """Load prompts from IFBench test file."""
     prompts = []
@@ -22,48 +29,273 @@ def load_prompts(input_file: str) -> list[dict]:
     return prompts
 
 
-def generate_response(
-    client: httpx.Client,
+def load_completed_keys(output_file: str, prompts: list[dict]) -> set:
+    """Return the keys that already have a successful response in output_file.
+
+    The output file is append-only, so a key may appear several times (e.g. a
+    failed attempt followed by a successful retry); the last record wins.
+    Records written before responses carried a key are matched by prompt.
+    """
+    key_by_prompt = {p["prompt"]: p["key"] for p in prompts}
+    last_records = {}
+    with open(output_file, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            key = record.get("key", key_by_prompt.get(record["prompt"]))
+            last_records[key] = record
+    return {key for key, record in last_records.items() if "error" not in record}
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of in-flight requests.
+
+    Every successful request raises the limit by 1/limit (about +1 per round
+    trip of `limit` requests), up to `maximum`. An overload signal (429/5xx,
+    transport error, or a latency above `latency_target`) multiplies it by
+    `decrease_factor`, down to `minimum`. Only requests started after the
+    last decrease can trigger another one, so one burst of errors halves the
+    limit once rather than once per failed request.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        latency_target: float | None = None,
+        decrease_factor: float = 0.5,
+    ):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        """Wait for a free slot; return the request start time."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, overloaded: bool = False) -> None:
+        """Free a slot and adapt the limit to the outcome of the request."""
+        latency = time.monotonic() - started
+        if self.latency_target is not None and latency > self.latency_target:
+            overloaded = True
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                if started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = time.monotonic()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class JsonlWriter:
+    """Append-only JSONL writer: each record is written and flushed once."""
+
+    def __init__(self, path: str, append: bool):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a" if append else "w")
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def retry_delay(attempt: int, response: httpx.Response | None, base: float, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff, honoring a numeric Retry-After header."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(cap, float(retry_after))
+            except ValueError:
+                pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def generate_response(
+    client: httpx.AsyncClient,
     api_base: str,
     model: str,
-    prompt: str,
+    messages: list[dict],
     temperature: float,
     max_tokens: int,
     api_key: str | None,
     seed: int | None,
-) -> str:
-    """Generate a response from the API."""
+) -> tuple[str, int]:
+    """Generate the next assistant turn of a conversation from the API.
+
+    Returns:
+        The response text and the number of completion tokens (0 if the
+        server does not report usage).
+    """
     headers = {"Content-Type": "application/json"}
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
 
     payload = {
         "model": model,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": messages,
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
     if seed is not None:
         payload["seed"] = seed
 
-    response = client.post(
+    response = await client.post(
         f"{api_base.rstrip('/')}/chat/completions",
         headers=headers,
         json=payload,
-        timeout=300,
     )
     response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
+    data = response.json()
+    tokens = (data.get("usage") or {}).get("completion_tokens") or 0
+    return data["choices"][0]["message"]["content"], tokens
 
 
-def main():
-    # Load settings from .env first
-    settings = get_settings()
+async def generate_with_retries(
+    client: httpx.AsyncClient,
+    limiter: AdaptiveConcurrency,
+    prompt_data: dict,
+    args: argparse.Namespace,
+) -> tuple[dict, int]:
+    """Generate one response, retrying overload and transport errors.
 
-    parser = argparse.ArgumentParser(
-        description="Generate responses from an OpenAI-compatible API for IFBench",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    prompt_data holds the key and prompt, and optionally the "messages" of a
+    multi-turn conversation; a single user turn with the prompt is sent
+    otherwise.
+
+    Returns:
+        The output record and its number of completion tokens. A record that
+        still fails after all retries has an empty response and an "error"
+        field, so evaluation can still run and --resume retries it.
+    """
+    messages = prompt_data.get("messages") or [{"role": "user", "content": prompt_data["prompt"]}]
+    attempt = 0
+    while True:
+        started = await limiter.acquire()
+        failed_response = None
+        try:
+            text, tokens = await generate_response(
+                client,
+                args.api_base,
+                args.model,
+                messages,
+                args.temperature,
+                args.max_tokens,
+                args.api_key,
+                args.seed,
+            )
+        except httpx.HTTPStatusError as e:
+            retryable = e.response.status_code in RETRYABLE_STATUS_CODES
+            failed_response = e.response
+            await limiter.release(started, overloaded=retryable)
+            error = e
+        except httpx.TransportError as e:
+            retryable = True
+            await limiter.release(started, overloaded=True)
+            error = e
+        except Exception as e:
+            retryable = False
+            await limiter.release(started)
+            error = e
+        else:
+            await limiter.release(started)
+            record = {"key": prompt_data["key"], "prompt": prompt_data["prompt"], "response": text}
+            return record, tokens
+
+        if not retryable or attempt >= args.max_retries:
+            record = {
+                "key": prompt_data["key"],
+                "prompt": prompt_data["prompt"],
+                "response": "",
+                "error": f"{type(error).__name__}: {error}",
+            }
+            return record, 0
+        await asyncio.sleep(retry_delay(attempt, failed_response, args.retry_backoff))
+        attempt += 1
+
+
+async def generate_all(
+    prompts: Iterable[dict],
+    args: argparse.Namespace,
+    writer: JsonlWriter,
+    total: int | None = None,
+) -> list[dict]:
+    """Generate responses for prompts, appending each record as it completes.
+
+    prompts may be a lazy iterator: at most a few times --workers requests are
+    scheduled ahead of the in-flight ones, so inputs are never materialized.
+
+    Returns:
+        The records that failed after all retries.
+    """
+    limiter = AdaptiveConcurrency(
+        maximum=args.workers,
+        minimum=args.min_workers,
+        latency_target=args.latency_target,
     )
+    limits = httpx.Limits(max_connections=args.workers, max_keepalive_connections=args.workers)
+    timeout = httpx.Timeout(300, connect=30)
+    window = 4 * args.workers
+    errors = []
+    done = 0
+    completion_tokens = 0
+    start = time.monotonic()
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        with tqdm(total=total, desc="Generating") as pbar:
+            pending = set()
+            prompt_iter = iter(prompts)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < window:
+                    prompt_data = next(prompt_iter, None)
+                    if prompt_data is None:
+                        exhausted = True
+                    else:
+                        pending.add(asyncio.create_task(generate_with_retries(client, limiter, prompt_data, args)))
+                if not pending:
+                    break
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    record, tokens = task.result()
+                    writer.write(record)
+                    if "error" in record:
+                        errors.append(record)
+                    done += 1
+                    completion_tokens += tokens
+                    elapsed = max(time.monotonic() - start, 1e-9)
+                    pbar.set_postfix(
+                        req_s=f"{done / elapsed:.2f}",
+                        tok_s=f"{completion_tokens / elapsed:.0f}",
+                        concurrency=int(limiter.limit),
+                    )
+                    pbar.update(1)
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(
+        f"\nThroughput: {done / elapsed:.2f} requests/s, "
+        f"{completion_tokens / elapsed:.0f} tokens/s "
+        f"({completion_tokens} completion tokens in {elapsed:.1f}s)"
+    )
+    return errors
+
+
+def add_generation_arguments(parser: argparse.ArgumentParser, settings) -> None:
+    """Add the API, sampling and concurrency arguments shared by the generation scripts."""
     parser.add_argument(
         "--api-base",
         default=settings.api_base,
@@ -74,15 +306,6 @@ def main():
         default=settings.model,
         help="Model name to use",
     )
-    parser.add_argument(
-        "--input-file",
-        default=settings.input_file,
-        help="Path to IFBench test file",
-    )
-    parser.add_argument(
-        "--output-file",
-        help="Output file for responses (defaults to data/{model}-responses.jsonl)",
-    )
     parser.add_argument(
         "--temperature",
         type=float,
@@ -110,8 +333,52 @@ def main():
         "--workers",
         type=int,
         default=settings.workers,
-        help="Number of parallel workers",
+        help="Maximum number of concurrent requests",
+    )
+    parser.add_argument(
+        "--min-workers",
+        type=int,
+        default=settings.min_workers,
+        help="Minimum number of concurrent requests when backing off",
+    )
+    parser.add_argument(
+        "--latency-target",
+        type=float,
+        default=settings.latency_target,
+        help="Request latency in seconds above which concurrency is reduced (omit to only react to 429/5xx)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=settings.max_retries,
+        help="Retries per prompt on 429/5xx and connection errors",
+    )
+    parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        default=settings.retry_backoff,
+        help="Base delay in seconds of the jittered exponential backoff",
+    )
+
+
+def main():
+    # Load settings from .env first
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(
+        description="Generate responses from an OpenAI-compatible API for IFBench",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--input-file",
+        default=settings.input_file,
+        help="Path to IFBench test file",
+    )
+    parser.add_argument(
+        "--output-file",
+        help="Output file for responses (defaults to data/{model}-responses.jsonl)",
     )
+    add_generation_arguments(parser, settings)
     parser.add_argument(
         "--resume",
         action="store_true",
@@ -132,81 +399,30 @@ def main():
     if not args.output_file:
         safe_model_name = args.model.replace("/", "-")
         args.output_file = f"data/{safe_model_name}-responses.jsonl"
-        
+
     print(f"Model: {args.model}")
     print(f"API: {args.api_base}")
 
-    # Load existing responses if resuming
-    existing_prompts = set()
-    existing_responses = []
-    if args.resume and Path(args.output_file).exists():
-        with open(args.output_file, "r") as f:
-            for line in f:
-                resp = json.loads(line)
-                existing_prompts.add(resp["prompt"])
-                existing_responses.append(resp)
-        print(f"Resuming: {len(existing_prompts)} prompts already completed")
+    # Load completed keys if resuming; failed records are generated again
+    completed_keys = set()
+    resuming = args.resume and Path(args.output_file).exists()
+    if resuming:
+        completed_keys = load_completed_keys(args.output_file, prompts)
+        print(f"Resuming: {len(completed_keys)} prompts already completed")
 
     # Filter out completed prompts
-    remaining = [p for p in prompts if p["prompt"] not in existing_prompts]
+    remaining = [p for p in prompts if p["key"] not in completed_keys]
     print(f"Generating responses for {len(remaining)} prompts...")
 
-    # Generate responses
-    results = list(existing_responses)
-    errors = []
-
-    with httpx.Client() as client:
-        with ThreadPoolExecutor(max_workers=args.workers) as executor:
-            future_to_prompt = {
-                executor.submit(
-                    generate_response,
-                    client,
-                    args.api_base,
-                    args.model,
-                    p["prompt"],
-                    args.temperature,
-                    args.max_tokens,
-                    args.api_key,
-                    args.seed,
-                ): p
-                for p in remaining
-            }
-
-            with tqdm(total=len(remaining), desc="Generating") as pbar:
-                for future in as_completed(future_to_prompt):
-                    prompt_data = future_to_prompt[future]
-                    try:
-                        response = future.result()
-                        results.append({
-                            "prompt": prompt_data["prompt"],
-                            "response": response,
-                        })
-                    except Exception as e:
-                        errors.append({
-                            "key": prompt_data["key"],
-                            "error": str(e),
-                        })
-                        # Add empty response so eval can still run
-                        results.append({
-                            "prompt": prompt_data["prompt"],
-                            "response": "",
-                        })
-                    pbar.update(1)
-
-                    # Save incrementally
-                    if len(results) % 10 == 0:
-                        with open(args.output_file, "w") as f:
-                            for r in results:
-                                f.write(json.dumps(r) + "\n")
-
-    # Final save
-    with open(args.output_file, "w") as f:
-        for r in results:
-            f.write(json.dumps(r) + "\n")
+    writer = JsonlWriter(args.output_file, append=resuming)
+    try:
+        errors = asyncio.run(generate_all(remaining, args, writer, total=len(remaining)))
+    finally:
+        writer.close()
 
-    print(f"\nSaved {len(results)} responses to {args.output_file}")
+    print(f"\nSaved {len(remaining)} responses to {args.output_file}")
     if errors:
-        print(f"Errors: {len(errors)}")
+        print(f"Errors: {len(errors)} (rerun with --resume to retry them)")
         for e in errors[:5]:
             print(f"  - Key {e['key']}: {e['error']}")
 
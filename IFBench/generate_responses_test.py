@@ -0,0 +1,122 @@
+# coding=utf-8
+# Copyright 2025 Allen Institute for AI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for generate_responses.py."""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+from absl.testing import absltest
+import httpx
+
+import generate_responses
+
+
+def _args(**overrides):
+    args = dict(api_base="http://test/v1", model="m", temperature=0.0, max_tokens=16,
+                api_key=None, seed=None, max_retries=3, retry_backoff=0.0)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+class GenerateResponsesTest(absltest.TestCase):
+
+    def test_retries_overload_and_backs_off(self):
+        """Test that a 429 is retried and halves the concurrency limit."""
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                return httpx.Response(429)
+            return httpx.Response(200, json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"completion_tokens": 7},
+            })
+
+        async def run():
+            limiter = generate_responses.AdaptiveConcurrency(maximum=8)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                result = await generate_responses.generate_with_retries(
+                    client, limiter, {"key": 1, "prompt": "hi"}, _args())
+            return result, limiter
+
+        (record, tokens), limiter = asyncio.run(run())
+        self.assertEqual(record, {"key": 1, "prompt": "hi", "response": "ok"})
+        self.assertEqual(tokens, 7)
+        self.assertLen(calls, 2)
+        self.assertLess(limiter.limit, 8)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_client_error_is_not_retried(self):
+        """Test that a 400 is recorded as an error without retrying."""
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(400)
+
+        async def run():
+            limiter = generate_responses.AdaptiveConcurrency(maximum=2)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                return await generate_responses.generate_with_retries(
+                    client, limiter, {"key": 1, "prompt": "hi"}, _args())
+
+        record, tokens = asyncio.run(run())
+        self.assertLen(calls, 1)
+        self.assertEqual(record["response"], "")
+        self.assertIn("error", record)
+        self.assertEqual(tokens, 0)
+
+    def test_adaptive_concurrency_aimd(self):
+        """Test additive increase on success and one multiplicative decrease per burst."""
+
+        async def run():
+            limiter = generate_responses.AdaptiveConcurrency(maximum=8, minimum=2)
+            started = [await limiter.acquire() for _ in range(4)]
+            for start in started:
+                await limiter.release(start, overloaded=True)
+            after_burst = limiter.limit
+            for _ in range(4):
+                await limiter.release(await limiter.acquire())
+            return after_burst, limiter.limit
+
+        after_burst, recovered = asyncio.run(run())
+        self.assertEqual(after_burst, 4)
+        self.assertGreater(recovered, after_burst)
+        self.assertLessEqual(recovered, 8)
+
+    def test_resume_by_key(self):
+        """Test that resume skips keys whose last record succeeded, including legacy records."""
+        prompts = [{"key": k, "prompt": f"p{k}"} for k in range(4)]
+        records = [
+            {"key": 0, "prompt": "p0", "response": "", "error": "timeout"},
+            {"key": 0, "prompt": "p0", "response": "done"},
+            {"key": 1, "prompt": "p1", "response": "", "error": "HTTPStatusError"},
+            {"prompt": "p2", "response": "legacy"},
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "responses.jsonl")
+            with open(path, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self.assertEqual(generate_responses.load_completed_keys(path, prompts), {0, 2})
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -30,7 +30,6 @@ os.environ.setdefault("NLTK_DATA", str(_nltk_data_dir))
 import nltk
 nltk.data.path.insert(0, str(_nltk_data_dir))
 import emoji
-import syllapy
 import unicodedata
 from collections import Counter
 import csv
@@ -58,6 +57,15 @@ _NUM_WORD_CYCLE = 30
 # Maximum number of times a word can be repeated.
 _MAX_REPEATS = 5
 
+# The person names of PersonNameCountChecker.
+_PERSON_NAMES = ("Emma", "Liam", "Sophia", "Jackson", "Olivia", "Noah", "Ava", "Lucas", "Isabella",
+	"Mason", "Mia", "Ethan", "Charlotte", "Alexander", "Amelia", "Benjamin", "Harper", "Leo", "Zoe",
+	"Daniel", "Chloe", "Samuel", "Lily", "Matthew", "Grace", "Owen", "Abigail", "Gabriel", "Ella",
+	"Jacob", "Scarlett", "Nathan", "Victoria", "Elijah", "Layla", "Nicholas", "Audrey", "David",
+	"Hannah", "Christopher", "Penelope", "Thomas", "Nora", "Andrew", "Aria", "Joseph", "Claire",
+	"Ryan", "Stella", "Jonathan",
+)
+
 # Which sentence must contain a keyword.
 _NUM_KEYWORD_SENTENCE = 20
 
@@ -89,6 +97,14 @@ class Instruction:
 	def check_following(self, value):
 		raise NotImplementedError("`check_following` not implemented.")
 
+	def check_analysis(self, analysis):
+		"""Checks a response given its shared `instructions_util.ResponseAnalysis`.
+
+		Checkers that tokenize the response override this so the tokenization is
+		computed once per response across all instructions of an example.
+		"""
+		return self.check_following(analysis.text)
+
 
 # Everything as follows is part of OOD IFEval
 
@@ -133,7 +149,10 @@ class WordCountRangeChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response contains the expected number of words."""
-		num_words = instructions_util.count_words(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		num_words = analysis.word_count
 		return self._min_words <= num_words <= self._max_words
 
 
@@ -209,10 +228,13 @@ class StopWordPercentageChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response contains the expected percentage of stop words."""
-		num_words = instructions_util.count_words(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		num_words = analysis.word_count
 		if num_words == 0:
 			return False
-		num_stopwords = instructions_util.count_stopwords(value)
+		num_stopwords = analysis.stopword_count
 		stopword_percentage = (num_stopwords / num_words) * 100
 		return stopword_percentage <= self._percentage
 
@@ -235,8 +257,11 @@ class SentTypeRatioChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response contains the expected ratio of declarative to interrogative sentences."""
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
 		# Split the text into sentences
-		sentences = instructions_util.split_into_sentences(value)
+		sentences = analysis.sentences
 		# Count the number of declarative and interrogative sentences
 		declarative_count = sum(1 for sentence in sentences if sentence.endswith('.'))
 		interrogative_count = sum(1 for sentence in sentences if sentence.endswith('?'))
@@ -262,8 +287,11 @@ class SentBalanceChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response contains a balanced ratio of sentence types."""
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
 		# Split the text into sentences
-		sentences = instructions_util.split_into_sentences(value)
+		sentences = analysis.sentences
 		# Count the number of each sentence type
 		declarative_count = sum(1 for sentence in sentences if sentence.endswith('.'))
 		interrogative_count = sum(1 for sentence in sentences if sentence.endswith('?'))
@@ -343,54 +371,8 @@ class PersonNameCountChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response contains at least the expected number of unique person names."""
-		person_name_list = ["Emma", "Liam", "Sophia", "Jackson", "Olivia", "Noah", "Ava", "Lucas", "Isabella", "Mason",
-							"Mia", "Ethan", "Charlotte",
-							"Alexander",
-							"Amelia",
-							"Benjamin",
-							"Harper",
-							"Leo",
-							"Zoe",
-							"Daniel",
-							"Chloe",
-							"Samuel",
-							"Lily",
-							"Matthew",
-							"Grace",
-							"Owen",
-							"Abigail",
-							"Gabriel",
-							"Ella",
-							"Jacob",
-							"Scarlett",
-							"Nathan",
-							"Victoria",
-							"Elijah",
-							"Layla",
-							"Nicholas",
-							"Audrey",
-							"David",
-							"Hannah",
-							"Christopher",
-							"Penelope",
-							"Thomas",
-							"Nora",
-							"Andrew",
-							"Aria",
-							"Joseph",
-							"Claire",
-							"Ryan",
-							"Stella",
-							"Jonathan"
-							]
-		# Extract the named entities
-		person_names = []
-		for name in person_name_list:
-			# Use regex with word boundaries
-			pattern = r'\b{}\b'.format(re.escape(name))
-			if re.search(pattern, value):
-				person_names.append(name)
-		unique_person_names = set(person_names)
+		matcher = instructions_util.get_keyword_matcher(_PERSON_NAMES, word_boundary=True)
+		unique_person_names = set(matcher.found(value))
 
 		return len(unique_person_names) >= self._num_person_names
 
@@ -586,7 +568,10 @@ class IncrementingAlliterationChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if each sentence in the response has more alliterative words (determined by common first letter) than the previous sentence."""
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		prev_alliteration = -1
 		for sentence in sentences:
 			words = sentence.lower().split()
@@ -873,8 +858,10 @@ class EmojiSentenceChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response includes an emoji at the end of every sentence."""
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
 
-		sentences = instructions_util.split_into_sentences(value)
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		for i, sentence in enumerate(sentences):
 			stripped = sentence.translate(str.maketrans('', '', string.punctuation)).strip()
 			# check for empty string
@@ -916,7 +903,10 @@ class CharacterCountUniqueWordsChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response has exactly 3 sentences containing the same number of characters but different words."""
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		if len(sentences) != 3:
 			return False
 		char_count = len(sentences[0].strip())
@@ -1004,8 +994,11 @@ class StartWithVerbChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response starts with a verb."""
-		text = nltk.word_tokenize(value)
-		return len(text) > 0 and len(nltk.pos_tag(text)) > 0 and 'VB' in nltk.pos_tag(text)[0][1]
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		pos_tags = analysis.pos_tags
+		return len(pos_tags) > 0 and 'VB' in pos_tags[0][1]
 
 
 class LimitedWordRepeatChecker(Instruction):
@@ -1038,7 +1031,10 @@ class LimitedWordRepeatChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response repeats any word more than {small_n} times."""
-		words = value.lower().translate(str.maketrans('', '', string.punctuation)).split()
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		words = analysis.plain_words
 		word_count = Counter(words)
 		for word, count in word_count.items():
 			if count > self._max_repeats:
@@ -1086,12 +1082,14 @@ class IncludeKeywordChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the {N}th sentence of the response includes keyword {word}."""
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		if len(sentences) < self._keyword_position:
 			return False
-		# Use regex with word boundaries for robust matching
-		pattern = r'\b{}\b'.format(re.escape(self._keyword))
-		return bool(re.search(pattern, sentences[int(self._keyword_position - 1)], re.IGNORECASE))
+		matcher = instructions_util.get_keyword_matcher((self._keyword,), word_boundary=True, ignore_case=True)
+		return matcher.search(sentences[int(self._keyword_position - 1)])
 
 
 class PronounCountChecker(Instruction):
@@ -1124,14 +1122,16 @@ class PronounCountChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response includes at least {N} pronouns."""
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
 		pronouns = set(
 			['i', 'me', 'my', 'mine', 'myself', 'we', 'us', 'our', 'ours', 'ourselves', 'you', 'your', 'yours',
 			 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'it', 'its',
 			 'itself', 'they', 'them', 'their', 'theirs', 'themselves'])
-		value = value.replace('/',
-							  ' ')  # to correctly count pronoun sets like she/her/hers, a common use case of pronouns
+		# '/' is a separator to correctly count pronoun sets like she/her/hers, a common use case of pronouns
 		# Use NLTK word_tokenize for better tokenization
-		words = nltk.word_tokenize(value.lower())
+		words = analysis.lowercase_tokens
 		pronoun_count = sum(1 for word in words if word in pronouns)
 		return pronoun_count >= self._num_pronouns
 
@@ -1154,8 +1154,10 @@ class AlternateParitySyllablesChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the response alternates between words with odd and even numbers of syllables."""
-		words = value.translate(str.maketrans('', '', string.punctuation)).lower().split()
-		syllables = [syllapy.count(word) % 2 for word in words if word.strip()]
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		syllables = [count % 2 for count in analysis.syllable_counts]
 		return all(syllables[i] != syllables[i + 1] for i in range(len(syllables) - 1))
 
 
@@ -1178,7 +1180,10 @@ class LastWordFirstNextChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if the last word of each sentence in the response is the first word of the next sentence."""
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		for i in range(len(sentences) - 1):
 			last_words = sentences[i].rstrip(''.join(string.punctuation) + ' ').split()
 			first_words = sentences[i + 1].lstrip(''.join(string.punctuation) + ' ').split()
@@ -1207,7 +1212,10 @@ class ParagraphLastFirstWordMatchChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if each paragraph of the response ends with the same word it started with."""
-		paragraphs = value.split('\n')
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		paragraphs = analysis.paragraphs
 		for paragraph in paragraphs:
 			paragraph = paragraph.strip().lower()
 			if not paragraph:
@@ -1252,7 +1260,10 @@ class IncrementingWordCountChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if each sentence of the response uses exactly {small_n} more words than the previous sentence."""
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		words = sentences[0].translate(str.maketrans('', '', string.punctuation)).strip().split()
 		while '' in words:
 			words.remove('')
@@ -1285,9 +1296,10 @@ class NoConsecutiveFirstLetterChecker(Instruction):
 
 	def check_following(self, value):
 		"""Checks if no two consecutive words in the response share the same first letter."""
-		words = value.lower().translate(str.maketrans('', '', string.punctuation)).split()
-		while '' in words:
-			words.remove('')
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		words = analysis.plain_words
 		for i in range(len(words) - 1):
 			if words[i][0] == words[i + 1][0]:
 				return False
@@ -1679,7 +1691,10 @@ class SentenceAlphabetChecker(Instruction):
 		return []
 
 	def check_following(self, value):
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		if len(sentences) != 26:
 			return False
 		for i, sentence in enumerate(sentences):
@@ -1929,9 +1944,10 @@ class KeywordsMultipleChecker(Instruction):
 		return ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5"]
 
 	def check_following(self, value):
+		value = value.lower()
 		for keyword, count in zip([self._keyword1, self._keyword2, self._keyword3, self._keyword4, self._keyword5],
 								  [1, 2, 3, 5, 7]):
-			if value.lower().count(keyword.lower()) != count:
+			if value.count(keyword.lower()) != count:
 				return False
 		return True
 
@@ -1989,7 +2005,10 @@ class KeywordSpecificPositionChecker(Instruction):
 		  True if the response contains the expected number of keywords;
 		  otherwise, False.
 		"""
-		sentences = instructions_util.split_into_sentences(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		sentences = analysis.sentences
 		if len(sentences) < self._n:
 			return False
 		words = instructions_util.nltk.word_tokenize(sentences[self._n - 1])
@@ -2040,7 +2059,10 @@ class WordsPositionChecker(Instruction):
 		  True if the second word and the second to last word are the same;
 		  otherwise, False.
 		"""
-		words = instructions_util.nltk.word_tokenize(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		words = analysis.tokens
 		if len(words) < 2:
 			return False
 		if words[1].lower() == words[-2].lower() == self._keyword.lower():
@@ -2200,7 +2222,10 @@ class TitleCaseChecker(Instruction):
 		  True if the response is in title case;
 		  otherwise, False.
 		"""
-		words = instructions_util.nltk.word_tokenize(value)
+		return self.check_analysis(instructions_util.ResponseAnalysis(value))
+
+	def check_analysis(self, analysis):
+		words = analysis.tokens
 		for word in words:
 			if not word or not word[0].isalpha():
 				continue
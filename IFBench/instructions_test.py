@@ -15,9 +15,14 @@
 
 """Tests for instructions.py."""
 
+import re
+import time
+
+from absl import logging
 from absl.testing import absltest
 from absl.testing import parameterized
 import instructions
+import instructions_util
 
 # pylint:disable=g-complex-comprehension
 class InstructionsTest(parameterized.TestCase):
@@ -1185,5 +1190,103 @@ Zimbabwe"""
         self.assertFalse(instruction.check_following(""), "expected False for empty response")
         self.assertFalse(instruction.check_following("   "), "expected False for whitespace-only response")
 
+    def test_response_analysis__shared_across_checkers(self):
+        """Test that checkers give the same result from a shared ResponseAnalysis as from the raw response."""
+        responses = [
+            "banana apple cherry banana.\nbanana apple",
+            "go home\nstop now and go stop",
+            "Apple banana cherry dog elephant",
+            "",
+        ]
+        checkers = [
+            (instructions.LimitedWordRepeatChecker('words:repeats'), {'small_n': 1}),
+            (instructions.NoConsecutiveFirstLetterChecker('words:no_consecutive'), {}),
+            (instructions.AlternateParitySyllablesChecker('words:odd_even_syllables'), {}),
+            (instructions.ParagraphLastFirstWordMatchChecker('words:paragraph_last_first'), {}),
+            (instructions.UniqueWordCountChecker('count:unique_word_count'), {'N': 3}),
+        ]
+        for response in responses:
+            analysis = instructions_util.ResponseAnalysis(response)
+            for instruction, kwargs in checkers:
+                instruction.build_description(**kwargs)
+                self.assertEqual(instruction.check_analysis(analysis), instruction.check_following(response),
+                                 f"{instruction.id} on {response!r}")
+            # memoized: computed once per response
+            self.assertIs(analysis.plain_words, analysis.plain_words)
+            self.assertEqual(analysis.word_count, instructions_util.count_words(response))
+
+    def test_stopwords_are_frozenset(self):
+        """Test that the stopword lookup is a cached frozenset."""
+        try:
+            stopwords = instructions_util.get_stopwords()
+        except LookupError:
+            self.skipTest("NLTK stopwords corpus not installed")
+        self.assertIsInstance(stopwords, frozenset)
+        self.assertIs(stopwords, instructions_util.get_stopwords())
+        self.assertIn('the', stopwords)
+
+    def test_keyword_matcher__counts_like_separate_scans(self):
+        """Test that KeywordMatcher gives the counts of one regex scan per keyword."""
+        texts = [
+            "Emma met Emmanuel and emma; Leo, Leon and Leo again.",
+            "aaaa banana bandana",
+            "",
+        ]
+        keyword_sets = [
+            (("Emma", "Leo", "Leon"), True, False),
+            (("Emma", "Leo", "Leon"), True, True),
+            (("ana", "band", "aa"), False, False),
+            (("an", "na"), False, False),  # overlapping keywords
+            (("aa", "aa", "b"), False, False),  # duplicate keywords
+            (("band", "a-b"), True, False),  # non-word characters
+        ]
+        for keywords, word_boundary, ignore_case in keyword_sets:
+            matcher = instructions_util.get_keyword_matcher(keywords, word_boundary, ignore_case)
+            flags = re.IGNORECASE if ignore_case else 0
+            boundary = r'\b' if word_boundary else ''
+            for text in texts:
+                expected = [len(re.findall(f"{boundary}{re.escape(k)}{boundary}", text, flags)) for k in keywords]
+                self.assertEqual(matcher.counts(text), expected, f"{keywords} on {text!r}")
+                self.assertEqual(matcher.search(text), any(expected))
+        self.assertEqual(instructions_util.get_keyword_matcher(("Emma", "Leo"), True).strategy, "tokens")
+        self.assertIs(instructions_util.get_keyword_matcher(("Emma", "Leo")),
+                      instructions_util.get_keyword_matcher(("Emma", "Leo")))
+
+    def test_keyword_checkers__benchmark(self):
+        """Micro-benchmark: per-checker throughput of the previous per-keyword scans vs. now."""
+        names = instructions._PERSON_NAMES
+        keywords = ('kaleidoscope', 'nebula', 'whisper', 'labyrinth', 'paradox')
+        filler = " ".join(f"{names[i % len(names)]} walked through the garden." for i in range(200))
+        keyword_response = filler + " " + " ".join(
+            keyword for keyword, count in zip(keywords, [1, 2, 3, 5, 7]) for _ in range(count))
+
+        def person_names_before(value):
+            return len({name for name in names if re.search(r'\b{}\b'.format(re.escape(name)), value)}) >= 25
+
+        def keywords_multiple_before(value):
+            return all(value.lower().count(keyword.lower()) == count
+                       for keyword, count in zip(keywords, [1, 2, 3, 5, 7]))
+
+        person_name = instructions.PersonNameCountChecker('keywords:person_name')
+        person_name.build_description(N=25)
+        keywords_multiple = instructions.KeywordsMultipleChecker('count:keywords_multiple')
+        keywords_multiple.build_description(
+            **{f'keyword{i}': keyword for i, keyword in enumerate(keywords, start=1)})
+
+        def throughput(check, response, repeats=50):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                result = check(response)
+            return result, repeats / (time.perf_counter() - start)
+
+        for checker, before, response in [(person_name, person_names_before, filler),
+                                          (keywords_multiple, keywords_multiple_before, keyword_response)]:
+            expected, before_rate = throughput(before, response)
+            result, after_rate = throughput(checker.check_following, response)
+            self.assertTrue(expected, checker.id)
+            self.assertEqual(result, expected, checker.id)
+            logging.info("%s: %.0f checks/s before, %.0f checks/s after",
+                         checker.id, before_rate, after_rate)
+
 if __name__ == '__main__':
     absltest.main()
@@ -14,11 +14,14 @@
 
 """Utility library of instructions."""
 
+import collections
 import functools
 import random
 import re
+import string
 
 import nltk
+import syllapy
 
 WORD_LIST = [
     "western",
@@ -1583,10 +1586,14 @@ def split_into_sentences(text):
     return nltk.sent_tokenize(text)
 
 
+_WORD_TOKENIZER = nltk.tokenize.RegexpTokenizer(r"\w+")
+
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
+
 def count_words(text):
     """Counts the number of words."""
-    tokenizer = nltk.tokenize.RegexpTokenizer(r"\w+")
-    tokens = tokenizer.tokenize(text)
+    tokens = _WORD_TOKENIZER.tokenize(text)
     num_words = len(tokens)
     return num_words
 
@@ -1596,15 +1603,162 @@ def _get_sentence_tokenizer():
     return nltk.data.load("nltk:tokenizers/punkt/english.pickle")
 
 
+@functools.lru_cache(maxsize=None)
+def get_stopwords():
+    """Returns the English stopwords as a frozenset (loaded once)."""
+    return frozenset(nltk.corpus.stopwords.words('english'))
+
+
 def count_stopwords(text):
     """Counts the number of stopwords."""
-    """Counts the number of stopwords."""
-    stopwords = nltk.corpus.stopwords.words('english')
-    tokenizer = nltk.tokenize.RegexpTokenizer(r"\w+")
-    tokens = tokenizer.tokenize(text)
-    num_stopwords = len([t for t in tokens if t.lower() in stopwords])
+    stopwords = get_stopwords()
+    tokens = _WORD_TOKENIZER.tokenize(text)
+    num_stopwords = sum(1 for t in tokens if t.lower() in stopwords)
     return num_stopwords
 
+
+class ResponseAnalysis:
+    """Lazily computed, memoized tokenizations of one response.
+
+    One instance is built per response (and per loose-mode variant) and passed
+    to every checker of an example through `Instruction.check_analysis`, so a
+    response is tokenized, sentence-split and POS-tagged at most once no matter
+    how many instructions look at it. Sequences are tuples so checkers cannot
+    modify a shared value.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    @functools.cached_property
+    def words(self):
+        """`\\w+` tokens, as counted by `count_words`."""
+        return tuple(_WORD_TOKENIZER.tokenize(self.text))
+
+    @functools.cached_property
+    def word_count(self):
+        return len(self.words)
+
+    @functools.cached_property
+    def stopword_count(self):
+        stopwords = get_stopwords()
+        return sum(1 for t in self.words if t.lower() in stopwords)
+
+    @functools.cached_property
+    def sentences(self):
+        """Sentences, as returned by `split_into_sentences`."""
+        return tuple(split_into_sentences(self.text))
+
+    @functools.cached_property
+    def tokens(self):
+        """NLTK word tokens of the response."""
+        return tuple(nltk.word_tokenize(self.text))
+
+    @functools.cached_property
+    def lowercase_tokens(self):
+        """NLTK word tokens of the lowercased response, with '/' as a separator."""
+        return tuple(nltk.word_tokenize(self.text.replace('/', ' ').lower()))
+
+    @functools.cached_property
+    def pos_tags(self):
+        """NLTK POS tags of `tokens`."""
+        return tuple(nltk.pos_tag(list(self.tokens)))
+
+    @functools.cached_property
+    def plain_words(self):
+        """Lowercased whitespace-separated words with ASCII punctuation removed."""
+        return tuple(self.text.lower().translate(_PUNCTUATION_TABLE).split())
+
+    @functools.cached_property
+    def syllable_counts(self):
+        """Syllable count of each of `plain_words`."""
+        return tuple(syllapy.count(word) for word in self.plain_words)
+
+    @functools.cached_property
+    def paragraphs(self):
+        """Newline-separated paragraphs (unstripped, may be empty)."""
+        return tuple(self.text.split('\n'))
+
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class KeywordMatcher:
+    """Counts the occurrences of a set of keywords, compiled once.
+
+    Each count is the number of non-overlapping matches of that keyword alone,
+    as `re.findall` of the keyword (wrapped in `\\b` when `word_boundary`) would
+    give. The counting strategy is chosen when the matcher is built:
+
+    - Whole-word, case-sensitive keywords made only of word characters are
+      looked up in a single `\\w+` scan of the text: `\\bkeyword\\b` matches
+      exactly where a maximal run of word characters equals the keyword, so one
+      pass and one dictionary give every count.
+    - Plain substrings are counted with `str.count`.
+    - Anything else uses one precompiled pattern per keyword.
+
+    Use `get_keyword_matcher` to share one matcher per keyword tuple.
+    """
+
+    def __init__(self, keywords, word_boundary=False, ignore_case=False):
+        """Compiles the matcher.
+
+        Args:
+          keywords: A tuple of keyword strings, matched literally.
+          word_boundary: Whether keywords must match whole words (`\\b`).
+          ignore_case: Whether matching is case insensitive.
+        """
+        self.keywords = tuple(keywords)
+        self._keyword_set = frozenset(self.keywords)
+        if word_boundary and not ignore_case and all(
+                _WORD_PATTERN.fullmatch(keyword) for keyword in self.keywords):
+            self.strategy = "tokens"
+        elif not word_boundary and not ignore_case:
+            self.strategy = "substrings"
+        else:
+            self.strategy = "patterns"
+            flags = re.IGNORECASE if ignore_case else 0
+            boundary = r"\b" if word_boundary else ""
+            self._patterns = [
+                re.compile(f"{boundary}{re.escape(keyword)}{boundary}", flags)
+                for keyword in self.keywords
+            ]
+
+    def counts(self, text):
+        """Returns the number of matches of each keyword, in keyword order."""
+        if self.strategy == "tokens":
+            hits = collections.Counter(
+                token for token in _WORD_PATTERN.findall(text)
+                if token in self._keyword_set)
+            return [hits[keyword] for keyword in self.keywords]
+        if self.strategy == "substrings":
+            return [text.count(keyword) for keyword in self.keywords]
+        return [len(pattern.findall(text)) for pattern in self._patterns]
+
+    def found(self, text):
+        """Returns the keywords that occur in the text, in keyword order."""
+        if self.strategy == "tokens":
+            tokens = self._keyword_set.intersection(_WORD_PATTERN.findall(text))
+            return [keyword for keyword in self.keywords if keyword in tokens]
+        return [keyword for keyword, count in zip(self.keywords, self.counts(text))
+                if count]
+
+    def search(self, text):
+        """Whether any keyword occurs in the text."""
+        if self.strategy == "tokens":
+            return not self._keyword_set.isdisjoint(_WORD_PATTERN.findall(text))
+        if self.strategy == "substrings":
+            return any(keyword in text for keyword in self.keywords)
+        return any(pattern.search(text) for pattern in self._patterns)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_keyword_matcher(keywords, word_boundary=False, ignore_case=False):
+    """Returns the shared KeywordMatcher for a tuple of keywords."""
+    return KeywordMatcher(keywords, word_boundary=word_boundary,
+                          ignore_case=ignore_case)
+
+
 def generate_keywords(num_keywords):
     """Randomly generates a few keywords."""
     return random.sample(WORD_LIST, k=num_keywords)
@@ -25,7 +25,15 @@ import evaluation_lib
 
 
 _INPUT_DATA = flags.DEFINE_string(
-    "input_data", None, "path to input data", required=True
+    "input_data", None, "path to input data", required=False
+)
+
+_EVALUATION_PLAN = flags.DEFINE_string(
+    "evaluation_plan", None,
+    "Path to a compiled evaluation plan (pickle). Loaded if it exists, "
+    "otherwise compiled from --input_data and written there, so later runs "
+    "against other response files skip building the checkers.",
+    required=False,
 )
 
 _INPUT_RESPONSE_DATA = flags.DEFINE_string(
@@ -39,24 +47,46 @@ _OUTPUT_DIR = flags.DEFINE_string(
     required=True,
 )
 
+_WORKERS = flags.DEFINE_integer(
+    "workers", 1,
+    "Number of worker processes; strict and loose results are computed in "
+    "one pass per example.",
+)
+
+_CHUNKSIZE = flags.DEFINE_integer(
+    "chunksize", 16, "Number of examples sent to a worker process at a time."
+)
+
 
 def main(argv):
   if len(argv) > 1:
     raise app.UsageError("Too many command-line arguments.")
 
-  inputs = evaluation_lib.read_prompt_list(_INPUT_DATA.value)
+  if _EVALUATION_PLAN.value and os.path.exists(_EVALUATION_PLAN.value):
+    logging.info("Loading evaluation plan %s...", _EVALUATION_PLAN.value)
+    inputs = evaluation_lib.load_evaluation_plan(_EVALUATION_PLAN.value)
+  elif _INPUT_DATA.value:
+    inputs = evaluation_lib.compile_evaluation_plan(
+        evaluation_lib.read_prompt_list(_INPUT_DATA.value))
+    if _EVALUATION_PLAN.value:
+      evaluation_lib.save_evaluation_plan(inputs, _EVALUATION_PLAN.value)
+      logging.info("Saved evaluation plan: %s", _EVALUATION_PLAN.value)
+  else:
+    raise app.UsageError("Either --input_data or an existing --evaluation_plan is required.")
   prompt_to_response = evaluation_lib.read_prompt_to_response_dict(
       _INPUT_RESPONSE_DATA.value)
 
-  # get instruction following results
-  for func, output_file_name in [
-      (evaluation_lib.test_instruction_following_strict, "eval_results_strict"),
-      (evaluation_lib.test_instruction_following_loose, "eval_results_loose"),
+  # get instruction following results (strict and loose in one pass)
+  logging.info("Evaluating with %d worker(s)...", _WORKERS.value)
+  strict_outputs, loose_outputs = evaluation_lib.evaluate_strict_and_loose(
+      inputs, prompt_to_response, workers=_WORKERS.value,
+      chunksize=_CHUNKSIZE.value)
+
+  for outputs, output_file_name in [
+      (strict_outputs, "eval_results_strict"),
+      (loose_outputs, "eval_results_loose"),
   ]:
     logging.info("Generating %s...", output_file_name)
-    outputs = []
-    for inp in inputs:
-      outputs.append(func(inp, prompt_to_response))
     follow_all_instructions = [o.follow_all_instructions for o in outputs]
     accuracy = sum(follow_all_instructions) / len(outputs)
     logging.info("Accuracy: %f", accuracy)
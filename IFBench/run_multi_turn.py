@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Generate and score the multi-turn split of IFBench.
+
+Each example of IFBench_multi-turn is a two-turn conversation: the user
+prompt and a model response, then a user turn with the constraint. The
+conversation is sent to an OpenAI-compatible API, and the final assistant
+turn is scored against the example's instructions with the IFBench checkers.
+
+The parquet files are streamed in record batches with pyarrow, so neither
+generation nor scoring materializes the dataset (only the small
+instruction/kwargs columns are kept for scoring).
+"""
+
+import os
+import json
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Iterator
+
+import pyarrow.parquet as pq
+
+import evaluation_lib
+from config import get_settings
+from generate_responses import JsonlWriter, add_generation_arguments, generate_all, load_completed_keys
+
+
+EVAL_COLUMNS = ["key", "prompt", "instruction_id_list", "kwargs"]
+
+
+def list_parquet_files(input_path: str) -> list[str]:
+    """Return the parquet files at input_path (a file or a directory, searched recursively)."""
+    path = Path(input_path)
+    if path.is_file():
+        return [str(path)]
+    return sorted(str(p) for p in path.rglob("*.parquet"))
+
+
+def count_rows(files: list[str]) -> int:
+    """Number of rows in the parquet files, read from their footers."""
+    return sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+
+
+def iter_parquet_rows(files: list[str], columns: list[str], batch_size: int) -> Iterator[dict]:
+    """Stream the rows of the parquet files as dicts, one record batch at a time."""
+    for f in files:
+        parquet_file = pq.ParquetFile(f)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield from batch.to_pylist()
+
+
+def conversation_for_final_turn(messages: list[dict]) -> list[dict]:
+    """Return the conversation up to and including its last user turn."""
+    last_user = max(i for i, message in enumerate(messages) if message["role"] == "user")
+    return [{"role": m["role"], "content": m["content"]} for m in messages[:last_user + 1]]
+
+
+def iter_conversations(files: list[str], batch_size: int, skip_keys: set) -> Iterator[dict]:
+    """Stream the conversations to generate, skipping keys already completed."""
+    for row in iter_parquet_rows(files, ["key", "prompt", "messages"], batch_size):
+        if row["key"] in skip_keys:
+            continue
+        yield {
+            "key": row["key"],
+            "prompt": row["prompt"],
+            "messages": conversation_for_final_turn(row["messages"]),
+        }
+
+
+def iter_input_examples(files: list[str], batch_size: int) -> Iterator[evaluation_lib.InputExample]:
+    """Stream the examples to score (parquet nulls in kwargs are dropped when checkers are built)."""
+    for row in iter_parquet_rows(files, EVAL_COLUMNS, batch_size):
+        yield evaluation_lib.InputExample(
+            key=row["key"],
+            instruction_id_list=row["instruction_id_list"],
+            prompt=row["prompt"],
+            kwargs=row["kwargs"],
+        )
+
+
+def load_responses_by_key(output_file: str) -> dict:
+    """Map each key to its last response in the append-only output file."""
+    responses = {}
+    with open(output_file, "r") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                responses[record["key"]] = record["response"]
+    return responses
+
+
+def score(files: list[str], output_file: str, output_dir: str, batch_size: int, workers: int) -> None:
+    """Score the final turns in output_file; write strict and loose results to output_dir."""
+    responses = load_responses_by_key(output_file)
+    inputs = [
+        evaluation_lib.compile_example(inp)
+        for inp in iter_input_examples(files, batch_size)
+    ]
+    missing = sum(1 for inp in inputs if inp.key not in responses)
+    if missing:
+        print(f"Warning: {missing} examples have no response and are scored as not following")
+
+    strict_outputs, loose_outputs = evaluation_lib.evaluate_responses(
+        inputs, [responses.get(inp.key) for inp in inputs], workers=workers)
+
+    model_name = Path(output_file).name.replace("-responses.jsonl", "").replace(".jsonl", "")
+    os.makedirs(output_dir, exist_ok=True)
+    for outputs, name in [(strict_outputs, "eval_results_strict"), (loose_outputs, "eval_results_loose")]:
+        output_path = os.path.join(output_dir, f"{model_name}-{name}.jsonl")
+        evaluation_lib.write_outputs(output_path, outputs)
+        print("=" * 64)
+        print(f"{output_path} Accuracy Scores:")
+        evaluation_lib.print_report(outputs)
+
+
+def main():
+    # Load settings from .env first
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(
+        description="Generate and score the IFBench multi-turn split with an OpenAI-compatible API",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--input-path",
+        default=settings.multi_turn_input,
+        help="IFBench_multi-turn parquet file or directory",
+    )
+    parser.add_argument(
+        "--output-file",
+        help="Output file for final-turn responses (defaults to data/{model}-multi-turn-responses.jsonl)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="eval",
+        help="Output directory for eval results",
+    )
+    add_generation_arguments(parser, settings)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=256,
+        help="Parquet rows read per record batch",
+    )
+    parser.add_argument(
+        "--eval-workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for scoring",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from existing output file",
+    )
+    parser.add_argument(
+        "--skip-generation",
+        action="store_true",
+        help="Only score an existing output file",
+    )
+
+    args = parser.parse_args()
+
+    # Validate required settings
+    if not args.model:
+        parser.error("--model is required (or set MODEL in .env)")
+    if not args.skip_generation and not args.api_base:
+        parser.error("--api-base is required (or set API_BASE in .env)")
+
+    files = list_parquet_files(args.input_path)
+    if not files:
+        parser.error(f"No parquet files found at {args.input_path}")
+    total = count_rows(files)
+    print(f"Found {total} conversations in {len(files)} parquet file(s) at {args.input_path}")
+
+    if not args.output_file:
+        safe_model_name = args.model.replace("/", "-")
+        args.output_file = f"data/{safe_model_name}-multi-turn-responses.jsonl"
+
+    if not args.skip_generation:
+        print(f"Model: {args.model}")
+        print(f"API: {args.api_base}")
+
+        # Load completed keys if resuming; failed records are generated again
+        completed_keys = set()
+        resuming = args.resume and Path(args.output_file).exists()
+        if resuming:
+            completed_keys = load_completed_keys(args.output_file, [])
+            print(f"Resuming: {len(completed_keys)} conversations already completed")
+
+        writer = JsonlWriter(args.output_file, append=resuming)
+        try:
+            errors = asyncio.run(generate_all(
+                iter_conversations(files, args.batch_size, completed_keys),
+                args,
+                writer,
+                total=max(total - len(completed_keys), 0),
+            ))
+        finally:
+            writer.close()
+
+        print(f"\nSaved responses to {args.output_file}")
+        if errors:
+            print(f"Errors: {len(errors)} (rerun with --resume to retry them)")
+            for e in errors[:5]:
+                print(f"  - Key {e['key']}: {e['error']}")
+
+    score(files, args.output_file, args.output_dir, args.batch_size, args.eval_workers)
+
+
+if __name__ == "__main__":
+    main()
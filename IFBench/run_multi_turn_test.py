@@ -0,0 +1,114 @@
+# coding=utf-8
+# Copyright 2025 Allen Institute for AI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for run_multi_turn.py."""
+
+import json
+import os
+import tempfile
+
+from absl.testing import absltest
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import run_multi_turn
+
+
+PROMPT = "Write about the sea."
+
+
+def _conversation(key):
+    return [
+        {"role": "user", "content": PROMPT},
+        {"role": "assistant", "content": f"The sea, take {key}."},
+        {"role": "user", "content": "Now use between 2 and 4 words."},
+    ]
+
+
+def _rows(keys):
+    # Every row shares the prompt, as in the multi-turn split.
+    return [
+        {
+            "key": key,
+            "prompt": PROMPT,
+            "messages": _conversation(key),
+            "instruction_id_list": ["count:word_count_range"],
+            "kwargs": [{"min_words": 2, "max_words": 4, "N": None}],
+        }
+        for key in keys
+    ]
+
+
+def _write_parquet(path, keys, row_group_size=2):
+    pq.write_table(pa.Table.from_pylist(_rows(keys)), path, row_group_size=row_group_size)
+
+
+class RunMultiTurnTest(absltest.TestCase):
+
+    def test_streams_record_batches(self):
+        """Test that rows are streamed across files and batches, in order."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _write_parquet(os.path.join(tmp_dir, "a.parquet"), [0, 1, 2, 3, 4])
+            os.makedirs(os.path.join(tmp_dir, "sub"))
+            _write_parquet(os.path.join(tmp_dir, "sub", "b.parquet"), [5, 6])
+            files = run_multi_turn.list_parquet_files(tmp_dir)
+
+            self.assertLen(files, 2)
+            self.assertEqual(run_multi_turn.count_rows(files), 7)
+            rows = list(run_multi_turn.iter_parquet_rows(files, ["key"], batch_size=2))
+            self.assertEqual(rows, [{"key": k} for k in range(7)])
+
+            conversations = list(run_multi_turn.iter_conversations(files, 3, skip_keys={1, 5}))
+            self.assertEqual([c["key"] for c in conversations], [0, 2, 3, 4, 6])
+            self.assertEqual(conversations[0]["messages"], _conversation(0))
+
+            examples = list(run_multi_turn.iter_input_examples(files, 3))
+            self.assertEqual(examples[0].kwargs, [{"min_words": 2, "max_words": 4, "N": None}])
+
+    def test_conversation_for_final_turn(self):
+        """Test that turns after the last user turn and extra fields are dropped."""
+        messages = _conversation(0) + [{"role": "assistant", "content": "stale", "extra": 1}]
+        messages[0]["extra"] = 2
+        self.assertEqual(run_multi_turn.conversation_for_final_turn(messages), _conversation(0))
+
+    def test_score_aligns_responses_by_key(self):
+        """Test that responses are matched by key, not by prompt or file order."""
+        records = [
+            {"key": 11, "prompt": PROMPT, "response": "one"},
+            {"key": 10, "prompt": PROMPT, "response": "the calm sea"},
+            {"key": 11, "prompt": PROMPT, "response": "waves and wind"},
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            parquet_path = os.path.join(tmp_dir, "test.parquet")
+            _write_parquet(parquet_path, [10, 11, 12])
+            output_file = os.path.join(tmp_dir, "m-responses.jsonl")
+            with open(output_file, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+
+            output_dir = os.path.join(tmp_dir, "eval")
+            run_multi_turn.score([parquet_path], output_file, output_dir, batch_size=2, workers=1)
+
+            with open(os.path.join(output_dir, "m-eval_results_strict.jsonl")) as f:
+                outputs = [json.loads(line) for line in f]
+        # Key 11 keeps its last response; key 12 has none.
+        self.assertEqual([o["response"] for o in outputs[:2]], ["the calm sea", "waves and wind"])
+        self.assertEqual([o["follow_all_instructions"] for o in outputs], [True, True, False])
+
+
+if __name__ == "__main__":
+    absltest.main()